@@ -0,0 +1 @@
+"""Micro-benchmarks for devfaq, run with ``python -m benchmarks.<name>``."""
@@ -0,0 +1,245 @@
+"""
+Benchmark requests per second under WSGI and ASGI.
+
+Drives Django's own WSGIHandler from a thread pool, the way a threaded WSGI
+server runs it, and ASGIHandler from one event loop with the same number of
+requests in flight. Both serve the same mix of routes as a validated,
+logged in user from a throwaway file backed test database: the index page,
+the create site form and a rejected email validation token.
+
+Run with ``python -m benchmarks.asgi_wsgi [requests] [concurrency]``.
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "devfaq.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from website.models import Validation  # noqa: E402
+from website.routers import mirror_primary  # noqa: E402
+
+REQUESTS = 3_000
+CONCURRENCY = 64
+HOST = settings.ALLOWED_HOSTS[0].lstrip(".")
+ROUTES = [
+    ("/", ""),
+    ("/create_site", ""),
+    ("/validate", "token=not-a-token"),
+]
+
+
+def fill() -> str:
+    """
+    Create a validated user and log them in.
+
+    Returns:
+        Cookie header for the user's session
+    """
+    user = User.objects.create_user("benchmark", "benchmark@dev-faq.com", "password")
+    Validation.objects.create(user=user, is_validated=True)
+    client = Client()
+    client.force_login(user)
+    return "; ".join(
+        f"{morsel.key}={morsel.coded_value}" for morsel in client.cookies.values()
+    )
+
+
+def wsgi_request(handler: WSGIHandler, cookie: str, number: int) -> float:
+    """
+    Make one request through the WSGI handler.
+
+    Args:
+        handler: WSGI application
+        cookie: Cookie header to send
+        number: Request number, selecting the route
+
+    Returns:
+        Seconds the request took
+    """
+    path, query_string = ROUTES[number % len(ROUTES)]
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "SCRIPT_NAME": "",
+        "PATH_INFO": path,
+        "QUERY_STRING": query_string,
+        "SERVER_NAME": HOST,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": "127.0.0.1",
+        "HTTP_HOST": HOST,
+        "HTTP_COOKIE": cookie,
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+
+    def start_response(status: str, headers: list, exc_info=None):
+        if int(status.split()[0]) >= 400:
+            raise RuntimeError(f"{path} failed with {status}")
+
+    start = time.perf_counter()
+    response = handler(environ, start_response)
+    try:
+        for _chunk in response:
+            pass
+    finally:
+        response.close()
+    return time.perf_counter() - start
+
+
+async def asgi_request(handler: ASGIHandler, cookie: str, number: int) -> float:
+    """
+    Make one request through the ASGI handler.
+
+    Args:
+        handler: ASGI application
+        cookie: Cookie header to send
+        number: Request number, selecting the route
+
+    Returns:
+        Seconds the request took
+    """
+    path, query_string = ROUTES[number % len(ROUTES)]
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "query_string": query_string.encode(),
+        "headers": [(b"host", HOST.encode()), (b"cookie", cookie.encode())],
+        "server": (HOST, 80),
+        "client": ("127.0.0.1", 0),
+    }
+    body_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive() -> dict:
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict):
+        if message["type"] == "http.response.start" and message["status"] >= 400:
+            raise RuntimeError(f"{path} failed with {message['status']}")
+
+    start = time.perf_counter()
+    await handler(scope, receive, send)
+    return time.perf_counter() - start
+
+
+def run_wsgi(cookie: str, requests: int, concurrency: int) -> list[float]:
+    """
+    Make requests through WSGIHandler from a pool of threads.
+
+    Args:
+        cookie: Cookie header to send
+        requests: Number of requests to make
+        concurrency: Number of threads
+
+    Returns:
+        Seconds each request took
+    """
+    handler = WSGIHandler()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(
+            executor.map(
+                lambda number: wsgi_request(handler, cookie, number), range(requests)
+            )
+        )
+
+
+def run_asgi(cookie: str, requests: int, concurrency: int) -> list[float]:
+    """
+    Make requests through ASGIHandler from one event loop.
+
+    Args:
+        cookie: Cookie header to send
+        requests: Number of requests to make
+        concurrency: Number of requests in flight
+
+    Returns:
+        Seconds each request took
+    """
+    handler = ASGIHandler()
+
+    async def main() -> list[float]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(number: int) -> float:
+            async with semaphore:
+                return await asgi_request(handler, cookie, number)
+
+        return await asyncio.gather(*(bounded(number) for number in range(requests)))
+
+    return asyncio.run(main())
+
+
+def report(name: str, run: Callable, cookie: str, requests: int, concurrency: int):
+    """
+    Time a run and print its throughput and latency.
+
+    Args:
+        name: Name of the server interface
+        run: Function making the requests
+        cookie: Cookie header to send
+        requests: Number of requests to make
+        concurrency: Number of requests in flight
+    """
+    run(cookie, len(ROUTES) * 10, concurrency)
+    start = time.perf_counter()
+    latencies = sorted(run(cookie, requests, concurrency))
+    elapsed = time.perf_counter() - start
+    p50 = statistics.median(latencies) * 1e3
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1e3
+    print(
+        f"{name}: {requests / elapsed:8.1f} req/s, "
+        f"p50 {p50:7.2f} ms, p99 {p99:7.2f} ms"
+    )
+
+
+def run():
+    """Run the benchmark under both interfaces."""
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else REQUESTS
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else CONCURRENCY
+    with tempfile.TemporaryDirectory() as directory:
+        # Threads need a database file they can all open
+        connection.settings_dict["TEST"]["NAME"] = os.path.join(directory, "db")
+        old_name = connection.creation.create_test_db(verbosity=0)
+        mirror_primary()
+        try:
+            cookie = fill()
+            print(f"{requests} requests, {concurrency} in flight")
+            report("WSGI", run_wsgi, cookie, requests, concurrency)
+            report("ASGI", run_asgi, cookie, requests, concurrency)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    run()
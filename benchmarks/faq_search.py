@@ -0,0 +1,94 @@
+"""
+Benchmark per-site FAQ search.
+
+Fills a throwaway test database with two sites holding 100,000 entries each,
+built from a fixed vocabulary, and times search_faq for common, rare and
+multi-term queries against one of them.
+
+Run with ``python -m benchmarks.faq_search [entries]``.
+"""
+
+import os
+import random
+import sys
+import timeit
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "devfaq.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from website.models import FAQEntry, Site  # noqa: E402
+from website.search import search_faq  # noqa: E402
+
+ENTRIES = 100_000
+BATCH_SIZE = 5_000
+ITERATIONS = 50
+VOCABULARY = [f"word{number}" for number in range(20_000)]
+QUERIES = ["word1", "word2 word3", "word300", "word19999"]
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    """
+    Build a sentence skewed towards the start of the vocabulary.
+
+    Args:
+        rng: Random number generator
+        words: Number of words in the sentence
+
+    Returns:
+        The sentence
+    """
+    return " ".join(
+        VOCABULARY[int(rng.paretovariate(1.2)) % len(VOCABULARY)] for _ in range(words)
+    )
+
+
+def fill(entries: int) -> Site:
+    """
+    Create two sites full of entries.
+
+    Args:
+        entries: Number of entries per site
+
+    Returns:
+        The site to search
+    """
+    rng = random.Random(0)
+    sites = [
+        Site.objects.create(subdomain=subdomain, description="")
+        for subdomain in ("python", "rust")
+    ]
+    for site in sites:
+        for start in range(0, entries, BATCH_SIZE):
+            FAQEntry.objects.bulk_create(
+                FAQEntry(
+                    site=site,
+                    question=sentence(rng, 10),
+                    answer=sentence(rng, 60),
+                    ordering=number,
+                )
+                for number in range(start, min(start + BATCH_SIZE, entries))
+            )
+    return sites[0]
+
+
+def run():
+    """Run the benchmark and print the cost per search."""
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else ENTRIES
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        site = fill(entries)
+        for query in QUERIES:
+            seconds = timeit.timeit(
+                lambda query=query: search_faq(site.id, query), number=ITERATIONS
+            )
+            print(f"{query!r:>20}: {seconds / ITERATIONS * 1e3:8.3f} ms per search")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    run()
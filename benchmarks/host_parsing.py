@@ -0,0 +1,97 @@
+"""
+Benchmark Host header parsing.
+
+Compares the original per-call parser (rebuilding the allowed host list and
+splitting the host on every call) against the cached HostParser used by
+TenantMiddleware.
+
+Run with ``python -m benchmarks.host_parsing``.
+"""
+
+import os
+import timeit
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "devfaq.settings")
+django.setup()
+
+from website.helpers import HostParser  # noqa: E402
+
+ALLOWED_HOSTS = [".dev-faq.com", "localhost"]
+HOSTS = [
+    "python.dev-faq.com",
+    "php.dev-faq.com:8080",
+    "dev-faq.com",
+    "localhost:8000",
+    "rust.dev-faq.com",
+]
+ITERATIONS = 200_000
+
+
+def legacy_get_host_details(scheme: str, hostname: str) -> dict:
+    """
+    Parse the host the way get_host_details did before HostParser.
+
+    Args:
+        scheme: Request scheme
+        hostname: Raw host value
+
+    Returns:
+        Dictionary of the parsed host parts
+    """
+    host_details = {"scheme": scheme, "subdomain": "", "port": 443}
+    allowed_hosts = []
+    for allow_host in ALLOWED_HOSTS:
+        if allow_host.startswith("."):
+            allowed_hosts.append(allow_host[1:])
+            continue
+        allowed_hosts.append(allow_host)
+
+    hostname_split = hostname.split(":")
+    hostname_no_port = hostname_split[0]
+    if len(hostname_split) > 1:
+        host_details["port"] = int(hostname_split[1])
+    elif scheme == "http":
+        host_details["port"] = 80
+
+    subdomain = hostname_no_port.split(".")[0]
+    hostname_without_subdomain = hostname_no_port[len(subdomain) + 1 :]
+    if (
+        hostname_no_port in allowed_hosts
+        or hostname_without_subdomain not in allowed_hosts
+    ):
+        host_details["hostname"] = hostname_no_port
+    else:
+        host_details["hostname"] = hostname_without_subdomain
+        host_details["subdomain"] = subdomain
+    subdomain = f"{host_details['subdomain']}." if host_details["subdomain"] else ""
+    port = ""
+    if (scheme != "https" or host_details["port"] != 443) and (
+        scheme != "http" or host_details["port"] != 80
+    ):
+        port = f":{host_details['port']}"
+    host_details["full_url"] = f"{scheme}://{subdomain}{host_details['hostname']}{port}"
+    return host_details
+
+
+def run():
+    """Run the benchmark and print the cost per parse."""
+    parser = HostParser(ALLOWED_HOSTS)
+
+    def legacy():
+        for host in HOSTS:
+            legacy_get_host_details("https", host)
+
+    def cached():
+        for host in HOSTS:
+            parser.parse("https", host)
+
+    calls = ITERATIONS * len(HOSTS)
+    for name, func in (("legacy", legacy), ("cached", cached)):
+        seconds = timeit.timeit(func, number=ITERATIONS)
+        print(f"{name:>8}: {seconds / calls * 1e9:8.1f} ns per parse")
+
+
+if __name__ == "__main__":
+    run()
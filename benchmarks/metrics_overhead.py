@@ -0,0 +1,79 @@
+"""
+Benchmark the overhead of the request metrics.
+
+Times the email validation view, one query and one template per request,
+through the test client with and without MetricsMiddleware, and the cost of
+recording one request in the histograms on its own.
+
+Run with ``python -m benchmarks.metrics_overhead``.
+"""
+
+import os
+import timeit
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "devfaq.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+
+from website.metrics import RequestMetrics, RequestStats  # noqa: E402
+
+REQUESTS = 2_000
+OBSERVATIONS = 100_000
+
+
+def time_requests(middleware: list[str]) -> float:
+    """
+    Time requests through a middleware chain.
+
+    Args:
+        middleware: MIDDLEWARE setting to use
+
+    Returns:
+        Seconds per request
+    """
+    with override_settings(MIDDLEWARE=middleware, ALLOWED_HOSTS=["testserver"]):
+        client = Client()
+        client.get("/validate", {"token": "warm-up"})
+        return (
+            timeit.timeit(
+                lambda: client.get("/validate", {"token": "not-a-token"}),
+                number=REQUESTS,
+            )
+            / REQUESTS
+        )
+
+
+def run():
+    """Run the benchmark and print the overhead per request."""
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        without = [
+            name
+            for name in settings.MIDDLEWARE
+            if name != "website.middleware.MetricsMiddleware"
+        ]
+        plain = time_requests(without)
+        measured = time_requests(settings.MIDDLEWARE)
+        print(f"without metrics: {plain * 1e6:8.1f} us per request")
+        print(f"with metrics:    {measured * 1e6:8.1f} us per request")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    request_metrics = RequestMetrics(tenant_labels=True)
+    stats = RequestStats(queries=3, query_seconds=0.002, template_seconds=0.001)
+    labels = request_metrics.labels("index", "python")
+    seconds = timeit.timeit(
+        lambda: request_metrics.observe(labels, 0.01, stats, 4096), number=OBSERVATIONS
+    )
+    print(f"recording:       {seconds / OBSERVATIONS * 1e6:8.1f} us per request")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,111 @@
+"""
+Benchmark email validation token lookups.
+
+Fills a throwaway test database with users and validations, then compares the
+original lookup (a join on an unindexed plaintext token column) against the
+single UPDATE on the token_digest index used by email_validation.
+
+Run with ``python -m benchmarks.validation_lookup [rows]``, 1,000,000 rows by
+default.
+"""
+
+import os
+import sys
+import timeit
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "devfaq.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from website.models import Validation  # noqa: E402
+
+ROWS = 1_000_000
+BATCH_SIZE = 50_000
+LOOKUPS = 20
+
+
+def legacy_token(number: int) -> str:
+    """
+    Build the plaintext token stored for a row in the legacy table.
+
+    Args:
+        number: Row number
+
+    Returns:
+        Token for the row
+    """
+    return f"{number:064d}"
+
+
+def fill(rows: int):
+    """
+    Insert users, validations and a copy of the legacy validation table.
+
+    Args:
+        rows: Number of users to create
+    """
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TABLE legacy_validation ("
+            "id integer PRIMARY KEY, user_id integer NOT NULL UNIQUE, "
+            "is_validated bool NOT NULL, random_validation_string varchar(64))"
+        )
+        for start in range(1, rows + 1, BATCH_SIZE):
+            numbers = range(start, min(start + BATCH_SIZE, rows + 1))
+            cursor.executemany(
+                "INSERT INTO auth_user (id, password, is_superuser, username, "
+                "first_name, last_name, email, is_staff, is_active, date_joined) "
+                "VALUES (%s, '', false, %s, '', '', %s, false, true, %s)",
+                [(n, f"user{n}", f"user{n}@example.com", now) for n in numbers],
+            )
+            cursor.executemany(
+                "INSERT INTO website_validation (id, user_id, is_validated, "
+                "token_digest, token_created) VALUES (%s, %s, false, %s, %s)",
+                [(n, n, Validation.hash_token(legacy_token(n)), now) for n in numbers],
+            )
+            cursor.executemany(
+                "INSERT INTO legacy_validation "
+                "(id, user_id, is_validated, random_validation_string) "
+                "VALUES (%s, %s, false, %s)",
+                [(n, n, legacy_token(n)) for n in numbers],
+            )
+
+
+def run():
+    """Run the benchmark and print the cost per lookup."""
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        fill(rows)
+        numbers = [rows - step * rows // LOOKUPS for step in range(LOOKUPS)]
+
+        def legacy():
+            with connection.cursor() as cursor:
+                for number in numbers:
+                    cursor.execute(
+                        "SELECT auth_user.id FROM auth_user INNER JOIN "
+                        "legacy_validation ON "
+                        "legacy_validation.user_id = auth_user.id "
+                        "WHERE legacy_validation.random_validation_string = %s",
+                        [legacy_token(number)],
+                    )
+                    cursor.fetchone()
+
+        def digest():
+            for number in numbers:
+                Validation.validate_token(legacy_token(number))
+
+        for name, func in (("legacy", legacy), ("digest", digest)):
+            seconds = timeit.timeit(func, number=1)
+            print(f"{name:>8}: {seconds / LOOKUPS * 1e3:8.3f} ms per lookup")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    run()
@@ -68,21 +68,25 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "website.middleware.MetricsMiddleware",
+    "website.middleware.ReplicaMiddleware",
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "website.middleware.TenantMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "website.middleware.PageCacheMiddleware",
 ]
 
 ROOT_URLCONF = "devfaq.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "website.metrics.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -121,6 +125,88 @@ if db_host := os.getenv("DJANGO_DATABASE_HOST", ""):
         },
     }
 
+# Read replicas, see website.routers. Views marked with read_from_replica read
+# from one of DATABASE_REPLICAS unless the visitor wrote within the last
+# REPLICA_STICKY_SECONDS. A replica failing its health check, or lagging more
+# than REPLICA_MAX_LAG_SECONDS, is left out for REPLICA_RETRY_SECONDS.
+# Without replica hosts the SQLite database gets DJANGO_SQLITE_REPLICAS extra
+# connections to the same file standing in for replicas.
+if replica_hosts := os.getenv("DJANGO_DATABASE_REPLICA_HOSTS", ""):
+    replica_settings = [
+        {**DATABASES["default"], "HOST": replica_host.strip()}
+        for replica_host in replica_hosts.split(",")
+    ]
+elif DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    replica_settings = [
+        dict(DATABASES["default"])
+        for _ in range(int(os.getenv("DJANGO_SQLITE_REPLICAS", "2")))
+    ]
+else:
+    replica_settings = []
+
+DATABASE_REPLICAS: list[str] = []
+for number, replica in enumerate(replica_settings):
+    DATABASES[f"replica_{number}"] = {**replica, "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(f"replica_{number}")
+
+# Tenant shards, see website.routers.ShardRouter. Site.shard names the shard
+# holding a site's tenant rows, User, Site and the other global tables stay
+# in the default database, which is also the first shard. Without shard hosts
+# DJANGO_SQLITE_SHARDS extra SQLite files stand in for shards. Tenants are
+# moved between shards with the move_tenant command.
+if shard_hosts := os.getenv("DJANGO_DATABASE_SHARD_HOSTS", ""):
+    shard_settings = [
+        {**DATABASES["default"], "HOST": shard_host.strip()}
+        for shard_host in shard_hosts.split(",")
+    ]
+elif DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    shard_settings = [
+        {**DATABASES["default"], "NAME": BASE_DIR / f"db_shard_{number}.sqlite3"}
+        for number in range(1, int(os.getenv("DJANGO_SQLITE_SHARDS", "1")) + 1)
+    ]
+else:
+    shard_settings = []
+
+DATABASE_SHARDS: list[str] = ["default"]
+for number, shard in enumerate(shard_settings, start=1):
+    DATABASES[f"shard_{number}"] = shard
+    DATABASE_SHARDS.append(f"shard_{number}")
+
+DATABASE_ROUTERS = ["website.routers.ShardRouter", "website.routers.ReplicaRouter"]
+REPLICA_STICKY_SECONDS = int(os.getenv("DJANGO_REPLICA_STICKY_SECONDS", "10"))
+REPLICA_CHECK_SECONDS = 5
+REPLICA_RETRY_SECONDS = 30
+REPLICA_MAX_LAG_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# The site registry keeps its version counters here, so every worker must share
+# the same backend in production.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+if cache_location := os.getenv("DJANGO_CACHE_LOCATION", ""):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": cache_location,
+        }
+    }
+
+# Sessions, see website.sessions. Sessions are read through the cache and the
+# expiry slides with every request, but the database is only written when the
+# data changes or the stored expiry lags more than SESSION_REFRESH_SECONDS, or
+# half the session's age, behind. Expired sessions are deleted by the
+# purge_sessions command.
+SESSION_ENGINE = "website.sessions"
+SESSION_SAVE_EVERY_REQUEST = True
+SESSION_REFRESH_SECONDS = int(os.getenv("DJANGO_SESSION_REFRESH_SECONDS", "86400"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -140,6 +226,10 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+AUTHENTICATION_BACKENDS = [
+    "website.backends.SiteMembershipBackend",
+]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
@@ -157,6 +247,55 @@ STATIC_URL = "/static/"
 
 STATICFILES_DIRS = (os.path.join(BASE_DIR, "static"),)
 
+STATIC_ROOT = os.getenv("DJANGO_STATIC_ROOT", BASE_DIR / "staticfiles")
+
+# User uploads, kept out of the static tree and served by website.views
+MEDIA_URL = "/media/"
+
+MEDIA_ROOT = os.getenv("DJANGO_MEDIA_ROOT", BASE_DIR / "media")
+
+# collectstatic writes hashed, minified and gzipped assets, see website.storage
+STORAGES = {
+    "default": {
+        "BACKEND": "website.storage.ShardedFileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "website.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
+# Uploads over MAX_UPLOAD_SIZE are aborted while streaming and anything over
+# FILE_UPLOAD_MAX_MEMORY_SIZE is spooled to disk, keeping memory per upload flat
+FILE_UPLOAD_HANDLERS = [
+    "website.uploadhandlers.SizeLimitUploadHandler",
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "django.core.files.uploadhandler.TemporaryFileUploadHandler",
+]
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+
+# Generated logo variants, see website.logos
+LOGO_DERIVATIVE_ROOT = os.getenv(
+    "DJANGO_LOGO_DERIVATIVE_ROOT",
+    BASE_DIR / "logo_derivatives",
+)
+
+# Hand file bodies to the web server, see website.sendfile. "x-sendfile" for
+# Apache/lighttpd, "x-accel-redirect" for nginx, empty to stream from Django
+SENDFILE_BACKEND = os.getenv("DJANGO_SENDFILE_BACKEND", "")
+
+# Internal nginx locations aliasing the directories served by X-Accel-Redirect
+SENDFILE_ACCEL_LOCATIONS = {
+    str(MEDIA_ROOT): "/internal/media/",
+    str(LOGO_DERIVATIVE_ROOT): "/internal/logos/",
+}
+
+# Request metrics served at /metrics, see website.metrics. Tenant labels give
+# one series per subdomain, only enable them while the site count is small.
+# Scrapers must send "Authorization: Bearer <token>" with METRICS_TOKEN, without
+# it the endpoint answers 404 unless DEBUG is on
+METRICS_TENANT_LABELS = bool(os.getenv("DJANGO_METRICS_TENANT_LABELS", ""))
+METRICS_TOKEN = os.getenv("DJANGO_METRICS_TOKEN", "")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -1,9 +1,19 @@
 document.body.addEventListener('htmx:beforeRequest', function(evt) {
+    if (evt.detail.elt.tagName !== 'FORM') {
+        return;
+    }
     let form_submit = document.querySelector('#submit_form');
-    form_submit.disabled = true;
+    if (form_submit) {
+        form_submit.disabled = true;
+    }
 });
 
 document.body.addEventListener('htmx:beforeSwap', function(evt) {
+    const content_type = evt.detail.xhr.getResponseHeader('Content-Type') || '';
+    if (!content_type.startsWith('application/json')) {
+        // HTML fragments are swapped in by htmx as normal
+        return;
+    }
     evt.detail.shouldSwap = false;
     reset_form();
     const response = JSON.parse(evt.detail.xhr.response);
@@ -30,5 +40,7 @@ function reset_form(){
         errors[0].classList.remove('input_error');
     }
     let form_submit = document.querySelector('#submit_form');
-    form_submit.disabled = false;
+    if (form_submit) {
+        form_submit.disabled = false;
+    }
 }
@@ -8,3 +8,7 @@ class WebsiteConfig(AppConfig):
 
     default_auto_field = "django.db.models.BigAutoField"
     name = "website"
+
+    def ready(self):
+        """Connect the signal receivers."""
+        from website import signals  # noqa: F401
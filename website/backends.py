@@ -0,0 +1,369 @@
+"""Authentication backends for the website."""
+
+from functools import partial
+
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from website.models import SiteMembership, Validation
+
+ROLES = frozenset(role for role, _ in SiteMembership.ROLE_CHOICES)
+# The password hash is never cached, only the session hash derived from it
+USER_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields if field.attname != "password"
+)
+# Columns of the user's validation and memberships joined onto the user row
+JOINED_FIELDS = (
+    "validation__id",
+    "validation__is_validated",
+    "site_memberships__site__subdomain",
+    "site_memberships__role",
+)
+
+
+class UserContextCache:
+    """
+    Shared cache of what a request needs to know about its user.
+
+    The user row, its validation and its site roles are loaded in one query
+    joining the memberships onto the user, and cached under the user id
+    the session holds. Like SiteRegistry every user has a version counter,
+    bumped by invalidate, and entries are only trusted while their version
+    matches, so a load racing a change is never served after it.
+
+    The password hash is left out of the entries. They carry the session
+    auth hash instead, which is all that login sessions are checked against.
+    """
+
+    def __init__(
+        self,
+        cache_alias: str = "default",
+        key_prefix: str = "user-context-v2",
+        timeout: int = 300,
+    ):
+        """
+        Initialise UserContextCache.
+
+        Args:
+            cache_alias: Cache holding the entries and version counters
+            key_prefix: Prefix for the cache keys
+            timeout: Seconds an entry is kept for
+        """
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        """Cache backend holding the entries."""
+        return caches[self.cache_alias]
+
+    def keys(self, user_id: int) -> tuple[str, str]:
+        """
+        Calculate the cache keys for a user.
+
+        Args:
+            user_id: User the keys are for
+
+        Returns:
+            Key of the version counter and key of the entry
+        """
+        return f"{self.key_prefix}#version:{user_id}", f"{self.key_prefix}:{user_id}"
+
+    def query(self, user_id: int):
+        """
+        Build the query loading a user's context.
+
+        Returns one row per membership, or a single row for a user without
+        memberships, with the user's columns repeated on every row.
+
+        Args:
+            user_id: User to load
+
+        Returns:
+            QuerySet of value tuples
+        """
+        return User.objects.filter(pk=user_id).values_list(
+            *USER_FIELDS, "password", *JOINED_FIELDS
+        )
+
+    def context(self, rows: list[tuple]) -> dict | None:
+        """
+        Turn the rows of a user's context into a cacheable dictionary.
+
+        Args:
+            rows: Rows returned by query
+
+        Returns:
+            Dictionary of the user's values, session auth hash, validation and
+            roles, None if there is no such user
+        """
+        if not rows:
+            return None
+        count = len(USER_FIELDS)
+        password, validation_id, is_validated = rows[0][count : count + 3]
+        roles: dict[str, set[str]] = {}
+        for subdomain, role in (row[count + 3 :] for row in rows):
+            if subdomain is not None:
+                roles.setdefault(subdomain, set()).add(role)
+        return {
+            "user": rows[0][:count],
+            "session_auth_hash": User(password=password).get_session_auth_hash(),
+            "validation": (
+                None if validation_id is None else (validation_id, is_validated)
+            ),
+            "roles": {subdomain: sorted(names) for subdomain, names in roles.items()},
+        }
+
+    def build(self, context: dict | None) -> User | None:
+        """
+        Build a user from a cached context.
+
+        The validation and the roles are attached to the user so that
+        user.validation and site role checks make no further queries. The
+        password is deferred and the session is checked against the cached
+        session auth hash until a new password is set.
+
+        Args:
+            context: Dictionary made by context
+
+        Returns:
+            The user, None if there is no such user
+        """
+        if context is None:
+            return None
+        user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, context["user"])
+        user.get_session_auth_hash = partial(
+            cached_session_auth_hash, user, context["session_auth_hash"]
+        )
+        validation = None
+        if context["validation"] is not None:
+            validation_id, is_validated = context["validation"]
+            validation = Validation.from_db(
+                DEFAULT_DB_ALIAS,
+                ("id", "user_id", "is_validated"),
+                (validation_id, user.pk, is_validated),
+            )
+        User.validation.related.set_cached_value(user, validation)
+        user.__dict__["_site_roles"] = {
+            subdomain: frozenset(names) for subdomain, names in context["roles"].items()
+        }
+        return user
+
+    def get(self, user_id: int) -> User | None:
+        """
+        Get a user with its validation and roles.
+
+        Args:
+            user_id: User to get
+
+        Returns:
+            The user, None if there is no such user
+        """
+        version_key, entry_key = self.keys(user_id)
+        found = self.cache.get_many([version_key, entry_key])
+        version = found.get(version_key, 0)
+        entry = found.get(entry_key)
+        if entry is None or entry[0] != version:
+            entry = (version, self.context(list(self.query(user_id))))
+            self.cache.set(entry_key, entry, self.timeout)
+        return self.build(entry[1])
+
+    async def aget(self, user_id: int) -> User | None:
+        """
+        Get a user with its validation and roles from async code.
+
+        Args:
+            user_id: User to get
+
+        Returns:
+            The user, None if there is no such user
+        """
+        version_key, entry_key = self.keys(user_id)
+        found = await self.cache.aget_many([version_key, entry_key])
+        version = found.get(version_key, 0)
+        entry = found.get(entry_key)
+        if entry is None or entry[0] != version:
+            rows = [row async for row in self.query(user_id)]
+            entry = (version, self.context(rows))
+            await self.cache.aset(entry_key, entry, self.timeout)
+        return self.build(entry[1])
+
+    def invalidate(self, user_id: int):
+        """
+        Make every cached context of a user stale.
+
+        Args:
+            user_id: User whose rows changed
+        """
+        version_key, _ = self.keys(user_id)
+        try:
+            self.cache.incr(version_key)
+        except ValueError:
+            self.cache.set(version_key, 1, timeout=None)
+
+    def invalidate_on_commit(self, user_id: int):
+        """
+        Make a user's cached contexts stale once the current transaction commits.
+
+        Args:
+            user_id: User whose rows changed
+        """
+        transaction.on_commit(partial(self.invalidate, user_id))
+
+
+user_contexts = UserContextCache()
+
+
+def cached_session_auth_hash(user, session_auth_hash: str) -> str:
+    """
+    Get the session auth hash of a user built from the user context cache.
+
+    Args:
+        user: User built by UserContextCache
+        session_auth_hash: Hash stored in the cached context
+
+    Returns:
+        The cached hash while the password is deferred, else the hash of the
+        password the user now has
+    """
+    if "password" in user.get_deferred_fields():
+        return session_auth_hash
+    return User.get_session_auth_hash(user)
+
+
+def get_site_roles(user, subdomain: str) -> frozenset[str]:
+    """
+    Get the roles a user has on a site.
+
+    Users loaded by SiteMembershipBackend carry every role they have. For
+    other users the answer comes from one lookup on the SiteMembership unique
+    index and is memoized on the user object.
+
+    Args:
+        user: User to check
+        subdomain: Subdomain of the site
+
+    Returns:
+        Set of roles, empty if the user is not a member of the site
+    """
+    if not user.is_authenticated or not user.is_active:
+        return frozenset()
+    site_roles = user.__dict__.get("_site_roles")
+    if site_roles is not None:
+        return site_roles.get(subdomain, frozenset())
+    role_cache: dict[str, frozenset[str]] = user.__dict__.setdefault(
+        "_site_role_cache", {}
+    )
+    if subdomain not in role_cache:
+        role_cache[subdomain] = frozenset(
+            SiteMembership.objects.filter(
+                user_id=user.pk, site__subdomain=subdomain
+            ).values_list("role", flat=True)
+        )
+    return role_cache[subdomain]
+
+
+def clear_site_role_cache(user):
+    """
+    Drop the roles memoized on a user object and in the user context cache.
+
+    Args:
+        user: User whose memberships changed
+    """
+    user.__dict__.pop("_site_role_cache", None)
+    user.__dict__.pop("_site_roles", None)
+    user_contexts.invalidate_on_commit(user.pk)
+
+
+def user_is_validated(user) -> bool:
+    """
+    Check whether a user has validated their email address.
+
+    Args:
+        user: User to check
+
+    Returns:
+        True if the user is validated
+    """
+    if User.validation.related.is_cached(user):
+        validation = User.validation.related.get_cached_value(user)
+        return validation is not None and validation.is_validated
+    return Validation.objects.filter(user_id=user.pk, is_validated=True).exists()
+
+
+async def auser_is_validated(user) -> bool:
+    """
+    Check whether a user has validated their email address from async code.
+
+    Args:
+        user: User to check
+
+    Returns:
+        True if the user is validated
+    """
+    if User.validation.related.is_cached(user):
+        validation = User.validation.related.get_cached_value(user)
+        return validation is not None and validation.is_validated
+    return await Validation.objects.filter(user_id=user.pk, is_validated=True).aexists()
+
+
+class SiteMembershipBackend(ModelBackend):
+    """
+    ModelBackend answering site role permissions from SiteMembership.
+
+    Site roles are named website.<subdomain>_<role>, the names the old
+    per-subdomain Permission rows used. They never load the user's full
+    permission set, every other permission is left to ModelBackend.
+
+    Users are loaded through the user context cache, together with their
+    validation and every site role they have.
+    """
+
+    def get_user(self, user_id):
+        """
+        Get the user a session belongs to.
+
+        Args:
+            user_id: Primary key from the session
+
+        Returns:
+            The user, None if there is no such active user
+        """
+        user = user_contexts.get(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        """
+        Get the user a session belongs to from async code.
+
+        Args:
+            user_id: Primary key from the session
+
+        Returns:
+            The user, None if there is no such active user
+        """
+        user = await user_contexts.aget(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    def has_perm(self, user_obj, perm: str, obj=None) -> bool:
+        """
+        Check whether a user has a permission.
+
+        Args:
+            user_obj: User to check
+            perm: Permission name
+            obj: Object the permission is for
+
+        Returns:
+            True if the user has the permission
+        """
+        app_label, _, codename = perm.partition(".")
+        subdomain, _, role = codename.rpartition("_")
+        if app_label != "website" or not subdomain or role not in ROLES:
+            return super().has_perm(user_obj, perm, obj=obj)
+        if user_obj.is_active and user_obj.is_superuser:
+            return True
+        return role in get_site_roles(user_obj, subdomain)
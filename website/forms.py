@@ -4,9 +4,28 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.forms import EmailField
 
 from website.models import Site
+from website.registry import site_registry
+
+
+class SubdomainField(forms.CharField):
+    """Subdomain field normalising to lower case, as hostnames are compared."""
+
+    def to_python(self, value) -> str:
+        """
+        Convert the submitted value.
+
+        Args:
+            value: Submitted value
+
+        Returns:
+            The subdomain in lower case
+        """
+        return super().to_python(value).lower()
 
 
 class CreateSite(forms.ModelForm):
@@ -23,23 +42,32 @@ class CreateSite(forms.ModelForm):
         self.user = ""
         if "user" in kwargs:
             self.user = kwargs.pop("user")
+        self.upload_errors: dict[str, str] = kwargs.pop("upload_errors", {})
         super().__init__(*args, **kwargs)
         for field_name in ("subdomain", "description", "logo"):
             self.fields[field_name].help_text = None
+        self.fields["subdomain"].widget.attrs.update(
+            {
+                "hx-get": "/subdomain_available",
+                "hx-trigger": "keyup changed delay:200ms",
+                "hx-target": "#subdomain_availability",
+            }
+        )
 
     class Meta:
         """Override the fields that are required."""
 
         model = Site
         fields = ("subdomain", "description", "logo")
+        field_classes = {"subdomain": SubdomainField}
 
     def clean(self):
         """Validate the form."""
-        try:
-            Site.objects.get(subdomain=self.cleaned_data.get("subdomain"))
+        for field_name, error in self.upload_errors.items():
+            self.add_error(field_name, ValidationError(error))
+        subdomain = self.cleaned_data.get("subdomain")
+        if subdomain and site_registry.get(subdomain) is not None:
             self.add_error("subdomain", ValidationError("The subdomain already exists"))
-        except Site.DoesNotExist:
-            pass
         return self.cleaned_data
 
     def save(self, commit=True):
@@ -73,23 +101,57 @@ class CustomUserCreationForm(UserCreationForm):
         for field_name in ("username", "email", "password1", "password2"):
             self.fields[field_name].help_text = None
 
+    def clean_username(self) -> str:
+        """
+        Leave the username uniqueness check to clean.
+
+        Returns:
+            Cleaned username
+        """
+        return self.cleaned_data.get("username")
+
     def clean(self):
         """
         Validate form fields.
 
+        Username and email are checked case insensitively in one query, served
+        by the lower() indexes on auth_user.
+
         Returns:
             Cleaned form fields
         """
         email = self.cleaned_data.get("email")
-        if User.objects.filter(email=email).exists():
-            self.add_error("email", ValidationError("Email is already in use"))
         username = self.cleaned_data.get("username")
-        if User.objects.filter(username=username).exists():
+        conflicts = Q()
+        if email:
+            conflicts |= Q(email_lower=email.lower())
+        if username:
+            conflicts |= Q(username_lower=username.lower())
+        if not conflicts:
+            return self.cleaned_data
+
+        taken_emails: set[str] = set()
+        taken_usernames: set[str] = set()
+        for existing_username, existing_email in (
+            User.objects.alias(
+                email_lower=Lower("email"), username_lower=Lower("username")
+            )
+            .filter(conflicts)
+            .values_list(Lower("username"), Lower("email"))
+        ):
+            taken_usernames.add(existing_username)
+            taken_emails.add(existing_email)
+        if email and email.lower() in taken_emails:
+            self.add_error("email", ValidationError("Email is already in use"))
+        if username and username.lower() in taken_usernames:
             self.add_error(
                 "username", ValidationError("Please choose a different username")
             )
         return self.cleaned_data
 
+    def validate_unique(self):
+        """Skip the model uniqueness queries, clean has already checked them."""
+
     def save(self, commit=True):
         """
         Override the save function to include the email field.
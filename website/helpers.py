@@ -1,19 +1,17 @@
 """Helper functions and classes."""
 
-import os
+from collections.abc import Iterable
 from dataclasses import dataclass
-from pathlib import Path
+from functools import lru_cache
 
-from django.contrib.auth.models import Permission, User
-from django.contrib.contenttypes.models import ContentType
-from django.core.mail import send_mail
-from PIL import Image
+from django.contrib.auth.models import User
 
 from devfaq.settings import ALLOWED_HOSTS
-from website.models import PermissionManagement
+from website.backends import clear_site_role_cache
+from website.models import OutboundEmail, Site, SiteMembership
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class HostDetails:
     """Class to hold host details."""
 
@@ -24,90 +22,88 @@ class HostDetails:
     full_url: str = ""
 
 
-def create_permissions(subdomain: str):
+def users_add_permissions(
+    users: Iterable[User], subdomains: Iterable[str], permissions: Iterable[str]
+):
     """
-    Create permission set for subdomain.
+    Give many users roles on many sites.
+
+    Runs one query to resolve the sites and one insert, regardless of the
+    number of users, subdomains or permissions. Unknown subdomains are ignored
+    as are roles a user already has.
 
     Args:
-        subdomain: Subdomain to create permission set for
+        users: The users to add permissions for
+        subdomains: The subdomains the permissions are for
+        permissions: List of permissions to add (can be owner or contributor)
     """
-    content_type = ContentType.objects.get_for_model(PermissionManagement)
-    Permission.objects.create(
-        codename=f"{subdomain}_owner",
-        name=f"Owner of {subdomain}",
-        content_type=content_type,
+    users = list(users)
+    permissions = list(permissions)
+    site_ids = list(
+        Site.objects.filter(subdomain__in=list(subdomains)).values_list("id", flat=True)
     )
-    Permission.objects.create(
-        codename=f"{subdomain}_contributor",
-        name=f"Contributor to {subdomain}",
-        content_type=content_type,
+    if not users or not site_ids or not permissions:
+        return
+    SiteMembership.objects.bulk_create(
+        [
+            SiteMembership(user_id=user.pk, site_id=site_id, role=permission)
+            for user in users
+            for site_id in site_ids
+            for permission in permissions
+        ],
+        ignore_conflicts=True,
     )
+    for user in users:
+        clear_site_role_cache(user)
 
 
-def delete_permissions(subdomain: str):
+def users_remove_permissions(
+    users: Iterable[User], subdomains: Iterable[str], permissions: Iterable[str]
+):
     """
-    Delete permissions for a subdomain.
+    Remove many users' roles on many sites in a single query.
 
     Args:
-        subdomain: Subdomain to delete permissions for.
+        users: The users to remove permissions for
+        subdomains: The subdomains the permissions are for
+        permissions: List of permissions to remove (can be owner or contributor)
     """
-    content_type = ContentType.objects.get_for_model(PermissionManagement)
-    Permission.objects.filter(
-        content_type=content_type,
-        codename__in=(f"{subdomain}_contributor", f"{subdomain}_owner"),
+    users = list(users)
+    SiteMembership.objects.filter(
+        user_id__in=[user.pk for user in users],
+        site__subdomain__in=list(subdomains),
+        role__in=list(permissions),
     ).delete()
+    for user in users:
+        clear_site_role_cache(user)
 
 
-def resize_image(
-    image: Path, new_name: str = "", max_width: int = 0, max_height: int = 0
-) -> Path:
+def get_user_sites_page(
+    user: User, after: int = 0, page_size: int = 25
+) -> tuple[list[Site], int | None]:
     """
-    Resize the given image.
+    Get a page of the sites a user is a member of using keyset pagination.
 
     Args:
-        image: Path and name of the image to resize
-        new_name: New name for the image, if left blank the image is overwritten
-        max_width: The maximum width for the new image
-        max_height: The maximum height for the new image
+        user: User to list the sites for
+        after: Only return sites with an id greater than this
+        page_size: Number of sites per page
 
     Returns:
-        Path of the new image
+        The sites, and the id to request the next page with or None on the last page
     """
-    if not new_name:
-        new_image = image
-    else:
-        new_image = image.parent.joinpath(new_name)
-
-    with Image.open(image) as img_h:
-        image_width: int = img_h.width
-        image_height: int = img_h.height
-        if not max_height:
-            max_height = image_height
-        if not max_width:
-            max_width = image_width
-
-        if image_height <= max_height and image_width <= max_width:
-            return image
-
-        if max_height and image_height > max_height:
-            ratio = image_height / max_height
-            image_height = int(image_height / ratio)
-            image_width = int(image_width / ratio)
-
-        if max_width and image_width > max_width:
-            ratio = image_width / max_width
-            image_height = int(image_height / ratio)
-            image_width = int(image_width / ratio)
-
-        new_size = (image_width, image_height)
-
-        new_image_obj = img_h.resize(size=new_size)
-        new_image_obj.save(fp=new_image)
-
-    if new_image != image:
-        os.remove(image)
-
-    return new_image
+    sites = list(
+        Site.objects.filter(
+            id__in=SiteMembership.objects.filter(user_id=user.pk).values("site_id"),
+            id__gt=after,
+        )
+        .select_related("created_by")
+        .only("id", "subdomain", "live", "created_by__username")
+        .order_by("id")[: page_size + 1]
+    )
+    if len(sites) > page_size:
+        return sites[:page_size], sites[page_size - 1].id
+    return sites, None
 
 
 def user_add_permissions(user: User, subdomain: str, permissions: list[str]):
@@ -119,16 +115,7 @@ def user_add_permissions(user: User, subdomain: str, permissions: list[str]):
         subdomain: The subdomain the permission is for
         permissions: List of permissions to add (can be owner or contributor)
     """
-    content_type = ContentType.objects.get_for_model(PermissionManagement)
-    for permission in permissions:
-        try:
-            permission_db = Permission.objects.get(
-                content_type=content_type, codename=f"{subdomain}_{permission}"
-            )
-            user.user_permissions.add(permission_db)
-            user.save()
-        except Permission.DoesNotExist:
-            pass
+    users_add_permissions([user], [subdomain], permissions)
 
 
 def user_remove_permissions(user: User, subdomain: str, permissions: list[str]):
@@ -140,75 +127,108 @@ def user_remove_permissions(user: User, subdomain: str, permissions: list[str]):
         subdomain: The subdomain the permission is for
         permissions: List of permissions to remove (can be owner or contributor)
     """
-    content_type = ContentType.objects.get_for_model(PermissionManagement)
-    for permission in permissions:
-        try:
-            permission_db = Permission.objects.get(
-                content_type=content_type, codename=f"{subdomain}_{permission}"
-            )
-            user.user_permissions.remove(permission_db)
-            user.save()
-        except Permission.DoesNotExist:
-            pass
+    users_remove_permissions([user], [subdomain], permissions)
+
+
+class HostParser:
+    """Parse Host header values against a precompiled table of allowed hosts."""
+
+    def __init__(self, allowed_hosts: list[str], cache_size: int = 1024):
+        """
+        Initialise HostParser.
+
+        Args:
+            allowed_hosts: Allowed hosts, normally settings.ALLOWED_HOSTS
+            cache_size: Number of parsed (scheme, host) pairs to keep
+        """
+        self.source = allowed_hosts
+        self.allowed_hosts: frozenset[str] = frozenset(
+            allow_host[1:] if allow_host.startswith(".") else allow_host
+            for allow_host in allowed_hosts
+        )
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+
+    def _parse(self, scheme: str, host: str) -> HostDetails:
+        """
+        Parse a raw host value.
+
+        Args:
+            scheme: Scheme the request was made with
+            host: Raw host value, optionally including the port
+
+        Returns:
+            HostDetails for the host
+        """
+        hostname_no_port, _, port_string = host.lower().partition(":")
+        if port_string:
+            port = int(port_string)
+        elif scheme == "http":
+            port = 80
+        else:
+            port = 443
+
+        subdomain, _, hostname_without_subdomain = hostname_no_port.partition(".")
+        if (
+            hostname_no_port in self.allowed_hosts
+            or hostname_without_subdomain not in self.allowed_hosts
+        ):
+            subdomain = ""
+            hostname = hostname_no_port
+        else:
+            hostname = hostname_without_subdomain
+
+        subdomain_prefix = f"{subdomain}." if subdomain else ""
+        port_suffix = ""
+        if (scheme != "https" or port != 443) and (scheme != "http" or port != 80):
+            port_suffix = f":{port}"
+        return HostDetails(
+            scheme=scheme,
+            subdomain=subdomain,
+            hostname=hostname,
+            port=port,
+            full_url=f"{scheme}://{subdomain_prefix}{hostname}{port_suffix}",
+        )
+
+
+_host_parser: HostParser | None = None
+
+
+def get_host_parser() -> HostParser:
+    """
+    Get the shared host parser, building it if ALLOWED_HOSTS has been replaced.
+
+    Returns:
+        HostParser for the current ALLOWED_HOSTS
+    """
+    global _host_parser
+    if _host_parser is None or _host_parser.source is not ALLOWED_HOSTS:
+        _host_parser = HostParser(ALLOWED_HOSTS)
+    return _host_parser
 
 
 def get_host_details(request) -> HostDetails:
     """
     Parse the host details.
 
+    Views should prefer request.host_details, which TenantMiddleware sets once
+    per request.
+
     Args:
         request: Request object received from a view
 
     Returns:
-        Dictionary containing the main host parts
+        HostDetails containing the main host parts
     """
-    host_details = HostDetails()
-    host_details.scheme = request.scheme
     try:
         hostname = request.get_host()
     except KeyError:
-        return host_details
-
-    allowed_hosts = []
-    for allow_host in ALLOWED_HOSTS:
-        if allow_host.startswith("."):
-            allowed_hosts.append(allow_host[1:])
-            continue
-        allowed_hosts.append(allow_host)
-
-    host_details.hostname = hostname
-    hostname_split = hostname.split(":")
-    hostname_no_port = hostname_split[0]
-
-    if len(hostname_split) > 1:
-        host_details.port = int(hostname_split[1])
-    elif host_details.scheme == "http":
-        host_details.port = 80
-
-    subdomain = hostname_no_port.split(".")[0]
-    hostname_without_subdomain = hostname_no_port[len(subdomain) + 1 :]
-    if (
-        hostname_no_port in allowed_hosts
-        or hostname_without_subdomain not in allowed_hosts
-    ):
-        host_details.hostname = hostname_no_port
-    else:
-        host_details.hostname = hostname_without_subdomain
-        host_details.subdomain = subdomain
-    subdomain = f"{host_details.subdomain}." if host_details.subdomain else ""
-    port = ""
-    if (host_details.scheme != "https" or host_details.port != 443) and (
-        host_details.scheme != "http" or host_details.port != 80
-    ):
-        port = f":{host_details.port}"
-    full_url = f"{host_details.scheme}://{subdomain}{host_details.hostname}{port}"
-    host_details.full_url = full_url
-    return host_details
+        return HostDetails(scheme=request.scheme)
+    return get_host_parser().parse(request.scheme, hostname)
 
 
 def send_site_email(sender: str, recipient: str, subject: str, message: str):
     """
-    Send email.
+    Queue an email in the outbox for the deliver_email command to send.
 
     Args:
         sender: Email address to send from
@@ -216,10 +236,27 @@ def send_site_email(sender: str, recipient: str, subject: str, message: str):
         subject: Subject for the email
         messgae: Body of the email
     """
-    send_mail(
+    OutboundEmail.objects.create(
+        sender=sender,
+        recipient=recipient,
+        subject=subject,
+        message=message,
+    )
+
+
+async def asend_site_email(sender: str, recipient: str, subject: str, message: str):
+    """
+    Queue an email in the outbox from an async view.
+
+    Args:
+        sender: Email address to send from
+        recipient: Email address to send too
+        subject: Subject for the email
+        message: Body of the email
+    """
+    await OutboundEmail.objects.acreate(
+        sender=sender,
+        recipient=recipient,
         subject=subject,
         message=message,
-        from_email=sender,
-        recipient_list=[recipient],
-        fail_silently=False,
     )
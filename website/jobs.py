@@ -0,0 +1,239 @@
+"""Database backed background job queue."""
+
+import logging
+import traceback
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.db.models import F, Q
+from django.utils import timezone
+
+from website.logos import LOGO_VARIANTS, ensure_derivative, hash_file, purge_derivatives
+from website.models import Job, QueueEntry, Site
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[dict], None]
+
+_handlers: dict[str, JobHandler] = {}
+
+
+def job_handler(name: str) -> Callable[[JobHandler], JobHandler]:
+    """
+    Register a function as the handler for a job name.
+
+    Args:
+        name: Name jobs are enqueued with
+
+    Returns:
+        Decorator registering the handler
+    """
+
+    def decorator(func: JobHandler) -> JobHandler:
+        _handlers[name] = func
+        return func
+
+    return decorator
+
+
+def enqueue(
+    name: str,
+    payload: dict | None = None,
+    run_after: datetime | None = None,
+    max_attempts: int = 5,
+) -> Job:
+    """
+    Add a job to the queue.
+
+    Args:
+        name: Name of the registered handler to run
+        payload: JSON serialisable arguments for the handler
+        run_after: Earliest time the job may run, defaults to now
+        max_attempts: Number of attempts before the job is marked as failed
+
+    Returns:
+        The queued Job
+    """
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+async def aenqueue(
+    name: str,
+    payload: dict | None = None,
+    run_after: datetime | None = None,
+    max_attempts: int = 5,
+) -> Job:
+    """
+    Add a job to the queue from an async view.
+
+    Args:
+        name: Name of the registered handler to run
+        payload: JSON serialisable arguments for the handler
+        run_after: Earliest time the job may run, defaults to now
+        max_attempts: Number of attempts before the job is marked as failed
+
+    Returns:
+        The queued Job
+    """
+    return await Job.objects.acreate(
+        name=name,
+        payload=payload or {},
+        run_after=run_after or timezone.now(),
+        max_attempts=max_attempts,
+    )
+
+
+def claimable(now: datetime) -> Q:
+    """
+    Build the filter for queue entries a worker may claim.
+
+    Pending entries are claimable once they are due, running entries once their
+    visibility timeout has passed because the worker running them has died,
+    as long as they have attempts left.
+
+    Args:
+        now: Current time
+
+    Returns:
+        Q object selecting claimable entries
+    """
+    return Q(status=QueueEntry.PENDING, run_after__lte=now) | Q(
+        status=QueueEntry.RUNNING,
+        locked_until__lt=now,
+        attempts__lt=F("max_attempts"),
+    )
+
+
+def claim(
+    model: type[QueueEntry], limit: int = 10, visibility_timeout: int = 300
+) -> list:
+    """
+    Claim queue entries for this worker.
+
+    Each entry is claimed with a conditional UPDATE so that only one worker can
+    win it, which works the same on SQLite and Postgres. Running entries whose
+    visibility timeout passed on their last attempt are marked as failed.
+
+    Args:
+        model: QueueEntry subclass to claim from
+        limit: Maximum number of entries to claim
+        visibility_timeout: Seconds before an unfinished entry can be reclaimed
+
+    Returns:
+        List of claimed entries
+    """
+    now = timezone.now()
+    model.objects.filter(
+        status=QueueEntry.RUNNING,
+        locked_until__lt=now,
+        attempts__gte=F("max_attempts"),
+    ).update(
+        status=QueueEntry.FAILED,
+        locked_until=None,
+        last_error="Visibility timeout expired on the last attempt",
+    )
+    candidate_ids = list(
+        model.objects.filter(claimable(now))
+        .order_by("run_after")
+        .values_list("id", flat=True)[:limit]
+    )
+    locked_until = now + timedelta(seconds=visibility_timeout)
+    claimed_ids = [
+        entry_id
+        for entry_id in candidate_ids
+        if model.objects.filter(claimable(now), id=entry_id).update(
+            status=QueueEntry.RUNNING,
+            locked_until=locked_until,
+            attempts=F("attempts") + 1,
+        )
+    ]
+    return list(model.objects.filter(id__in=claimed_ids).order_by("run_after"))
+
+
+def claim_jobs(limit: int = 10, visibility_timeout: int = 300) -> list[Job]:
+    """
+    Claim jobs for this worker.
+
+    Args:
+        limit: Maximum number of jobs to claim
+        visibility_timeout: Seconds before an unfinished job can be reclaimed
+
+    Returns:
+        List of claimed jobs
+    """
+    return claim(Job, limit=limit, visibility_timeout=visibility_timeout)
+
+
+def run_job(job: Job) -> bool:
+    """
+    Run a claimed job and record the result.
+
+    Args:
+        job: Job returned by claim_jobs
+
+    Returns:
+        True if the job succeeded
+    """
+    try:
+        handler = _handlers[job.name]
+        handler(job.payload)
+    except Exception:
+        logger.exception("Job %s (%s) failed", job.id, job.name)
+        job.mark_failed(traceback.format_exc())
+        return False
+
+    job.mark_done()
+    return True
+
+
+def run_pending(limit: int = 10, visibility_timeout: int = 300) -> int:
+    """
+    Claim and run a batch of jobs.
+
+    Args:
+        limit: Maximum number of jobs to run
+        visibility_timeout: Seconds before an unfinished job can be reclaimed
+
+    Returns:
+        Number of jobs run
+    """
+    jobs = claim_jobs(limit=limit, visibility_timeout=visibility_timeout)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
+
+
+@job_handler("process_logo")
+def process_logo(payload: dict):
+    """
+    Fingerprint an uploaded site logo and render its header variant.
+
+    Derivatives of the previous logo are removed unless another site shares
+    the same original.
+
+    Args:
+        payload: Dictionary holding the site_id
+    """
+    site = Site.objects.get(id=payload["site_id"])
+    previous_hash = site.logo_hash
+    if site.logo:
+        original = Path(site.logo.path)
+        site.logo_hash = hash_file(original)
+        ensure_derivative(original, site.logo_hash, LOGO_VARIANTS["header"])
+    else:
+        site.logo_hash = ""
+    site.logo_processed = True
+    site.save(update_fields=["logo_hash", "logo_processed"])
+
+    if (
+        previous_hash
+        and previous_hash != site.logo_hash
+        and not Site.objects.filter(logo_hash=previous_hash).exists()
+    ):
+        purge_derivatives(previous_hash)
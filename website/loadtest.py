@@ -0,0 +1,423 @@
+"""Synthetic multi-tenant data and a concurrent driver for the URL routes."""
+
+import itertools
+import math
+import random
+import threading
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import Client
+from PIL import Image
+
+from website.metrics import RequestStats, current_stats
+from website.models import Site, SiteMembership, Validation
+
+PASSWORD = "load-test-Password-1"
+
+ROUTE_WEIGHTS = {
+    "/": 50,
+    "/user_cp": 20,
+    "/validate": 15,
+    "/create_site": 10,
+    "/register": 5,
+}
+LOGGED_IN = frozenset({"/user_cp", "/create_site"})
+
+
+@dataclass(slots=True)
+class Dataset:
+    """What generate created, for building requests against it."""
+
+    usernames: list[str]
+    subdomains: list[str]
+    tokens: list[str]
+
+
+@dataclass(frozen=True, slots=True)
+class PlannedRequest:
+    """One request to make."""
+
+    number: int
+    route: str
+    subdomain: str
+    username: str
+
+
+@dataclass(frozen=True, slots=True)
+class RequestResult:
+    """Outcome of one request."""
+
+    route: str
+    seconds: float
+    status: int
+    queries: int
+
+
+def make_logo_content() -> bytes:
+    """
+    Build a small PNG logo.
+
+    Returns:
+        Content of the logo
+    """
+    buffer = BytesIO()
+    Image.new("RGB", (64, 64), "navy").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def generate(users: int, sites: int, seed: int = 0, batch_size: int = 1000) -> Dataset:
+    """
+    Create validated users, sites with logos owned by them and pending tokens.
+
+    Every user shares one password hash, so generating many users does not
+    cost a key derivation each.
+
+    Args:
+        users: Number of users
+        sites: Number of sites
+        seed: Seed for assigning sites to owners
+        batch_size: Rows per INSERT
+
+    Returns:
+        Dataset describing the rows
+    """
+    rng = random.Random(seed)
+    password = make_password(PASSWORD)
+    usernames = [f"load-user-{number}" for number in range(users)]
+    created_users = User.objects.bulk_create(
+        (
+            User(username=username, email=f"{username}@dev-faq.com", password=password)
+            for username in usernames
+        ),
+        batch_size=batch_size,
+    )
+    Validation.objects.bulk_create(
+        (Validation(user=user, is_validated=True) for user in created_users),
+        batch_size=batch_size,
+    )
+
+    logo = make_logo_content()
+    subdomains = [f"load-site-{number}" for number in range(sites)]
+    created_sites = Site.objects.bulk_create(
+        (
+            Site(
+                subdomain=subdomain,
+                description=f"Questions about {subdomain}",
+                logo=ContentFile(logo, name="logo.png"),
+                created_by=rng.choice(created_users),
+            )
+            for subdomain in subdomains
+        ),
+        batch_size=batch_size,
+    )
+    SiteMembership.objects.bulk_create(
+        (
+            SiteMembership(site=site, user=site.created_by, role="owner")
+            for site in created_sites
+        ),
+        batch_size=batch_size,
+    )
+
+    # Users awaiting validation, one per token the /validate requests spend
+    pending = User.objects.bulk_create(
+        (
+            User(
+                username=f"load-pending-{number}",
+                email=f"load-pending-{number}@dev-faq.com",
+                password=password,
+            )
+            for number in range(users)
+        ),
+        batch_size=batch_size,
+    )
+    tokens = []
+    validations = []
+    for user in pending:
+        token, fields = Validation.new_token()
+        tokens.append(token)
+        validations.append(Validation(user=user, **fields))
+    Validation.objects.bulk_create(validations, batch_size=batch_size)
+    return Dataset(usernames=usernames, subdomains=subdomains, tokens=tokens)
+
+
+def plan(dataset: Dataset, requests: int, seed: int = 0) -> list[PlannedRequest]:
+    """
+    Choose the routes, tenants and users for a run.
+
+    Args:
+        dataset: Rows created by generate
+        requests: Number of requests
+        seed: Seed for the choices
+
+    Returns:
+        The requests in the order they are started
+    """
+    rng = random.Random(seed)
+    routes = rng.choices(
+        list(ROUTE_WEIGHTS), weights=list(ROUTE_WEIGHTS.values()), k=requests
+    )
+    return [
+        PlannedRequest(
+            number=number,
+            route=route,
+            subdomain=rng.choice(dataset.subdomains) if route == "/" else "",
+            username=rng.choice(dataset.usernames),
+        )
+        for number, route in enumerate(routes)
+    ]
+
+
+class Driver:
+    """
+    Make planned requests through the full middleware chain.
+
+    Each worker thread keeps an anonymous client and one logged in client per
+    user it has acted as. Queries are read from the RequestStats that
+    MetricsMiddleware attaches to the request.
+    """
+
+    def __init__(self, host: str, dataset: Dataset, logo: bytes | None = None):
+        """
+        Initialise Driver.
+
+        Args:
+            host: Main host, tenants are requested on its subdomains
+            dataset: Rows created by generate
+            logo: Logo uploaded by /create_site requests
+        """
+        self.host = host
+        self.logo = logo or make_logo_content()
+        self._tokens = iter(dataset.tokens)
+        self._tokens_lock = threading.Lock()
+        self._local = threading.local()
+        self._users = {
+            user.username: user
+            for user in User.objects.filter(username__in=dataset.usernames)
+        }
+
+    def client(self, username: str | None) -> Client:
+        """
+        Get this thread's client for a user.
+
+        Args:
+            username: User to act as, None for an anonymous visitor
+
+        Returns:
+            Client with the user logged in
+        """
+        clients = getattr(self._local, "clients", None)
+        if clients is None:
+            clients = self._local.clients = {}
+        if username not in clients:
+            client = Client()
+            if username is not None:
+                client.force_login(self._users[username])
+            clients[username] = client
+        return clients[username]
+
+    def next_token(self) -> str:
+        """
+        Take an unused validation token.
+
+        Returns:
+            The token, or an invalid one once every token is spent
+        """
+        with self._tokens_lock:
+            return next(self._tokens, "spent")
+
+    def request(self, planned: PlannedRequest):
+        """
+        Make one request.
+
+        Args:
+            planned: Request to make
+
+        Returns:
+            The response
+        """
+        host = f"{planned.subdomain}.{self.host}" if planned.subdomain else self.host
+        match planned.route:
+            case "/":
+                return self.client(None).get("/", HTTP_HOST=host)
+            case "/user_cp":
+                return self.client(planned.username).get("/user_cp", HTTP_HOST=host)
+            case "/validate":
+                return self.client(None).get(
+                    "/validate", {"token": self.next_token()}, HTTP_HOST=host
+                )
+            case "/create_site":
+                return self.client(planned.username).post(
+                    "/create_site",
+                    {
+                        "subdomain": f"load-new-{planned.number}",
+                        "description": "Created under load",
+                        "logo": ContentFile(self.logo, name="logo.png"),
+                    },
+                    HTTP_HOST=host,
+                    HTTP_ACCEPT="application/json",
+                )
+            case "/register":
+                username = f"load-register-{planned.number}"
+                # Registering logs the client in, keep the shared one anonymous
+                return Client().post(
+                    "/register",
+                    {
+                        "username": username,
+                        "email": f"{username}@dev-faq.com",
+                        "password1": PASSWORD,
+                        "password2": PASSWORD,
+                    },
+                    HTTP_HOST=host,
+                    HTTP_ACCEPT="application/json",
+                )
+        raise ValueError(f"Unknown route {planned.route}")
+
+    def timed(self, planned: PlannedRequest) -> RequestResult:
+        """
+        Make one request and measure it.
+
+        Args:
+            planned: Request to make
+
+        Returns:
+            RequestResult for the request
+        """
+        # Log the client in before the clock starts
+        self.client(planned.username if planned.route in LOGGED_IN else None)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.request(planned)
+        finally:
+            current_stats.reset(token)
+        seconds = time.perf_counter() - start
+        stats = getattr(response.wsgi_request, "request_stats", stats)
+        return RequestResult(
+            route=planned.route,
+            seconds=seconds,
+            status=response.status_code,
+            queries=stats.queries,
+        )
+
+    def run(
+        self, planned: list[PlannedRequest], concurrency: int
+    ) -> tuple[list[RequestResult], float]:
+        """
+        Make requests with a number of them in flight.
+
+        Args:
+            planned: Requests to make
+            concurrency: Number of worker threads, 1 runs in the calling thread
+
+        Returns:
+            Results in planned order and the wall time of the run in seconds
+        """
+        start = time.perf_counter()
+        if concurrency == 1:
+            results = [self.timed(request) for request in planned]
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(self.timed, planned))
+        return results, time.perf_counter() - start
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """
+    Calculate a nearest rank percentile.
+
+    Args:
+        values: Sorted values
+        percent: Percentile between 0 and 100
+
+    Returns:
+        The percentile, 0 when there are no values
+    """
+    if not values:
+        return 0.0
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+def summarise_results(results: Iterable[RequestResult], seconds: float) -> dict:
+    """
+    Summarise a run per route and overall.
+
+    Args:
+        results: Results of the run
+        seconds: Wall time of the run
+
+    Returns:
+        JSON serialisable summary, latencies in milliseconds
+    """
+
+    def summary(group: list[RequestResult]) -> dict:
+        latencies = sorted(result.seconds * 1e3 for result in group)
+        return {
+            "requests": len(group),
+            "errors": sum(result.status >= 400 for result in group),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "queries_per_request": round(
+                sum(result.queries for result in group) / len(group), 3
+            ),
+        }
+
+    results = list(results)
+    by_route = sorted(results, key=lambda result: result.route)
+    total = summary(results)
+    total["requests_per_second"] = round(len(results) / seconds, 3)
+    return {
+        "routes": {
+            route: summary(list(group))
+            for route, group in itertools.groupby(
+                by_route, key=lambda result: result.route
+            )
+        },
+        "total": total,
+    }
+
+
+def regressions(baseline: dict, current: dict, tolerance: float) -> list[str]:
+    """
+    Compare a run against a baseline.
+
+    Args:
+        baseline: Summary of the baseline run
+        current: Summary of the new run
+        tolerance: Fraction a figure may get worse by
+
+    Returns:
+        Description of every figure that got worse by more than the tolerance
+    """
+    found = []
+
+    def check(name: str, before: dict, after: dict):
+        for key in ("p50_ms", "p95_ms", "p99_ms", "queries_per_request"):
+            if key in before and after[key] > before[key] * (1 + tolerance):
+                found.append(f"{name} {key}: {before[key]} -> {after[key]}")
+        if after["errors"] > before.get("errors", 0):
+            found.append(
+                f"{name} errors: {before.get('errors', 0)} -> {after['errors']}"
+            )
+
+    for route, before in baseline.get("routes", {}).items():
+        if route in current["routes"]:
+            check(route, before, current["routes"][route])
+    before_total = baseline.get("total", {})
+    check("total", before_total, current["total"])
+    if "requests_per_second" in before_total and current["total"][
+        "requests_per_second"
+    ] < before_total["requests_per_second"] * (1 - tolerance):
+        found.append(
+            f"total requests_per_second: {before_total['requests_per_second']} -> "
+            f"{current['total']['requests_per_second']}"
+        )
+    return found
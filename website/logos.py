@@ -0,0 +1,166 @@
+"""Content addressed logo derivatives."""
+
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from PIL import Image
+
+
+@dataclass(frozen=True, slots=True)
+class LogoVariant:
+    """Size and format of a logo derivative."""
+
+    name: str
+    width: int
+    height: int
+    format: str = "PNG"
+
+    @property
+    def extension(self) -> str:
+        """File extension for the variant format."""
+        return self.format.lower()
+
+    @property
+    def filename(self) -> str:
+        """
+        Filename of the variant within the derivative directory.
+
+        The size and format are hashed into the name so that changing a
+        variant definition never serves a previously cached file.
+        """
+        spec = f"{self.width}x{self.height}:{self.format}".encode()
+        return f"{self.name}-{hashlib.sha256(spec).hexdigest()[:8]}.{self.extension}"
+
+
+LOGO_VARIANTS: dict[str, LogoVariant] = {
+    variant.name: variant
+    for variant in (
+        LogoVariant("thumbnail", 64, 64),
+        LogoVariant("header", 500, 400),
+        LogoVariant("header-2x", 1000, 800),
+        LogoVariant("header-webp", 500, 400, "WEBP"),
+    )
+}
+
+
+def hash_file(path: Path) -> str:
+    """
+    Calculate the SHA-256 digest of a file.
+
+    Args:
+        path: File to hash
+
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file_h:
+        for chunk in iter(lambda: file_h.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def derivative_directory(logo_hash: str) -> Path:
+    """
+    Calculate the directory holding the derivatives of an original logo.
+
+    Args:
+        logo_hash: SHA-256 digest of the original logo
+
+    Returns:
+        Path of the directory
+    """
+    return Path(settings.LOGO_DERIVATIVE_ROOT).joinpath(logo_hash)
+
+
+def derivative_path(logo_hash: str, variant: LogoVariant) -> Path:
+    """
+    Calculate the path of a logo derivative.
+
+    Args:
+        logo_hash: SHA-256 digest of the original logo
+        variant: Variant to calculate the path for
+
+    Returns:
+        Path of the derivative
+    """
+    return derivative_directory(logo_hash).joinpath(variant.filename)
+
+
+def render_variant(original: Path, variant: LogoVariant, destination: Path):
+    """
+    Render a variant of an original logo.
+
+    Args:
+        original: Path of the original logo
+        variant: Variant to render
+        destination: Path to write the variant to
+    """
+    with Image.open(original) as img_h:
+        # thumbnail() drafts JPEGs to a reduced decode scale and reduces before
+        # resampling, so a huge original is never fully decoded
+        img_h.thumbnail((variant.width, variant.height), reducing_gap=2.0)
+        has_alpha = img_h.mode in ("RGBA", "LA", "PA") or (
+            img_h.mode == "P" and "transparency" in img_h.info
+        )
+        img_h.convert("RGBA" if has_alpha else "RGB").save(
+            destination, format=variant.format
+        )
+
+
+def ensure_derivative(original: Path, logo_hash: str, variant: LogoVariant) -> Path:
+    """
+    Get a logo derivative, rendering it the first time it is requested.
+
+    Workers rendering the same derivative are serialised with an exclusive lock
+    on a lock file next to it, the derivative is written to a temporary file and
+    moved into place so it is never served half written.
+
+    Args:
+        original: Path of the original logo
+        logo_hash: SHA-256 digest of the original logo
+        variant: Variant to get
+
+    Returns:
+        Path of the derivative
+    """
+    destination = derivative_path(logo_hash, variant)
+    if destination.exists():
+        return destination
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = destination.with_suffix(".lock")
+    with open(lock_path, "a") as lock_h:
+        fcntl.flock(lock_h, fcntl.LOCK_EX)
+        try:
+            if not destination.exists():
+                fd, temp_name = tempfile.mkstemp(
+                    dir=destination.parent, suffix=f".{variant.extension}"
+                )
+                os.close(fd)
+                try:
+                    render_variant(original, variant, Path(temp_name))
+                    os.replace(temp_name, destination)
+                except BaseException:
+                    os.remove(temp_name)
+                    raise
+        finally:
+            fcntl.flock(lock_h, fcntl.LOCK_UN)
+    return destination
+
+
+def purge_derivatives(logo_hash: str):
+    """
+    Remove every derivative of an original logo.
+
+    Args:
+        logo_hash: SHA-256 digest of the original logo
+    """
+    if logo_hash:
+        shutil.rmtree(derivative_directory(logo_hash), ignore_errors=True)
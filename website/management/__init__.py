@@ -0,0 +1 @@
+"""Standard blank init file."""
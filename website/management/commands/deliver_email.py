@@ -0,0 +1,61 @@
+"""Management command delivering the email outbox."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from website.outbox import deliver_outbox
+
+
+class Command(BaseCommand):
+    """Send queued emails in batches."""
+
+    help = "Send queued emails in batches until interrupted"
+
+    def add_arguments(self, parser):
+        """
+        Add the worker options.
+
+        Args:
+            parser: Argument parser for the command
+        """
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Emails to send per SMTP connection",
+        )
+        parser.add_argument(
+            "--visibility-timeout",
+            type=int,
+            default=300,
+            help="Seconds before an unsent email can be claimed by another worker",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5.0,
+            help="Seconds to wait when the outbox is empty",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Send a single batch and exit"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Run the delivery loop.
+
+        Args:
+            args: Positional arguments
+            options: Command options
+        """
+        while True:
+            sent = deliver_outbox(
+                batch_size=options["batch_size"],
+                visibility_timeout=options["visibility_timeout"],
+            )
+            if options["once"]:
+                self.stdout.write(f"Sent {sent} email(s)")
+                return
+            if not sent:
+                time.sleep(options["sleep"])
@@ -0,0 +1,149 @@
+"""Management command load testing the site with synthetic tenants."""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from website import helpers
+from website.loadtest import Driver, generate, plan, regressions, summarise_results
+from website.routers import mirror_primary
+
+
+class Command(BaseCommand):
+    """Drive the URL routes concurrently against generated data."""
+
+    help = (
+        "Generate users, sites and validations in a throwaway database, drive "
+        "the URL routes concurrently and report latency, throughput and queries"
+    )
+
+    def add_arguments(self, parser):
+        """
+        Add the load test options.
+
+        Args:
+            parser: Argument parser for the command
+        """
+        parser.add_argument("--users", type=int, default=200, help="Users to create")
+        parser.add_argument("--sites", type=int, default=50, help="Sites to create")
+        parser.add_argument(
+            "--requests", type=int, default=2000, help="Requests to make"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=16, help="Requests in flight"
+        )
+        parser.add_argument(
+            "--host",
+            default="dev-faq.test",
+            help="Main host, sites are requested on its subdomains",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+        parser.add_argument("--output", type=Path, help="JSON file for the results")
+        parser.add_argument(
+            "--baseline", type=Path, help="JSON results of a previous run to compare"
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Fraction a figure may get worse by before the run fails",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Run the load test, write the results and check them for regressions.
+
+        Args:
+            args: Positional arguments
+            options: Command options
+        """
+        baseline = None
+        if options["baseline"]:
+            baseline = json.loads(options["baseline"].read_text())
+
+        with tempfile.TemporaryDirectory() as directory:
+            results = self.run(directory, options)
+
+        self.report(results)
+        if options["output"]:
+            options["output"].write_text(json.dumps(results, indent=2) + "\n")
+        if baseline is not None:
+            found = regressions(baseline, results, options["tolerance"])
+            if found:
+                raise CommandError("Regressions found:\n" + "\n".join(found))
+            self.stdout.write("No regressions against the baseline")
+
+    def run(self, directory: str, options: dict) -> dict:
+        """
+        Generate the data and make the requests in a throwaway database.
+
+        Args:
+            directory: Scratch directory for the database and uploads
+            options: Command options
+
+        Returns:
+            Summary of the run
+        """
+        host = options["host"]
+        allowed_hosts = [f".{host}"]
+        test_name = connection.settings_dict["TEST"].get("NAME")
+        if connection.vendor == "sqlite":
+            # Worker threads need a database file they can all open
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                directory, "loadtest.sqlite3"
+            )
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        mirror_primary()
+        previous_hosts = helpers.ALLOWED_HOSTS
+        helpers.ALLOWED_HOSTS = allowed_hosts
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=allowed_hosts,
+                MEDIA_ROOT=os.path.join(directory, "media"),
+                LOGO_DERIVATIVE_ROOT=os.path.join(directory, "logo_derivatives"),
+            ):
+                dataset = generate(
+                    users=options["users"], sites=options["sites"], seed=options["seed"]
+                )
+                driver = Driver(host=host, dataset=dataset)
+                requests = plan(dataset, options["requests"], seed=options["seed"])
+                results, seconds = driver.run(requests, options["concurrency"])
+        finally:
+            helpers.ALLOWED_HOSTS = previous_hosts
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            connection.settings_dict["TEST"]["NAME"] = test_name
+
+        summary = summarise_results(results, seconds)
+        summary["config"] = {
+            key: options[key]
+            for key in ("users", "sites", "requests", "concurrency", "seed")
+        }
+        summary["config"]["database"] = connection.vendor
+        return summary
+
+    def report(self, results: dict):
+        """
+        Print the summary as a table.
+
+        Args:
+            results: Summary of the run
+        """
+        self.stdout.write(
+            f"{'route':<14}{'requests':>9}{'errors':>8}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}"
+        )
+        rows = [*results["routes"].items(), ("total", results["total"])]
+        for route, row in rows:
+            self.stdout.write(
+                f"{route:<14}{row['requests']:>9}{row['errors']:>8}"
+                f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+                f"{row['queries_per_request']:>9.2f}"
+            )
+        self.stdout.write(
+            f"{results['total']['requests_per_second']:.1f} requests per second"
+        )
@@ -0,0 +1,70 @@
+"""Management command moving a site's tenant rows to another shard."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from website.models import Site
+from website.sharding import TenantMove
+
+
+class Command(BaseCommand):
+    """Move a site to another shard while it keeps serving requests."""
+
+    help = (
+        "Copy a site's FAQ entries to another shard in batches, cut the site "
+        "over in a short transaction and delete the entries from the old shard"
+    )
+
+    def add_arguments(self, parser):
+        """
+        Add the move options.
+
+        Args:
+            parser: Argument parser for the command
+        """
+        parser.add_argument("subdomain", help="Subdomain of the site to move")
+        parser.add_argument("shard", help="Alias of the shard to move the site to")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Entries copied or deleted per query",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.0,
+            help="Seconds to wait between batches outside the cut-over",
+        )
+        parser.add_argument(
+            "--grace",
+            type=float,
+            default=5.0,
+            help="Seconds to wait for in-flight requests after the cut-over",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Move the site.
+
+        Args:
+            args: Positional arguments
+            options: Command options
+        """
+        site = Site.objects.filter(subdomain=options["subdomain"]).first()
+        if site is None:
+            raise CommandError(f"No site for {options['subdomain']}")
+        source = site.shard
+        try:
+            move = TenantMove(
+                site,
+                options["shard"],
+                batch_size=options["batch_size"],
+                sleep=options["sleep"],
+            )
+        except ValueError as error:
+            raise CommandError(str(error)) from None
+        moved = move.run(grace=options["grace"])
+        self.stdout.write(
+            f"Moved {moved} entry(s) of {site.subdomain} from {source} to "
+            f"{options['shard']}"
+        )
@@ -0,0 +1,47 @@
+"""Management command deleting expired sessions."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from website.sessions import SessionStore
+
+
+class Command(BaseCommand):
+    """Delete expired sessions in batches."""
+
+    help = "Delete expired sessions in batches"
+
+    def add_arguments(self, parser):
+        """
+        Add the purge options.
+
+        Args:
+            parser: Argument parser for the command
+        """
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Sessions to delete per DELETE",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.0,
+            help="Seconds to wait between batches",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Delete batches until no expired sessions remain.
+
+        Args:
+            args: Positional arguments
+            options: Command options
+        """
+        total = 0
+        while deleted := SessionStore.purge_expired(batch_size=options["batch_size"]):
+            total += deleted
+            time.sleep(options["sleep"])
+        self.stdout.write(f"Deleted {total} expired session(s)")
@@ -0,0 +1,49 @@
+"""Management command clearing expired email validation tokens."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from website.models import Validation
+
+
+class Command(BaseCommand):
+    """Clear expired validation tokens in batches."""
+
+    help = "Clear expired email validation tokens in batches"
+
+    def add_arguments(self, parser):
+        """
+        Add the purge options.
+
+        Args:
+            parser: Argument parser for the command
+        """
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Tokens to clear per UPDATE",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.0,
+            help="Seconds to wait between batches",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Clear batches until no expired tokens remain.
+
+        Args:
+            args: Positional arguments
+            options: Command options
+        """
+        total = 0
+        while cleared := Validation.purge_expired_tokens(
+            batch_size=options["batch_size"]
+        ):
+            total += cleared
+            time.sleep(options["sleep"])
+        self.stdout.write(f"Cleared {total} expired token(s)")
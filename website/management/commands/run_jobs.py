@@ -0,0 +1,58 @@
+"""Management command running the background job worker."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from website.jobs import run_pending
+
+
+class Command(BaseCommand):
+    """Run queued background jobs."""
+
+    help = "Run queued background jobs until interrupted"
+
+    def add_arguments(self, parser):
+        """
+        Add the worker options.
+
+        Args:
+            parser: Argument parser for the command
+        """
+        parser.add_argument(
+            "--batch-size", type=int, default=10, help="Jobs to claim at a time"
+        )
+        parser.add_argument(
+            "--visibility-timeout",
+            type=int,
+            default=300,
+            help="Seconds before an unfinished job can be claimed by another worker",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the queue is empty",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Run a single batch and exit"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Run the worker loop.
+
+        Args:
+            args: Positional arguments
+            options: Command options
+        """
+        while True:
+            processed = run_pending(
+                limit=options["batch_size"],
+                visibility_timeout=options["visibility_timeout"],
+            )
+            if options["once"]:
+                self.stdout.write(f"Processed {processed} job(s)")
+                return
+            if not processed:
+                time.sleep(options["sleep"])
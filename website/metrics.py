@@ -0,0 +1,346 @@
+"""In-process request metrics exposed in the Prometheus text format."""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import Template as DjangoTemplate
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+@dataclass(slots=True)
+class RequestStats:
+    """Database and template work done while handling one request."""
+
+    queries: int = 0
+    query_seconds: float = 0.0
+    template_seconds: float = 0.0
+
+
+current_stats: ContextVar[RequestStats | None] = ContextVar(
+    "current_stats", default=None
+)
+
+
+class Histogram:
+    """
+    Histogram of observations grouped by label values.
+
+    Bucket counts are kept per bucket and only made cumulative when exposed,
+    so observing is a bisect and three additions under a lock.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...],
+        buckets: tuple[float, ...],
+    ):
+        """
+        Initialise Histogram.
+
+        Args:
+            name: Metric name
+            documentation: HELP text of the metric
+            label_names: Names of the labels observations are grouped by
+            buckets: Upper bounds of the buckets, in increasing order
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: dict[tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple[str, ...]):
+        """
+        Record an observation.
+
+        Args:
+            value: Observed value
+            labels: Label values, in the order of label_names
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        """Drop every observation."""
+        with self._lock:
+            self._series.clear()
+
+    def expose(self) -> list[str]:
+        """
+        Render the histogram in the Prometheus text format.
+
+        Returns:
+            Lines of the exposition
+        """
+        with self._lock:
+            series = [
+                (labels, list(counts), total, count)
+                for labels, (counts, total, count) in self._series.items()
+            ]
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, counts, total, count in sorted(series):
+            label_text = ",".join(
+                f'{name}="{escape_label(value)}"'
+                for name, value in zip(self.label_names, labels, strict=True)
+            )
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for bound, bucket_count in zip(
+                (*self.buckets, "+Inf"), counts, strict=True
+            ):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+def escape_label(value: str) -> str:
+    """
+    Escape a label value for the Prometheus text format.
+
+    Args:
+        value: Label value
+
+    Returns:
+        Escaped label value
+    """
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+class RequestMetrics:
+    """
+    The histograms recorded for every request.
+
+    Observations are grouped by URL name and, when tenant_labels is set, by
+    subdomain. Every worker process keeps its own histograms, so each process
+    has to be scraped on its own.
+    """
+
+    def __init__(self, tenant_labels: bool = False):
+        """
+        Initialise RequestMetrics.
+
+        Args:
+            tenant_labels: Whether to group observations by subdomain as well
+        """
+        self.tenant_labels = tenant_labels
+        label_names = ("view", "tenant") if tenant_labels else ("view",)
+        self.request_seconds = Histogram(
+            "devfaq_request_duration_seconds",
+            "Wall time spent handling a request.",
+            label_names,
+            LATENCY_BUCKETS,
+        )
+        self.queries = Histogram(
+            "devfaq_request_db_queries",
+            "Database queries made while handling a request.",
+            label_names,
+            QUERY_BUCKETS,
+        )
+        self.query_seconds = Histogram(
+            "devfaq_request_db_duration_seconds",
+            "Time spent in database queries while handling a request.",
+            label_names,
+            LATENCY_BUCKETS,
+        )
+        self.template_seconds = Histogram(
+            "devfaq_request_template_duration_seconds",
+            "Time spent rendering templates while handling a request.",
+            label_names,
+            LATENCY_BUCKETS,
+        )
+        self.response_bytes = Histogram(
+            "devfaq_response_size_bytes",
+            "Size of the response body.",
+            label_names,
+            SIZE_BUCKETS,
+        )
+        self.histograms = (
+            self.request_seconds,
+            self.queries,
+            self.query_seconds,
+            self.template_seconds,
+            self.response_bytes,
+        )
+
+    def labels(self, view: str, tenant: str) -> tuple[str, ...]:
+        """
+        Build the label values for a request.
+
+        Args:
+            view: URL name the request resolved to
+            tenant: Subdomain the request was made on
+
+        Returns:
+            Label values in the order of the label names
+        """
+        return (view, tenant) if self.tenant_labels else (view,)
+
+    def observe(
+        self,
+        labels: tuple[str, ...],
+        seconds: float,
+        stats: RequestStats,
+        size: int | None,
+    ):
+        """
+        Record a handled request.
+
+        Args:
+            labels: Label values for the request
+            seconds: Wall time spent handling the request
+            stats: Database and template work done for the request
+            size: Size of the response body, None if it is not known
+        """
+        self.request_seconds.observe(seconds, labels)
+        self.queries.observe(stats.queries, labels)
+        self.query_seconds.observe(stats.query_seconds, labels)
+        self.template_seconds.observe(stats.template_seconds, labels)
+        if size is not None:
+            self.response_bytes.observe(size, labels)
+
+    def clear(self):
+        """Drop every observation."""
+        for histogram in self.histograms:
+            histogram.clear()
+
+    def expose(self) -> str:
+        """
+        Render every histogram in the Prometheus text format.
+
+        Returns:
+            The exposition
+        """
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.expose())
+        return "\n".join(lines) + "\n"
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Count a query and its duration against the current request.
+
+    Installed as an execute wrapper on every database connection.
+
+    Args:
+        execute: Next function in the execute wrapper chain
+        sql: SQL being executed
+        params: Query parameters
+        many: True for executemany
+        context: Connection and cursor the query runs on
+
+    Returns:
+        Result of executing the query
+    """
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.query_seconds += time.perf_counter() - start
+        stats.queries += 1
+
+
+def install_query_recorder(connection):
+    """
+    Install record_query on a connection if it is not installed yet.
+
+    Args:
+        connection: DatabaseWrapper that has connected
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate(DjangoTemplate):
+    """Django template adding its render time to the current request."""
+
+    @contextmanager
+    def timed(self):
+        """Add the time spent in the block to the current request."""
+        stats = current_stats.get()
+        if stats is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats.template_seconds += time.perf_counter() - start
+
+    def render(self, context=None, request=None):
+        """
+        Render the template.
+
+        Args:
+            context: Template context
+            request: HttpRequest the template is rendered for
+
+        Returns:
+            Rendered text
+        """
+        with self.timed():
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    DjangoTemplates backend timing every template it renders.
+
+    Only top level renders are timed, included and extended templates are
+    rendered by the engine and counted as part of the template using them.
+    """
+
+    def from_string(self, template_code):
+        """
+        Compile a template from a string.
+
+        Args:
+            template_code: Source of the template
+
+        Returns:
+            TimedTemplate for the source
+        """
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        """
+        Load a template by name.
+
+        Args:
+            template_name: Name of the template
+
+        Returns:
+            TimedTemplate for the name
+        """
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+request_metrics = RequestMetrics(tenant_labels=settings.METRICS_TENANT_LABELS)
@@ -0,0 +1,525 @@
+"""Middleware for the website."""
+
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from website.helpers import get_host_details
+from website.metrics import RequestStats, current_stats, request_metrics
+from website.pagecache import page_cache
+from website.registry import site_registry
+from website.responses import negotiate
+from website.routers import (
+    PRIMARY_COOKIE,
+    RequestRouting,
+    TenantShard,
+    current_routing,
+    current_tenant,
+)
+
+
+class MetricsMiddleware:
+    """
+    Record wall time, database work, template time and size per URL name.
+
+    Should be first in MIDDLEWARE so the wall time covers the whole chain.
+    Queries and templates are attributed through a context variable, which
+    follows the request into the worker threads async views hop to. The
+    RequestStats is also left on the request as request.request_stats.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """
+        Initialise MetricsMiddleware.
+
+        Args:
+            get_response: Next handler in the middleware chain
+        """
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        """
+        Handle the request and record its metrics.
+
+        Args:
+            request: HttpRequest object
+
+        Returns:
+            HttpResponse from the rest of the chain
+        """
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = request.request_stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.record(request, response, time.perf_counter() - start, stats)
+        return response
+
+    async def __acall__(self, request):
+        """
+        Handle the request and record its metrics.
+
+        Args:
+            request: HttpRequest object
+
+        Returns:
+            HttpResponse from the rest of the chain
+        """
+        stats = request.request_stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.record(request, response, time.perf_counter() - start, stats)
+        return response
+
+    def record(self, request, response, seconds: float, stats: RequestStats):
+        """
+        Record the metrics of a handled request.
+
+        Args:
+            request: HttpRequest object
+            response: Response for the request
+            seconds: Wall time spent handling the request
+            stats: Database and template work done for the request
+        """
+        resolver_match = getattr(request, "resolver_match", None)
+        view = (resolver_match.url_name if resolver_match else None) or "unresolved"
+        host_details = getattr(request, "host_details", None)
+        tenant = host_details.subdomain if host_details else ""
+        if response.has_header("Content-Length"):
+            size = int(response["Content-Length"])
+        elif response.streaming:
+            size = None
+        else:
+            size = len(response.content)
+        request_metrics.observe(
+            request_metrics.labels(view, tenant), seconds, stats, size
+        )
+
+
+class ReplicaMiddleware:
+    """
+    Send the reads of views marked with read_from_replica to a replica.
+
+    Only GET and HEAD requests are routed to replicas. A request that writes
+    sets a short lived cookie keeping the visitor's next requests on the
+    primary, so they read their own writes whatever the replication lag.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """
+        Initialise ReplicaMiddleware.
+
+        Args:
+            get_response: Next handler in the middleware chain
+        """
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        """
+        Track the routing of the request and pin writers to the primary.
+
+        Args:
+            request: HttpRequest object
+
+        Returns:
+            HttpResponse from the rest of the chain
+        """
+        if self.async_mode:
+            return self.__acall__(request)
+        routing = RequestRouting()
+        token = current_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.pin(response, routing)
+
+    async def __acall__(self, request):
+        """
+        Track the routing of the request and pin writers to the primary.
+
+        Args:
+            request: HttpRequest object
+
+        Returns:
+            HttpResponse from the rest of the chain
+        """
+        routing = RequestRouting()
+        token = current_routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.pin(response, routing)
+
+    def pin(self, response, routing: RequestRouting):
+        """
+        Keep the visitor on the primary for a while if the request wrote.
+
+        Args:
+            response: Response for the request
+            routing: Routing of the request
+
+        Returns:
+            The response
+        """
+        if routing.wrote:
+            response.set_cookie(
+                PRIMARY_COOKIE,
+                "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                domain=settings.SESSION_COOKIE_DOMAIN,
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Let a read-only view read from a replica.
+
+        Args:
+            request: HttpRequest object
+            view_func: View the request resolved to
+            view_args: Positional arguments for the view
+            view_kwargs: Keyword arguments for the view
+        """
+        self.route(request, view_func)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Let a read-only view read from a replica.
+
+        Args:
+            request: HttpRequest object
+            view_func: View the request resolved to
+            view_args: Positional arguments for the view
+            view_kwargs: Keyword arguments for the view
+        """
+        self.route(request, view_func)
+
+    def route(self, request, view_func):
+        """
+        Mark the request as read-only if the view and visitor allow it.
+
+        Args:
+            request: HttpRequest object
+            view_func: View the request resolved to
+        """
+        routing = current_routing.get()
+        if (
+            routing is not None
+            and getattr(view_func, "read_from_replica", False)
+            and request.method in ("GET", "HEAD")
+            and PRIMARY_COOKIE not in request.COOKIES
+        ):
+            routing.use_replica = True
+
+
+class TenantMiddleware:
+    """
+    Resolve the tenant from the Host header once per request.
+
+    Runs natively in both modes, under ASGI the site lookup uses the async
+    cache and ORM instead of a thread hop for the whole middleware. The site's
+    shard is set as the current tenant, which ShardRouter routes the
+    request's tenant queries by.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        """
+        Initialise TenantMiddleware.
+
+        Args:
+            get_response: Next handler in the middleware chain
+        """
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        """
+        Attach the parsed host details and the tenant site to the request.
+
+        request.site is a SiteRecord from the site registry, None when there is
+        no subdomain or no site for it.
+
+        Args:
+            request: HttpRequest object
+
+        Returns:
+            HttpResponse from the rest of the chain
+        """
+        if self.async_mode:
+            return self.__acall__(request)
+        host_details = get_host_details(request=request)
+        request.host_details = host_details
+        request.site = (
+            site_registry.get(host_details.subdomain)
+            if host_details.subdomain
+            else None
+        )
+        token = current_tenant.set(self.tenant(request.site))
+        try:
+            return self.get_response(request)
+        finally:
+            current_tenant.reset(token)
+
+    async def __acall__(self, request):
+        """
+        Attach the parsed host details and the tenant site to the request.
+
+        Args:
+            request: HttpRequest object
+
+        Returns:
+            HttpResponse from the rest of the chain
+        """
+        host_details = get_host_details(request=request)
+        request.host_details = host_details
+        request.site = (
+            await site_registry.aget(host_details.subdomain)
+            if host_details.subdomain
+            else None
+        )
+        token = current_tenant.set(self.tenant(request.site))
+        try:
+            return await self.get_response(request)
+        finally:
+            current_tenant.reset(token)
+
+    def tenant(self, site) -> TenantShard | None:
+        """
+        Build the current tenant for a request.
+
+        Args:
+            site: SiteRecord the request is for, None if there is none
+
+        Returns:
+            TenantShard for the site, None without a site
+        """
+        if site is None:
+            return None
+        return TenantShard(site_id=site.id, shard=site.shard)
+
+
+class PageCacheMiddleware:
+    """
+    Serve views marked with cache_tenant_page from the page cache.
+
+    Only GET and HEAD requests without a session cookie are cached, every one
+    of them sees the same anonymous page. Responses setting cookies or marked
+    private are never stored. Under ASGI the cache reads and writes of a
+    request are each made in one worker thread hop, requests for views that
+    are not cached never leave the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+    uncacheable_directives = frozenset({"private", "no-cache", "no-store"})
+
+    def __init__(self, get_response):
+        """
+        Initialise PageCacheMiddleware.
+
+        Args:
+            get_response: Next handler in the middleware chain
+        """
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        """
+        Store the rendered page if process_view found it missing or stale.
+
+        Args:
+            request: HttpRequest object
+
+        Returns:
+            HttpResponse from the rest of the chain
+        """
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.store(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        """
+        Store the rendered page if process_view found it missing or stale.
+
+        Args:
+            request: HttpRequest object
+
+        Returns:
+            HttpResponse from the rest of the chain
+        """
+        response = await self.get_response(request)
+        if getattr(request, "page_cache_entry", None) is None:
+            return response
+        return await sync_to_async(self.store, thread_sensitive=False)(
+            request, response
+        )
+
+    def store(self, request, response):
+        """
+        Store a rendered page in the page cache.
+
+        Args:
+            request: HttpRequest object
+            response: Response rendered by the view
+
+        Returns:
+            The response
+        """
+        entry = getattr(request, "page_cache_entry", None)
+        if entry is None:
+            return response
+
+        key, version, locked = entry
+        try:
+            if self.storable(response):
+                page_cache.set(key, version, response)
+                response.headers["X-Page-Cache"] = "miss"
+        finally:
+            if locked:
+                page_cache.release(key)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Answer from the page cache when the page is fresh or being rendered.
+
+        Args:
+            request: HttpRequest object
+            view_func: View the request resolved to
+            view_args: Positional arguments for the view
+            view_kwargs: Keyword arguments for the view
+
+        Returns:
+            Cached HttpResponse, None to render the page
+        """
+        if not self.cacheable(request, view_func):
+            return None
+        return self.lookup(request)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Answer from the page cache when the page is fresh or being rendered.
+
+        Args:
+            request: HttpRequest object
+            view_func: View the request resolved to
+            view_args: Positional arguments for the view
+            view_kwargs: Keyword arguments for the view
+
+        Returns:
+            Cached HttpResponse, None to render the page
+        """
+        if not self.cacheable(request, view_func):
+            return None
+        return await sync_to_async(self.lookup, thread_sensitive=False)(request)
+
+    def cacheable(self, request, view_func) -> bool:
+        """
+        Check whether a request may be answered from the page cache.
+
+        Args:
+            request: HttpRequest object
+            view_func: View the request resolved to
+
+        Returns:
+            True if the view is marked and the request is anonymous
+        """
+        return (
+            getattr(view_func, "cache_tenant_page", False)
+            and request.method in ("GET", "HEAD")
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        )
+
+    def lookup(self, request):
+        """
+        Get the cached page for a request, taking the lock to render it.
+
+        Only one worker renders a missing or stale page. The others serve the
+        stale copy or, when there is none, wait for the page to be stored and
+        render it themselves if it is not.
+
+        Args:
+            request: HttpRequest object
+
+        Returns:
+            Cached HttpResponse, None to render the page
+        """
+        subdomain = request.host_details.subdomain
+        negotiation = negotiate(request)
+        key = page_cache.page_key(
+            subdomain=subdomain,
+            full_path=request.get_full_path(),
+            content_type=negotiation.content_type or "*/*",
+            htmx=negotiation.htmx,
+        )
+        version = page_cache.version(subdomain)
+        page = page_cache.get(key)
+        if (
+            page is not None
+            and page.version == version
+            and page.fresh_until > time.time()
+        ):
+            return page.to_response("hit")
+        locked = page_cache.acquire(key)
+        if not locked:
+            if page is not None:
+                return page.to_response("stale")
+            # Another worker is rendering a page nobody has a copy of yet
+            page = page_cache.wait(key)
+            if page is not None:
+                return page.to_response("hit")
+        request.page_cache_entry = (key, version, locked)
+        return None
+
+    def storable(self, response) -> bool:
+        """
+        Check whether a response may be shared between anonymous visitors.
+
+        Args:
+            response: Rendered response
+
+        Returns:
+            True if the response can be stored
+        """
+        if response.status_code != 200 or response.streaming or response.cookies:
+            return False
+        directives = {
+            directive.split("=")[0].strip().lower()
+            for directive in response.get("Cache-Control", "").split(",")
+        }
+        return not directives & self.uncacheable_directives
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_existing_logos_processed(apps, schema_editor):
+    """Logos uploaded before the job queue were resized inline."""
+    Site = apps.get_model("website", "Site")
+    Site.objects.update(logo_processed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("website", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="site",
+            name="logo_processed",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_existing_logos_processed, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="Job",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100)),
+                ("payload", models.JSONField(blank=True, default=dict)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("max_attempts", models.PositiveIntegerField(default=5)),
+                ("run_after", models.DateTimeField(default=django.utils.timezone.now)),
+                ("locked_until", models.DateTimeField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True, default="")),
+                ("created", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "run_after"],
+                        name="website_job_status_4db024_idx",
+                    ),
+                    models.Index(
+                        fields=["status", "locked_until"],
+                        name="website_job_status_93c132_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
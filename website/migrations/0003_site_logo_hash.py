@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("website", "0002_job_site_logo_processed"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="site",
+            name="logo_hash",
+            field=models.CharField(
+                blank=True, db_index=True, default="", max_length=64
+            ),
+        ),
+    ]
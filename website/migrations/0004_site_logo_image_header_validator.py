@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:36
+
+from django.db import migrations, models
+
+import website.models
+import website.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("website", "0003_site_logo_hash"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="site",
+            name="logo",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                upload_to=website.models.logo_file_name,
+                validators=[
+                    website.validators.file_size_validator,
+                    website.validators.image_header_validator,
+                ],
+            ),
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:45
+
+from django.db import migrations
+
+ROLES = ("owner", "contributor")
+
+
+def site_permissions(apps):
+    """Get the per-subdomain permissions create_permissions used to add."""
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    Permission = apps.get_model("auth", "Permission")
+    content_type = ContentType.objects.filter(
+        app_label="website", model="permissionmanagement"
+    ).first()
+    if content_type is None:
+        return Permission.objects.none()
+    return Permission.objects.filter(content_type=content_type)
+
+
+def permissions_to_memberships(apps, schema_editor):
+    """Replace <subdomain>_<role> permissions with SiteMembership rows."""
+    User = apps.get_model("auth", "User")
+    Site = apps.get_model("website", "Site")
+    SiteMembership = apps.get_model("website", "SiteMembership")
+    UserPermission = User.user_permissions.through
+
+    permissions = site_permissions(apps)
+    site_ids = dict(Site.objects.values_list("subdomain", "id"))
+    grants = UserPermission.objects.filter(permission__in=permissions).values_list(
+        "user_id", "permission__codename"
+    )
+    memberships = []
+    for user_id, codename in grants.iterator():
+        subdomain, _, role = codename.rpartition("_")
+        if role in ROLES and subdomain in site_ids:
+            memberships.append(
+                SiteMembership(user_id=user_id, site_id=site_ids[subdomain], role=role)
+            )
+    SiteMembership.objects.bulk_create(
+        memberships, batch_size=1000, ignore_conflicts=True
+    )
+    permissions.delete()
+
+
+def memberships_to_permissions(apps, schema_editor):
+    """Recreate the <subdomain>_<role> permissions from SiteMembership rows."""
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    Permission = apps.get_model("auth", "Permission")
+    User = apps.get_model("auth", "User")
+    Site = apps.get_model("website", "Site")
+    SiteMembership = apps.get_model("website", "SiteMembership")
+    UserPermission = User.user_permissions.through
+
+    content_type, _ = ContentType.objects.get_or_create(
+        app_label="website", model="permissionmanagement"
+    )
+    names = {"owner": "Owner of {}", "contributor": "Contributor to {}"}
+    Permission.objects.bulk_create(
+        [
+            Permission(
+                codename=f"{subdomain}_{role}",
+                name=names[role].format(subdomain),
+                content_type=content_type,
+            )
+            for subdomain in Site.objects.values_list("subdomain", flat=True)
+            for role in ROLES
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    permission_ids = dict(
+        Permission.objects.filter(content_type=content_type).values_list(
+            "codename", "id"
+        )
+    )
+    UserPermission.objects.bulk_create(
+        [
+            UserPermission(
+                user_id=user_id, permission_id=permission_ids[f"{subdomain}_{role}"]
+            )
+            for user_id, subdomain, role in SiteMembership.objects.values_list(
+                "user_id", "site__subdomain", "role"
+            ).iterator()
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("website", "0006_sitemembership"),
+    ]
+
+    operations = [
+        migrations.RunPython(permissions_to_memberships, memberships_to_permissions),
+    ]
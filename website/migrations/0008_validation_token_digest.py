@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:45
+
+import hashlib
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def hash_outstanding_tokens(apps, schema_editor):
+    """Store outstanding tokens as digests, their expiry starts now."""
+    Validation = apps.get_model("website", "Validation")
+    now = timezone.now()
+    validations = []
+    for validation in Validation.objects.exclude(
+        random_validation_string__isnull=True
+    ).exclude(random_validation_string=""):
+        validation.token_digest = hashlib.sha256(
+            validation.random_validation_string.encode()
+        ).hexdigest()
+        validation.token_created = now
+        validations.append(validation)
+    Validation.objects.bulk_update(
+        validations, ["token_digest", "token_created"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("website", "0007_migrate_site_permissions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="validation",
+            name="token_created",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="validation",
+            name="token_digest",
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(hash_outstanding_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="validation",
+            name="random_validation_string",
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:05
+
+from django.db import migrations
+
+LOWER_INDEXES = {
+    "website_auth_user_email_lower": "email",
+    "website_auth_user_username_lower": "username",
+}
+
+
+def create_lower_indexes(apps, schema_editor):
+    """Index auth_user for case insensitive registration checks."""
+    # Build the indexes without blocking registrations on Postgres
+    concurrently = (
+        "CONCURRENTLY " if schema_editor.connection.vendor == "postgresql" else ""
+    )
+    for name, column in LOWER_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX {concurrently}IF NOT EXISTS {schema_editor.quote_name(name)}"
+            f" ON auth_user (LOWER({schema_editor.quote_name(column)}))"
+        )
+
+
+def drop_lower_indexes(apps, schema_editor):
+    """Drop the case insensitive auth_user indexes."""
+    for name in LOWER_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(name)}")
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("website", "0008_validation_token_digest"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_lower_indexes, drop_lower_indexes),
+    ]
@@ -0,0 +1,115 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SQLITE_INDEX = [
+    "CREATE VIRTUAL TABLE website_faqentry_fts USING fts5("
+    "site, question, answer, content='', tokenize='porter unicode61')",
+    "CREATE TRIGGER website_faqentry_fts_insert AFTER INSERT ON website_faqentry "
+    "BEGIN "
+    "INSERT INTO website_faqentry_fts (rowid, site, question, answer) "
+    "VALUES (new.id, 's' || new.site_id, new.question, new.answer); "
+    "END",
+    "CREATE TRIGGER website_faqentry_fts_delete AFTER DELETE ON website_faqentry "
+    "BEGIN "
+    "INSERT INTO website_faqentry_fts "
+    "(website_faqentry_fts, rowid, site, question, answer) "
+    "VALUES ('delete', old.id, 's' || old.site_id, old.question, old.answer); "
+    "END",
+    "CREATE TRIGGER website_faqentry_fts_update "
+    "AFTER UPDATE OF site_id, question, answer ON website_faqentry "
+    "BEGIN "
+    "INSERT INTO website_faqentry_fts "
+    "(website_faqentry_fts, rowid, site, question, answer) "
+    "VALUES ('delete', old.id, 's' || old.site_id, old.question, old.answer); "
+    "INSERT INTO website_faqentry_fts (rowid, site, question, answer) "
+    "VALUES (new.id, 's' || new.site_id, new.question, new.answer); "
+    "END",
+]
+SQLITE_DROP_INDEX = [
+    "DROP TRIGGER IF EXISTS website_faqentry_fts_update",
+    "DROP TRIGGER IF EXISTS website_faqentry_fts_delete",
+    "DROP TRIGGER IF EXISTS website_faqentry_fts_insert",
+    "DROP TABLE IF EXISTS website_faqentry_fts",
+]
+POSTGRES_INDEX = [
+    "ALTER TABLE website_faqentry ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', question), 'A') || "
+    "setweight(to_tsvector('english', answer), 'B')"
+    ") STORED",
+    "CREATE INDEX website_faqentry_search_vector "
+    "ON website_faqentry USING GIN (search_vector)",
+]
+POSTGRES_DROP_INDEX = [
+    "DROP INDEX IF EXISTS website_faqentry_search_vector",
+    "ALTER TABLE website_faqentry DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def create_search_index(apps, schema_editor):
+    """Create the full text index website.search queries."""
+    vendor = schema_editor.connection.vendor
+    statements = {"sqlite": SQLITE_INDEX, "postgresql": POSTGRES_INDEX}
+    for statement in statements.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    """Drop the full text index."""
+    vendor = schema_editor.connection.vendor
+    statements = {"sqlite": SQLITE_DROP_INDEX, "postgresql": POSTGRES_DROP_INDEX}
+    for statement in statements.get(vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("website", "0009_auth_user_lower_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FAQEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("question", models.CharField(max_length=255)),
+                ("answer", models.TextField()),
+                ("ordering", models.PositiveIntegerField(default=0)),
+                (
+                    "site",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="faq_entries",
+                        to="website.site",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "FAQ entry",
+                "verbose_name_plural": "FAQ entries",
+                "ordering": ["site", "ordering", "id"],
+                "indexes": [
+                    models.Index(
+                        fields=["site", "ordering"],
+                        name="website_faq_site_id_45f951_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(
+            create_search_index,
+            drop_search_index,
+            hints={"model_name": "faqentry"},
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:40
+
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+from django.db import migrations
+
+STATIC_LOGOS = "static/logos/"
+
+
+def move_logos_to_media(apps, schema_editor):
+    """Move uploaded logos out of the static tree into the media storage."""
+    Site = apps.get_model("website", "Site")
+    storage = storages["default"]
+    for site in Site.objects.filter(logo__startswith=STATIC_LOGOS):
+        old_path = Path(settings.BASE_DIR, site.logo.name)
+        if not old_path.is_file():
+            continue
+        with open(old_path, "rb") as file_h:
+            name = storage.save(
+                storage.generate_filename(f"logos/{old_path.name}"), File(file_h)
+            )
+        Site.objects.filter(id=site.id).update(logo=name)
+        old_path.unlink()
+
+
+def move_logos_to_static(apps, schema_editor):
+    """Move uploaded logos back into the static tree."""
+    Site = apps.get_model("website", "Site")
+    storage = storages["default"]
+    for site in Site.objects.filter(logo__startswith="logos/"):
+        old_path = Path(storage.path(site.logo.name))
+        if not old_path.is_file():
+            continue
+        name = f"{STATIC_LOGOS}{old_path.name}"
+        shutil.move(old_path, Path(settings.BASE_DIR, name))
+        Site.objects.filter(id=site.id).update(logo=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("website", "0010_faqentry"),
+    ]
+
+    operations = [
+        migrations.RunPython(move_logos_to_media, move_logos_to_static),
+    ]
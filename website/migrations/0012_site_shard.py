@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# SQLite rebuilds website_faqentry to drop the foreign key constraint, which
+# drops the triggers keeping the search index of migration 0010 up to date
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS website_faqentry_fts_insert "
+    "AFTER INSERT ON website_faqentry "
+    "BEGIN "
+    "INSERT INTO website_faqentry_fts (rowid, site, question, answer) "
+    "VALUES (new.id, 's' || new.site_id, new.question, new.answer); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS website_faqentry_fts_delete "
+    "AFTER DELETE ON website_faqentry "
+    "BEGIN "
+    "INSERT INTO website_faqentry_fts "
+    "(website_faqentry_fts, rowid, site, question, answer) "
+    "VALUES ('delete', old.id, 's' || old.site_id, old.question, old.answer); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS website_faqentry_fts_update "
+    "AFTER UPDATE OF site_id, question, answer ON website_faqentry "
+    "BEGIN "
+    "INSERT INTO website_faqentry_fts "
+    "(website_faqentry_fts, rowid, site, question, answer) "
+    "VALUES ('delete', old.id, 's' || old.site_id, old.question, old.answer); "
+    "INSERT INTO website_faqentry_fts (rowid, site, question, answer) "
+    "VALUES (new.id, 's' || new.site_id, new.question, new.answer); "
+    "END",
+]
+
+
+def create_search_triggers(apps, schema_editor):
+    """Recreate the search index triggers after website_faqentry was rebuilt."""
+    if schema_editor.connection.vendor == "sqlite":
+        for statement in SQLITE_TRIGGERS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("website", "0011_move_logos_to_media"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="site",
+            name="shard",
+            field=models.CharField(default="default", max_length=100),
+        ),
+        migrations.RunPython(
+            migrations.RunPython.noop,
+            create_search_triggers,
+            hints={"model_name": "faqentry"},
+        ),
+        migrations.AlterField(
+            model_name="faqentry",
+            name="site",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="faq_entries",
+                to="website.site",
+            ),
+        ),
+        migrations.RunPython(
+            create_search_triggers,
+            migrations.RunPython.noop,
+            hints={"model_name": "faqentry"},
+        ),
+    ]
@@ -1,10 +1,24 @@
 """Models for the website."""
 
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.files.storage import default_storage
+from django.db import models, router, transaction
+from django.urls import reverse
+from django.utils import timezone
 
-from website.validators import file_size_validator, subdomain_validator
+from website.logos import LOGO_VARIANTS
+from website.storage import asset_url
+from website.validators import (
+    file_size_validator,
+    image_header_validator,
+    subdomain_validator,
+)
 
 
 def logo_file_name(instance: "Site", filename: str) -> str:
@@ -17,12 +31,39 @@ def logo_file_name(instance: "Site", filename: str) -> str:
 
     Returns: Path and name of the logo file
     """
-    path: str = "static/logos/"
+    path: str = "logos/"
     ext: str = filename.split(".")[-1]
     new_filename: str = f"{path}{instance.subdomain}.{ext}"
     return new_filename
 
 
+LOGO_PLACEHOLDER = "images/logo_placeholder.svg"
+
+
+def logo_url(logo: str | None, logo_hash: str, processed: bool) -> str:
+    """
+    Calculate the URL to display for a site logo.
+
+    Args:
+        logo: Stored name of the logo file
+        logo_hash: SHA-256 digest of the logo file
+        processed: True once the logo job has finished with the file
+
+    Returns: URL of the header logo, or of the placeholder while it is being processed
+    """
+    if not logo or not processed:
+        return asset_url(LOGO_PLACEHOLDER)
+    if logo_hash:
+        return reverse(
+            "network:logo_derivative",
+            kwargs={
+                "logo_hash": logo_hash,
+                "filename": LOGO_VARIANTS["header"].filename,
+            },
+        )
+    return default_storage.url(logo)
+
+
 class BiographyModel(models.Model):
     """Model to store user Biography information."""
 
@@ -65,7 +106,18 @@ class Site(models.Model):
         upload_to=logo_file_name,
         null=True,
         blank=True,
-        validators=[file_size_validator],
+        validators=[file_size_validator, image_header_validator],
+    )
+    logo_hash: models.CharField = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        db_index=True,
+    )
+    logo_processed: models.BooleanField = models.BooleanField(
+        default=False,
+        blank=False,
+        null=False,
     )
     live: models.BooleanField = models.BooleanField(
         default=False,
@@ -78,13 +130,411 @@ class Site(models.Model):
         null=True,
         on_delete=models.RESTRICT,
     )
+    shard: models.CharField = models.CharField(
+        max_length=100,
+        default="default",
+        blank=False,
+        null=False,
+    )
+
+    @property
+    def logo_url(self) -> str:
+        """URL of the logo, the placeholder until the logo job has run."""
+        return logo_url(self.logo.name, self.logo_hash, self.logo_processed)
+
+
+class TenantQuerySet(models.QuerySet):
+    """QuerySet for models stored on the shard of their site."""
+
+    def create(self, **kwargs):
+        """
+        Create an object on the shard of its site.
+
+        Unless a database was chosen with using(), the database is chosen for
+        the new instance, so website.routers.ShardRouter sees its site.
+
+        Args:
+            kwargs: Field values of the object
+
+        Returns:
+            The created object
+        """
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+class FAQEntry(models.Model):
+    """
+    Model for a question and answer on a site.
+
+    Entries are indexed for search by website.search, see migration 0010 for
+    the per database index it maintains. Entries are tenant rows stored on
+    the shard of their site, so the foreign key has no database constraint.
+    """
+
+    site: models.ForeignKey = models.ForeignKey(
+        to=Site,
+        on_delete=models.CASCADE,
+        related_name="faq_entries",
+        db_constraint=False,
+    )
+    question: models.CharField = models.CharField(
+        max_length=255, blank=False, null=False
+    )
+    answer: models.TextField = models.TextField(blank=False, null=False)
+    ordering: models.PositiveIntegerField = models.PositiveIntegerField(default=0)
+
+    objects = TenantQuerySet.as_manager()
+
+    class Meta:
+        """Order entries within a site."""
+
+        ordering = ["site", "ordering", "id"]
+        indexes = [models.Index(fields=["site", "ordering"])]
+        verbose_name = "FAQ entry"
+        verbose_name_plural = "FAQ entries"
+
+
+class SiteMembership(models.Model):
+    """Model recording the role a user has on a site."""
+
+    OWNER = "owner"
+    CONTRIBUTOR = "contributor"
+    ROLE_CHOICES = (
+        (OWNER, "Owner"),
+        (CONTRIBUTOR, "Contributor"),
+    )
+
+    user: models.ForeignKey = models.ForeignKey(
+        to=User,
+        on_delete=models.CASCADE,
+        related_name="site_memberships",
+    )
+    site: models.ForeignKey = models.ForeignKey(
+        to=Site,
+        on_delete=models.CASCADE,
+        related_name="memberships",
+    )
+    role: models.CharField = models.CharField(max_length=20, choices=ROLE_CHOICES)
+
+    class Meta:
+        """Index memberships by user then site."""
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "site", "role"],
+                name="website_sitemembership_user_site_role",
+            ),
+        ]
+
+
+class QueueEntry(models.Model):
+    """Abstract model for rows processed by a polling worker."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    )
+
+    status: models.CharField = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    attempts: models.PositiveIntegerField = models.PositiveIntegerField(default=0)
+    max_attempts: models.PositiveIntegerField = models.PositiveIntegerField(default=5)
+    run_after: models.DateTimeField = models.DateTimeField(default=timezone.now)
+    locked_until: models.DateTimeField = models.DateTimeField(blank=True, null=True)
+    last_error: models.TextField = models.TextField(blank=True, default="")
+    created: models.DateTimeField = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """Mark QueueEntry as abstract."""
+
+        abstract = True
+
+    @staticmethod
+    def retry_delay(attempts: int) -> timedelta:
+        """
+        Calculate the backoff before a failed entry is retried.
+
+        Args:
+            attempts: Number of attempts made so far
+
+        Returns:
+            Delay before the next attempt
+        """
+        return timedelta(seconds=min(30 * 2 ** (attempts - 1), 3600))
+
+    def mark_done(self, *update_fields: str):
+        """
+        Record that the entry was processed.
+
+        Args:
+            update_fields: Further fields changed by a subclass to save
+        """
+        self.status = self.DONE
+        self.locked_until = None
+        self.save(update_fields=["status", "locked_until", *update_fields])
+
+    def mark_failed(self, error: str):
+        """
+        Record a failed attempt.
+
+        The entry is retried with exponential backoff until max_attempts is
+        reached, after which it is left in the failed state.
+
+        Args:
+            error: Description of the failure
+        """
+        self.last_error = error
+        self.locked_until = None
+        if self.attempts >= self.max_attempts:
+            self.status = self.FAILED
+        else:
+            self.status = self.PENDING
+            self.run_after = timezone.now() + self.retry_delay(self.attempts)
+        self.save(update_fields=["status", "run_after", "locked_until", "last_error"])
+
+
+class Job(QueueEntry):
+    """Model for background jobs processed by the run_jobs command."""
+
+    name: models.CharField = models.CharField(max_length=100)
+    payload: models.JSONField = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        """Index the columns the workers claim jobs by."""
+
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+            models.Index(fields=["status", "locked_until"]),
+        ]
+
+
+class OutboundEmail(QueueEntry):
+    """Model for emails waiting to be sent by the deliver_email command."""
+
+    sender: models.CharField = models.CharField(max_length=254)
+    recipient: models.CharField = models.CharField(max_length=254)
+    subject: models.CharField = models.CharField(max_length=255)
+    message: models.TextField = models.TextField()
+    sent_at: models.DateTimeField = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        """Index the columns the workers claim emails by."""
+
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+            models.Index(fields=["status", "locked_until"]),
+        ]
+
+    def mark_done(self, *update_fields: str):
+        """
+        Record that the email was sent.
+
+        Args:
+            update_fields: Further fields changed by a subclass to save
+        """
+        self.sent_at = timezone.now()
+        super().mark_done("sent_at", *update_fields)
 
 
 class Validation(models.Model):
-    """Model to handle user validation."""
+    """
+    Model to handle user validation.
+
+    Only the SHA-256 digest of the emailed token is stored, so a leaked table
+    cannot be used to validate accounts, and tokens expire after TOKEN_MAX_AGE.
+    """
+
+    TOKEN_MAX_AGE = timedelta(days=7)
+    RESEND_INTERVAL = timedelta(minutes=5)
+    VALIDATED = {"is_validated": True, "token_digest": None, "token_created": None}
 
     user: models.OneToOneField = models.OneToOneField(User, on_delete=models.CASCADE)
     is_validated: models.BooleanField = models.BooleanField(default=False)
-    random_validation_string: models.CharField = models.CharField(
-        max_length=64, blank=True, null=True
+    token_digest: models.CharField = models.CharField(
+        max_length=64, blank=True, null=True, unique=True
+    )
+    token_created: models.DateTimeField = models.DateTimeField(
+        blank=True, null=True, db_index=True
     )
+
+    @staticmethod
+    def hash_token(token: str) -> str:
+        """
+        Calculate the digest a validation token is stored as.
+
+        Args:
+            token: Token sent to the user
+
+        Returns:
+            Hex SHA-256 digest of the token
+        """
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @classmethod
+    def new_token(cls) -> tuple[str, dict[str, str | datetime]]:
+        """
+        Generate a validation token.
+
+        Returns:
+            Token to send to the user and the fields storing it
+        """
+        token = secrets.token_urlsafe(32)
+        return token, {
+            "token_digest": cls.hash_token(token),
+            "token_created": timezone.now(),
+        }
+
+    @classmethod
+    def create_for_user(cls, user: User) -> str:
+        """
+        Create the validation for a new user.
+
+        Args:
+            user: User to validate
+
+        Returns:
+            Token to send to the user
+        """
+        token, fields = cls.new_token()
+        cls.objects.create(user=user, **fields)
+        return token
+
+    @classmethod
+    async def acreate_for_user(cls, user: User) -> str:
+        """
+        Create the validation for a new user.
+
+        Args:
+            user: User to validate
+
+        Returns:
+            Token to send to the user
+        """
+        token, fields = cls.new_token()
+        await cls.objects.acreate(user=user, **fields)
+        return token
+
+    @classmethod
+    def reissue_token(cls, user: User) -> str | None:
+        """
+        Replace the token of a user who has not validated yet.
+
+        The token is replaced in one UPDATE, at most once every
+        RESEND_INTERVAL so resending cannot be used to flood an inbox.
+
+        Args:
+            user: User to validate
+
+        Returns:
+            Token to send to the user, None if the user is validated or was
+            sent a token less than RESEND_INTERVAL ago
+        """
+        token, fields = cls.new_token()
+        if cls.objects.filter(
+            models.Q(token_created__isnull=True)
+            | models.Q(token_created__lt=fields["token_created"] - cls.RESEND_INTERVAL),
+            user_id=user.pk,
+            is_validated=False,
+        ).update(**fields):
+            return token
+        if cls.objects.filter(user_id=user.pk).exists():
+            return None
+        # Users created outside registration, such as superusers, have no row
+        return cls.create_for_user(user)
+
+    @classmethod
+    def unexpired(cls, token: str) -> models.QuerySet:
+        """
+        Select the validation holding an unexpired token.
+
+        Args:
+            token: Token sent to the user
+
+        Returns:
+            QuerySet matching at most one validation on the token_digest index
+        """
+        return cls.objects.filter(
+            token_digest=cls.hash_token(token),
+            token_created__gte=timezone.now() - cls.TOKEN_MAX_AGE,
+        )
+
+    @classmethod
+    def validate_token(cls, token: str) -> bool:
+        """
+        Mark the validation holding an unexpired token as validated.
+
+        The validation is looked up and locked on the token_digest index, then
+        updated by primary key in the same transaction, so a token cannot be
+        used twice. The user id read with it makes the user's cached context
+        stale.
+
+        Args:
+            token: Token sent to the user
+
+        Returns:
+            True if the token was valid
+        """
+        from website.backends import user_contexts
+
+        using = router.db_for_write(cls)
+        with transaction.atomic(using=using, savepoint=False):
+            row = (
+                cls.unexpired(token)
+                .using(using)
+                .select_for_update()
+                .values_list("id", "user_id")
+                .first()
+            )
+            if row is None:
+                return False
+            validation_id, user_id = row
+            cls.objects.using(using).filter(id=validation_id).update(**cls.VALIDATED)
+            user_contexts.invalidate_on_commit(user_id)
+        return True
+
+    @classmethod
+    async def avalidate_token(cls, token: str) -> bool:
+        """
+        Mark the validation holding an unexpired token as validated.
+
+        Args:
+            token: Token sent to the user
+
+        Returns:
+            True if the token was valid
+        """
+        return await sync_to_async(cls.validate_token)(token)
+
+    @classmethod
+    def purge_expired_tokens(cls, batch_size: int = 1000) -> int:
+        """
+        Clear one batch of expired tokens.
+
+        Rows are selected by primary key on the token_created index and cleared
+        in a short UPDATE, so a large backlog never locks the whole table.
+
+        Args:
+            batch_size: Maximum number of tokens to clear
+
+        Returns:
+            Number of tokens cleared
+        """
+        expired_ids = list(
+            cls.objects.filter(token_created__lt=timezone.now() - cls.TOKEN_MAX_AGE)
+            .order_by("token_created")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        return cls.objects.filter(id__in=expired_ids).update(
+            token_digest=None, token_created=None
+        )
@@ -0,0 +1,85 @@
+"""Batched delivery of the email outbox."""
+
+import logging
+from smtplib import SMTPException
+
+from django.core.mail import EmailMessage, get_connection
+
+from website.jobs import claim
+from website.models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+
+def connect(connection, emails: list[OutboundEmail]) -> bool:
+    """
+    Open, or reopen, the connection to the mail server.
+
+    Args:
+        connection: Email backend to open
+        emails: Emails waiting to be sent, marked as failed if it cannot be
+
+    Returns:
+        True if the connection is open
+    """
+    try:
+        connection.close()
+        connection.open()
+    except Exception as error:
+        logger.exception("Unable to connect to the mail server")
+        for email in emails:
+            email.mark_failed(str(error))
+        return False
+    return True
+
+
+def deliver_outbox(batch_size: int = 50, visibility_timeout: int = 300) -> int:
+    """
+    Send a batch of queued emails over a single connection.
+
+    Failed emails are retried with backoff, once they run out of attempts they
+    are left in the failed state as dead letters. After an SMTP error the
+    connection is reopened for the rest of the batch.
+
+    Args:
+        batch_size: Maximum number of emails to send
+        visibility_timeout: Seconds before an unsent email can be reclaimed
+
+    Returns:
+        Number of emails sent
+    """
+    emails = claim(
+        OutboundEmail, limit=batch_size, visibility_timeout=visibility_timeout
+    )
+    if not emails:
+        return 0
+
+    connection = get_connection(fail_silently=False)
+    if not connect(connection, emails):
+        return 0
+
+    sent = 0
+    try:
+        for position, email in enumerate(emails):
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.message,
+                from_email=email.sender,
+                to=[email.recipient],
+                connection=connection,
+            )
+            try:
+                connection.send_messages([message])
+            except Exception as error:
+                logger.exception("Email %s to %s failed", email.id, email.recipient)
+                email.mark_failed(str(error))
+                if isinstance(error, SMTPException) and not connect(
+                    connection, emails[position + 1 :]
+                ):
+                    break
+                continue
+            email.mark_done()
+            sent += 1
+    finally:
+        connection.close()
+    return sent
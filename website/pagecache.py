@@ -0,0 +1,232 @@
+"""Per-tenant cache of rendered pages for anonymous visitors."""
+
+import hashlib
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+@dataclass(frozen=True, slots=True)
+class CachedPage:
+    """Rendered response stored in the page cache."""
+
+    version: int
+    fresh_until: float
+    status: int
+    content: bytes
+    headers: tuple[tuple[str, str], ...]
+
+    def to_response(self, state: str) -> HttpResponse:
+        """
+        Rebuild the response.
+
+        Args:
+            state: Value for the X-Page-Cache header, hit or stale
+
+        Returns:
+            HttpResponse equal to the stored one
+        """
+        response = HttpResponse(self.content, status=self.status)
+        for header, value in self.headers:
+            response.headers[header] = value
+        response.headers["X-Page-Cache"] = state
+        return response
+
+
+class PageCache:
+    """
+    Cache of rendered pages keyed by subdomain, path and content type.
+
+    Every subdomain has a version counter that is bumped when its site or its
+    content changes, a page rendered for an older version is stale. Stale pages
+    are kept for stale_timeout so that while one worker, holding a short lock,
+    renders the page again every other worker keeps serving the stale copy.
+    When no copy is stored at all the other workers wait up to miss_wait for
+    the one holding the lock to store it.
+    """
+
+    def __init__(
+        self,
+        cache_alias: str = "default",
+        key_prefix: str = "page-cache",
+        timeout: int = 60,
+        stale_timeout: int = 10 * 60,
+        lock_timeout: int = 30,
+        miss_wait: float = 2.0,
+        poll_interval: float = 0.05,
+    ):
+        """
+        Initialise PageCache.
+
+        Args:
+            cache_alias: Cache holding the pages, versions and locks
+            key_prefix: Prefix for the cache keys
+            timeout: Seconds a page is fresh for
+            stale_timeout: Seconds a page may be served stale for after that
+            lock_timeout: Seconds a worker may take to render a page
+            miss_wait: Seconds to wait for a page another worker is rendering
+            poll_interval: Seconds between checks for that page
+        """
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self.timeout = timeout
+        self.stale_timeout = stale_timeout
+        self.lock_timeout = lock_timeout
+        self.miss_wait = miss_wait
+        self.poll_interval = poll_interval
+
+    @property
+    def cache(self):
+        """Cache backend holding the pages."""
+        return caches[self.cache_alias]
+
+    def version_key(self, subdomain: str) -> str:
+        """
+        Calculate the version counter key for a subdomain.
+
+        Args:
+            subdomain: Subdomain the counter is for, empty for the main site
+
+        Returns:
+            Cache key of the counter
+        """
+        return f"{self.key_prefix}#version:{subdomain}"
+
+    def version(self, subdomain: str) -> int:
+        """
+        Get the current version of a subdomain's pages.
+
+        Args:
+            subdomain: Subdomain to get the version for
+
+        Returns:
+            The version counter
+        """
+        return self.cache.get(self.version_key(subdomain), 0)
+
+    def bump(self, subdomain: str):
+        """
+        Mark every cached page of a subdomain as stale.
+
+        Args:
+            subdomain: Subdomain whose site or content changed
+        """
+        key = self.version_key(subdomain)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, timeout=None)
+
+    def page_key(
+        self, subdomain: str, full_path: str, content_type: str, htmx: bool
+    ) -> str:
+        """
+        Calculate the key a page is stored under.
+
+        Args:
+            subdomain: Subdomain the page was requested on
+            full_path: Path and query string of the request
+            content_type: Content type negotiated for the request
+            htmx: Whether the page was requested by htmx
+
+        Returns:
+            Cache key of the page
+        """
+        path_hash = hashlib.md5(full_path.encode(), usedforsecurity=False).hexdigest()
+        variant = f"{content_type}{'+htmx' if htmx else ''}"
+        return f"{self.key_prefix}:{subdomain}:{variant}:{path_hash}"
+
+    def get(self, key: str) -> CachedPage | None:
+        """
+        Get a stored page, fresh or stale.
+
+        Args:
+            key: Cache key of the page
+
+        Returns:
+            The page, None if it is not stored
+        """
+        return self.cache.get(key)
+
+    def set(self, key: str, version: int, response: HttpResponse):
+        """
+        Store a rendered page.
+
+        Args:
+            key: Cache key of the page
+            version: Version of the subdomain the page was rendered for
+            response: Rendered response
+        """
+        page = CachedPage(
+            version=version,
+            fresh_until=time.time() + self.timeout,
+            status=response.status_code,
+            content=response.content,
+            headers=tuple(response.headers.items()),
+        )
+        self.cache.set(key, page, timeout=self.timeout + self.stale_timeout)
+
+    def acquire(self, key: str) -> bool:
+        """
+        Take the lock for rendering a page.
+
+        Args:
+            key: Cache key of the page
+
+        Returns:
+            True if this worker should render the page
+        """
+        return self.cache.add(f"{key}#lock", 1, timeout=self.lock_timeout)
+
+    def release(self, key: str):
+        """
+        Release the lock for rendering a page.
+
+        Args:
+            key: Cache key of the page
+        """
+        self.cache.delete(f"{key}#lock")
+
+    def wait(self, key: str) -> CachedPage | None:
+        """
+        Wait for the worker holding the lock to store a page.
+
+        Args:
+            key: Cache key of the page
+
+        Returns:
+            The page, None if the lock was released without storing it or
+            miss_wait passed
+        """
+        deadline = time.monotonic() + self.miss_wait
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            page = self.get(key)
+            if page is not None:
+                return page
+            if self.cache.get(f"{key}#lock") is None:
+                return None
+        return None
+
+
+def cache_tenant_page(view: Callable) -> Callable:
+    """
+    Mark a view as cacheable by PageCacheMiddleware.
+
+    Only views whose output depends on nothing but the tenant's Site and
+    content, the URL and the negotiated content type should be marked.
+
+    Args:
+        view: View to mark
+
+    Returns:
+        The view
+    """
+    view.cache_tenant_page = True
+    return view
+
+
+page_cache = PageCache()
@@ -0,0 +1,164 @@
+"""Provisioning new sites with their owners and background work."""
+
+from collections.abc import Iterable
+from dataclasses import dataclass
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.db import transaction
+
+from website.backends import clear_site_role_cache
+from website.models import Job, Site, SiteMembership
+from website.pagecache import page_cache
+from website.registry import site_registry
+
+
+@dataclass(slots=True)
+class SiteSpec:
+    """A site to provision."""
+
+    subdomain: str
+    description: str
+    owner: User
+    logo: File | None = None
+    roles: tuple[str, ...] = ("owner",)
+
+
+@dataclass(slots=True)
+class ProvisionedSite:
+    """The rows written for a provisioned site."""
+
+    site: Site
+    memberships: list[SiteMembership]
+    job: Job
+
+
+def provision_sites(
+    specs: Iterable[SiteSpec], batch_size: int | None = None
+) -> list[ProvisionedSite]:
+    """
+    Create sites, give their owners their roles and queue their logo jobs.
+
+    The sites, memberships and jobs are each written with one bulk INSERT in
+    a single transaction, so a failure leaves none of them behind. Logos are
+    stored before the transaction and deleted again if it fails. Once the
+    transaction commits the registry is primed with the new sites, their
+    pages are marked stale and the owners' cached roles are dropped.
+
+    Args:
+        specs: Sites to create
+        batch_size: Rows per INSERT, all rows in one INSERT by default
+
+    Returns:
+        The created sites with their memberships and jobs, in the order given
+
+    Raises:
+        ValidationError: If a site's fields are invalid, before anything is
+            written
+        IntegrityError: If a subdomain is taken, nothing is left written
+    """
+    specs = list(specs)
+    sites = [
+        Site(
+            subdomain=spec.subdomain,
+            description=spec.description,
+            created_by=spec.owner,
+        )
+        for spec in specs
+    ]
+    for site in sites:
+        # Uniqueness is left to the INSERT and the owner is a saved user
+        site.clean_fields(exclude=["logo", "created_by"])
+
+    stored = []
+    try:
+        for site, spec in zip(sites, specs, strict=True):
+            if spec.logo:
+                site.logo.save(spec.logo.name, spec.logo, save=False)
+                stored.append(site)
+
+        with transaction.atomic():
+            Site.objects.bulk_create(sites, batch_size=batch_size)
+            provisioned = [
+                ProvisionedSite(
+                    site=site,
+                    memberships=[
+                        SiteMembership(user=spec.owner, site=site, role=role)
+                        for role in spec.roles
+                    ],
+                    job=Job(name="process_logo", payload={"site_id": site.id}),
+                )
+                for site, spec in zip(sites, specs, strict=True)
+            ]
+            SiteMembership.objects.bulk_create(
+                [
+                    membership
+                    for result in provisioned
+                    for membership in result.memberships
+                ],
+                batch_size=batch_size,
+            )
+            Job.objects.bulk_create(
+                [result.job for result in provisioned], batch_size=batch_size
+            )
+
+            # Bulk inserts send no post_save signals, so do what the Site and
+            # SiteMembership receivers would
+            for site in sites:
+                transaction.on_commit(partial(site_registry.prime, site))
+                transaction.on_commit(partial(page_cache.bump, site.subdomain))
+            for owner in {spec.owner.pk: spec.owner for spec in specs}.values():
+                clear_site_role_cache(owner)
+    except BaseException:
+        for site in stored:
+            site.logo.delete(save=False)
+        raise
+    return provisioned
+
+
+def provision_site(
+    subdomain: str,
+    description: str,
+    owner: User,
+    logo: File | None = None,
+) -> ProvisionedSite:
+    """
+    Create a site owned by a user and queue its logo job.
+
+    Args:
+        subdomain: Subdomain of the site
+        description: Description of the site
+        owner: User creating the site
+        logo: Uploaded logo, if any
+
+    Returns:
+        The created site with its membership and job
+    """
+    return provision_sites(
+        [SiteSpec(subdomain=subdomain, description=description, owner=owner, logo=logo)]
+    )[0]
+
+
+async def aprovision_site(
+    subdomain: str,
+    description: str,
+    owner: User,
+    logo: File | None = None,
+) -> ProvisionedSite:
+    """
+    Create a site owned by a user and queue its logo job from async code.
+
+    Args:
+        subdomain: Subdomain of the site
+        description: Description of the site
+        owner: User creating the site
+        logo: Uploaded logo, if any
+
+    Returns:
+        The created site with its membership and job
+    """
+    return await sync_to_async(provision_site)(
+        subdomain=subdomain, description=description, owner=owner, logo=logo
+    )
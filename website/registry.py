@@ -0,0 +1,417 @@
+"""In-process registries for tenant data."""
+
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+
+from website.models import Site, logo_url
+from website.validators import subdomain_validator
+
+
+@dataclass(frozen=True, slots=True)
+class SiteRecord:
+    """Immutable snapshot of the Site columns tenant requests need."""
+
+    id: int
+    subdomain: str
+    description: str
+    logo: str | None
+    logo_hash: str
+    logo_processed: bool
+    live: bool
+    created_by_id: int | None
+    shard: str
+
+    @property
+    def logo_url(self) -> str:
+        """URL of the logo, the placeholder until the logo job has run."""
+        return logo_url(self.logo, self.logo_hash, self.logo_processed)
+
+
+class SiteRegistry:
+    """
+    Process-wide cache of Site rows keyed by subdomain.
+
+    Both hits and misses are cached. Every subdomain has a version counter in the
+    shared cache backend, entries are only trusted while their version matches,
+    so a change made by one worker is picked up by every other worker without a
+    database query. A global generation counter and a short change log let
+    SubdomainIndex follow changes incrementally.
+    """
+
+    change_log_size = 1000
+    change_log_timeout = 24 * 60 * 60
+
+    fields = (
+        "id",
+        "subdomain",
+        "description",
+        "logo",
+        "logo_hash",
+        "logo_processed",
+        "live",
+        "created_by_id",
+        "shard",
+    )
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        cache_alias: str = "default",
+        key_prefix: str = "site-registry",
+    ):
+        """
+        Initialise SiteRegistry.
+
+        Args:
+            max_size: Maximum number of subdomains to hold per process
+            cache_alias: Cache holding the shared version counters
+            key_prefix: Prefix for the version counter keys
+        """
+        self.max_size = max_size
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+        self._entries: OrderedDict[str, tuple[int, SiteRecord | None]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def cache(self):
+        """Cache backend holding the version counters."""
+        return caches[self.cache_alias]
+
+    def version_key(self, subdomain: str) -> str:
+        """
+        Calculate the version counter key for a subdomain.
+
+        Args:
+            subdomain: Subdomain the counter is for
+
+        Returns:
+            Cache key of the counter
+        """
+        return f"{self.key_prefix}:{subdomain}"
+
+    @property
+    def generation_key(self) -> str:
+        """Cache key of the counter bumped on every change to any site."""
+        return f"{self.key_prefix}#generation"
+
+    def change_key(self, generation: int) -> str:
+        """
+        Calculate the key recording which subdomain a generation changed.
+
+        Args:
+            generation: Generation the change was made in
+
+        Returns:
+            Cache key of the change
+        """
+        return f"{self.key_prefix}#change:{generation}"
+
+    def _incr(self, key: str) -> int:
+        """
+        Increment a counter in the shared cache, creating it if needed.
+
+        Args:
+            key: Cache key of the counter
+
+        Returns:
+            The new value of the counter
+        """
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, 1, timeout=None)
+            return 1
+
+    def changes_since(self, generation: int) -> tuple[int, set[str] | None]:
+        """
+        Get the subdomains changed since a generation.
+
+        Args:
+            generation: Last generation the caller has seen
+
+        Returns:
+            The current generation and the changed subdomains, None when the
+            change log no longer covers every generation since
+        """
+        current = self.cache.get(self.generation_key, 0)
+        if current == generation:
+            return current, set()
+        if current < generation or current - generation > self.change_log_size:
+            return current, None
+        keys = [
+            self.change_key(number) for number in range(generation + 1, current + 1)
+        ]
+        changes = self.cache.get_many(keys)
+        if len(changes) != len(keys):
+            return current, None
+        return current, set(changes.values())
+
+    def _local(self, subdomain: str, version: int) -> tuple[bool, SiteRecord | None]:
+        """
+        Look a subdomain up in this process's entries.
+
+        Args:
+            subdomain: Subdomain to look up
+            version: Current version of the subdomain
+
+        Returns:
+            Whether a current entry was found and the SiteRecord it holds
+        """
+        with self._lock:
+            entry = self._entries.get(subdomain)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(subdomain)
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+        return False, None
+
+    def _store(
+        self, subdomain: str, version: int, row: dict | None
+    ) -> SiteRecord | None:
+        """
+        Remember the row loaded for a subdomain.
+
+        Args:
+            subdomain: Subdomain that was looked up
+            version: Version of the subdomain the row was loaded for
+            row: Site columns, None if there is no such site
+
+        Returns:
+            SiteRecord for the row
+        """
+        record = SiteRecord(**row) if row else None
+        with self._lock:
+            self._entries[subdomain] = (version, record)
+            self._entries.move_to_end(subdomain)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return record
+
+    def get(self, subdomain: str) -> SiteRecord | None:
+        """
+        Get the site for a subdomain.
+
+        Args:
+            subdomain: Subdomain to look up
+
+        Returns:
+            SiteRecord for the subdomain, None if there is no such site
+        """
+        version = self.cache.get(self.version_key(subdomain), 0)
+        found, record = self._local(subdomain, version)
+        if found:
+            return record
+        row = Site.objects.filter(subdomain=subdomain).values(*self.fields).first()
+        return self._store(subdomain, version, row)
+
+    async def aget(self, subdomain: str) -> SiteRecord | None:
+        """
+        Get the site for a subdomain from async code.
+
+        Args:
+            subdomain: Subdomain to look up
+
+        Returns:
+            SiteRecord for the subdomain, None if there is no such site
+        """
+        version = await self.cache.aget(self.version_key(subdomain), 0)
+        found, record = self._local(subdomain, version)
+        if found:
+            return record
+        row = await (
+            Site.objects.filter(subdomain=subdomain).values(*self.fields).afirst()
+        )
+        return self._store(subdomain, version, row)
+
+    def invalidate(self, subdomain: str) -> int:
+        """
+        Drop a subdomain from every worker's registry.
+
+        Args:
+            subdomain: Subdomain that has changed
+
+        Returns:
+            The new version of the subdomain
+        """
+        version = self._incr(self.version_key(subdomain))
+        generation = self._incr(self.generation_key)
+        self.cache.set(
+            self.change_key(generation), subdomain, timeout=self.change_log_timeout
+        )
+        with self._lock:
+            self._entries.pop(subdomain, None)
+        return version
+
+    def prime(self, site: Site) -> SiteRecord:
+        """
+        Replace a site in every worker's registry with a row this worker wrote.
+
+        Other workers reload the site, this one is spared the query.
+
+        Args:
+            site: Site that has been saved
+
+        Returns:
+            SiteRecord for the site
+        """
+        version = self.invalidate(site.subdomain)
+        row = {field: getattr(site, field) for field in self.fields}
+        row["logo"] = site.logo.name or ""
+        return self._store(site.subdomain, version, row)
+
+    def clear(self):
+        """Drop every local entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict[str, int]:
+        """
+        Report the registry counters.
+
+        Returns:
+            Dictionary of size, hits, misses and evictions
+        """
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SubdomainIndex:
+    """
+    Sorted in-memory index of the subdomains that are taken.
+
+    The index is loaded once and then kept up to date from the site registry's
+    change log, so checking a subdomain costs one shared cache read and a
+    binary search. Subdomains are compared in lower case as hostnames are.
+    """
+
+    def __init__(self, registry: SiteRegistry):
+        """
+        Initialise SubdomainIndex.
+
+        Args:
+            registry: Site registry whose changes keep the index up to date
+        """
+        self.registry = registry
+        self._subdomains: list[str] = []
+        self._generation: int | None = None
+        self._lock = threading.Lock()
+
+    def reload(self):
+        """Load every subdomain from the database."""
+        generation = self.registry.cache.get(self.registry.generation_key, 0)
+        subdomains = sorted(
+            subdomain.lower()
+            for subdomain in Site.objects.values_list("subdomain", flat=True)
+        )
+        with self._lock:
+            self._subdomains = subdomains
+            self._generation = generation
+
+    def refresh(self):
+        """Apply the changes made since the index was last refreshed."""
+        if self._generation is None:
+            self.reload()
+            return
+        generation, changes = self.registry.changes_since(self._generation)
+        if changes is None:
+            self.reload()
+            return
+        if not changes:
+            return
+        for subdomain in changes:
+            taken = self.registry.get(subdomain) is not None
+            with self._lock:
+                position = bisect_left(self._subdomains, subdomain.lower())
+                present = (
+                    position < len(self._subdomains)
+                    and self._subdomains[position] == subdomain.lower()
+                )
+                if taken and not present:
+                    self._subdomains.insert(position, subdomain.lower())
+                elif present and not taken:
+                    del self._subdomains[position]
+        with self._lock:
+            self._generation = generation
+
+    def is_taken(self, subdomain: str) -> bool:
+        """
+        Check whether a subdomain is taken.
+
+        Args:
+            subdomain: Subdomain to check
+
+        Returns:
+            True if a site already uses the subdomain
+        """
+        self.refresh()
+        return self._contains(subdomain.lower())
+
+    def _contains(self, subdomain: str) -> bool:
+        """
+        Check the index for a lower case subdomain without refreshing it.
+
+        Args:
+            subdomain: Lower case subdomain to check
+
+        Returns:
+            True if the subdomain is in the index
+        """
+        with self._lock:
+            position = bisect_left(self._subdomains, subdomain)
+            return (
+                position < len(self._subdomains)
+                and self._subdomains[position] == subdomain
+            )
+
+    def suggest(self, subdomain: str, count: int = 3) -> list[str]:
+        """
+        Suggest free subdomains close to a taken one.
+
+        Args:
+            subdomain: Subdomain that is taken
+            count: Maximum number of suggestions
+
+        Returns:
+            List of free, valid subdomains
+        """
+        max_length = Site._meta.get_field("subdomain").max_length
+        base = subdomain.lower()
+        candidates = [f"{base}-faq", f"{base}-dev", f"my-{base}"] + [
+            f"{base[: max_length - len(str(number)) - 1]}-{number}"
+            for number in range(2, 100)
+        ]
+        suggestions: list[str] = []
+        self.refresh()
+        for candidate in candidates:
+            if len(candidate) > max_length or self._contains(candidate):
+                continue
+            try:
+                subdomain_validator(candidate)
+            except ValidationError:
+                continue
+            suggestions.append(candidate)
+            if len(suggestions) == count:
+                break
+        return suggestions
+
+
+site_registry = SiteRegistry()
+subdomain_index = SubdomainIndex(site_registry)
@@ -0,0 +1,226 @@
+"""Content negotiation and htmx aware responses for the views."""
+
+import time
+from dataclasses import dataclass
+from typing import TypedDict
+
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import redirect
+from django.template import TemplateSyntaxError
+from django.template.context import make_context
+from django.template.loader import get_template
+from django.template.loader_tags import BlockNode
+from django.utils.cache import patch_vary_headers
+
+from website.metrics import current_stats
+
+CONTENT_TYPES = ["text/html", "application/json"]
+
+
+@dataclass(frozen=True, slots=True)
+class Negotiation:
+    """What the client asked a request to be answered with."""
+
+    content_type: str | None
+    htmx: bool = False
+    boosted: bool = False
+    history_restore: bool = False
+
+    @property
+    def json(self) -> bool:
+        """Whether the client prefers JSON to HTML."""
+        return self.content_type == "application/json"
+
+    @property
+    def partial(self) -> bool:
+        """Whether htmx swaps the response into the current page."""
+        return self.htmx and not self.boosted and not self.history_restore
+
+
+def negotiate(request) -> Negotiation:
+    """
+    Negotiate the response to a request, once per request.
+
+    Args:
+        request: HttpRequest object
+
+    Returns:
+        Negotiation for the request, memoized on it
+    """
+    negotiation = getattr(request, "negotiation", None)
+    if negotiation is None:
+        headers = request.headers
+        negotiation = request.negotiation = Negotiation(
+            content_type=request.get_preferred_type(CONTENT_TYPES),
+            htmx=headers.get("HX-Request") == "true",
+            boosted=headers.get("HX-Boosted") == "true",
+            history_restore=headers.get("HX-History-Restore-Request") == "true",
+        )
+    return negotiation
+
+
+def render_block(template, block_name: str, context=None, request=None) -> str:
+    """
+    Render one block of a template, as an overriding child defines it.
+
+    The render time is added to the current request's metrics, as the
+    template backend does for whole templates.
+
+    Args:
+        template: Template returned by get_template
+        block_name: Name of the block
+        context: Template context
+        request: HttpRequest the template is rendered for
+
+    Returns:
+        Rendered text of the block
+
+    Raises:
+        TemplateSyntaxError: If the template has no such block
+    """
+    compiled = template.template
+    blocks = {
+        block.name: block for block in compiled.nodelist.get_nodes_by_type(BlockNode)
+    }
+    if block_name not in blocks:
+        raise TemplateSyntaxError(f"{compiled.name} has no block named {block_name}")
+    context = make_context(
+        context, request, autoescape=template.backend.engine.autoescape
+    )
+    start = time.perf_counter()
+    try:
+        with (
+            context.render_context.push_state(compiled),
+            context.bind_template(compiled),
+        ):
+            return blocks[block_name].render(context)
+    finally:
+        stats = current_stats.get()
+        if stats is not None:
+            stats.template_seconds += time.perf_counter() - start
+
+
+def render_page(
+    request,
+    template_name: str,
+    context: dict | None = None,
+    block: str = "content",
+    status: int = 200,
+) -> HttpResponse:
+    """
+    Render a page, or only one of its blocks when htmx swaps it into the page.
+
+    Args:
+        request: HttpRequest object
+        template_name: Template of the full page
+        context: Template context
+        block: Block rendered for htmx requests
+        status: HTTP status of the response
+
+    Returns:
+        HttpResponse varying on HX-Request
+    """
+    template = get_template(template_name)
+    if negotiate(request).partial:
+        content = render_block(template, block, context, request)
+    else:
+        content = template.render(context, request)
+    response = HttpResponse(content, status=status)
+    patch_vary_headers(response, ["HX-Request"])
+    return response
+
+
+def form_response(
+    form,
+    request,
+    redirect_url: str,
+    valid: bool,
+    template_name: str,
+    context: dict,
+    block: str = "form",
+) -> HttpResponse:
+    """
+    Build the response for a validated form.
+
+    JSON clients get the result and the errors as JSON. htmx swaps the form
+    block with its errors into the page, or is told to redirect. Other
+    clients are redirected or get the page with the form's errors.
+
+    Args:
+        form: Form that has been validated
+        request: Request that has the form data
+        redirect_url: URL to redirect to on success
+        valid: Result of validating the form
+        template_name: Template of the page holding the form
+        context: Template context for the page
+        block: Block of the template holding the form
+
+    Returns:
+        Response to be provided to the user based on the result of validation
+    """
+    negotiation = negotiate(request)
+    if negotiation.json:
+        response = (
+            process_json_success(redirect_url=redirect_url)
+            if valid
+            else process_json_failure(form.errors.as_data())
+        )
+    elif not valid:
+        response = render_page(request, template_name, context, block=block)
+    elif negotiation.htmx:
+        response = HttpResponse(status=204, headers={"HX-Redirect": redirect_url})
+    else:
+        response = redirect(redirect_url)
+    patch_vary_headers(response, ["Accept", "HX-Request"])
+    return response
+
+
+class JSONFailureResponse(TypedDict):
+    """Typed dict to hold JSON failures."""
+
+    result: str
+    errors: dict[str, list[str]]
+
+
+def process_json_failure(form_errors: dict[str, list[ValidationError]]) -> JsonResponse:
+    """
+    Process errors in a form.
+
+    Args:
+        form_errors: List of dictionary
+
+    Returns:
+        JsonResponse: Json response containing the result.
+    """
+    json_response: JSONFailureResponse = {
+        "result": "failed",
+        "errors": {},
+    }
+
+    for field, errors in form_errors.items():
+        if field == "__all__":
+            field = "non_field"
+        error_list: list[str] = []
+        for error in errors:
+            error_list.append(str(error.message))
+        json_response["errors"][field] = error_list
+    return JsonResponse(json_response)
+
+
+def process_json_success(redirect_url: str) -> JsonResponse:
+    """
+    Process successful form.
+
+    Args:
+        redirect_url: URL the user should be redirected too
+
+    Returns:
+        JsonResponse: Json response containing the result.
+    """
+    json_response = {
+        "result": "success",
+        "redirect": True,
+        "redirect_url": redirect_url,
+    }
+    return JsonResponse(json_response)
@@ -0,0 +1,369 @@
+"""Database routers for tenant shards and read replicas."""
+
+import itertools
+import logging
+import threading
+import time
+from collections.abc import Callable
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_COOKIE = "devfaq_primary"
+
+# Zero while the replica has replayed everything it received, so an idle
+# primary does not make the replica look like it is lagging
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+        )
+    END
+"""
+
+
+@dataclass(slots=True)
+class RequestRouting:
+    """How the queries of the current request are routed."""
+
+    use_replica: bool = False
+    wrote: bool = False
+
+
+current_routing: ContextVar[RequestRouting | None] = ContextVar(
+    "current_routing", default=None
+)
+
+
+@dataclass(frozen=True, slots=True)
+class TenantShard:
+    """Site the current request is for and the shard holding its rows."""
+
+    site_id: int
+    shard: str
+
+
+current_tenant: ContextVar[TenantShard | None] = ContextVar(
+    "current_tenant", default=None
+)
+
+# Models whose rows belong to one site and live on that site's shard, every
+# other model is global and lives in the default database
+TENANT_MODELS = frozenset({"website.faqentry"})
+
+
+def shard_for_site(site_id: int | None) -> str:
+    """
+    Find the shard holding a site's tenant rows.
+
+    Args:
+        site_id: Site to look up
+
+    Returns:
+        Alias of the shard, the default database for unknown sites
+    """
+    tenant = current_tenant.get()
+    if tenant is not None and tenant.site_id == site_id:
+        return tenant.shard
+    if site_id is None:
+        return DEFAULT_DB_ALIAS
+    from website.models import Site
+
+    # The map is read from the primary, a lagging replica could still point
+    # at the shard a site has just been moved away from
+    shard = (
+        Site.objects.using(DEFAULT_DB_ALIAS)
+        .filter(id=site_id)
+        .values_list("shard", flat=True)
+        .first()
+    )
+    return shard or DEFAULT_DB_ALIAS
+
+
+class ReplicaPool:
+    """
+    Rotation of the healthy replicas.
+
+    Each replica is checked at most every REPLICA_CHECK_SECONDS, a replica
+    that cannot be connected to or lags too far behind is left out of the
+    rotation for REPLICA_RETRY_SECONDS.
+    """
+
+    def __init__(self):
+        """Initialise ReplicaPool."""
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._checked_at: dict[str, float] = {}
+        self._unhealthy_until: dict[str, float] = {}
+
+    def choose(self) -> str | None:
+        """
+        Pick the replica for the next read.
+
+        Returns:
+            Alias of a healthy replica, None if there is none
+        """
+        replicas = settings.DATABASE_REPLICAS
+        for _ in range(len(replicas)):
+            alias = replicas[next(self._counter) % len(replicas)]
+            if self.healthy(alias):
+                return alias
+        return None
+
+    def healthy(self, alias: str) -> bool:
+        """
+        Check whether a replica is in the rotation, checking it when it is due.
+
+        Args:
+            alias: Alias of the replica
+
+        Returns:
+            True if reads may go to the replica
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._unhealthy_until.get(alias, 0) > now:
+                return False
+            if self._checked_at.get(alias, 0) + settings.REPLICA_CHECK_SECONDS > now:
+                return True
+            self._checked_at[alias] = now
+
+        try:
+            lag = self.lag(alias)
+        except DatabaseError:
+            logger.warning("Replica %s failed its health check", alias, exc_info=True)
+            self.mark_unhealthy(alias)
+            return False
+        if lag > settings.REPLICA_MAX_LAG_SECONDS:
+            logger.warning("Replica %s is %.1f seconds behind", alias, lag)
+            self.mark_unhealthy(alias)
+            return False
+        return True
+
+    def lag(self, alias: str) -> float:
+        """
+        Measure how far a replica is behind the primary.
+
+        Args:
+            alias: Alias of the replica
+
+        Returns:
+            Replication lag in seconds, 0 for backends without replication
+        """
+        connection = connections[alias]
+        connection.ensure_connection()
+        if connection.vendor != "postgresql":
+            return 0.0
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0])
+
+    def mark_unhealthy(self, alias: str):
+        """
+        Leave a replica out of the rotation for REPLICA_RETRY_SECONDS.
+
+        Args:
+            alias: Alias of the replica
+        """
+        with self._lock:
+            self._unhealthy_until[alias] = (
+                time.monotonic() + settings.REPLICA_RETRY_SECONDS
+            )
+
+    def reset(self):
+        """Put every replica back in the rotation and forget the checks."""
+        with self._lock:
+            self._checked_at.clear()
+            self._unhealthy_until.clear()
+
+
+replica_pool = ReplicaPool()
+
+
+class ShardRouter:
+    """
+    Route the queries of tenant models to the shard of their site.
+
+    The site is taken from the instance the query is made through, or else
+    from the tenant TenantMiddleware resolved for the request. Tenants on the
+    default database, and every global model, are left to the next router.
+    """
+
+    def shard(self, model, hints: dict) -> str | None:
+        """
+        Find the shard for a query.
+
+        Args:
+            model: Model being queried
+            hints: Routing hints
+
+        Returns:
+            Alias of the shard, None for global models and the default database
+        """
+        if model._meta.label_lower not in TENANT_MODELS:
+            return None
+        instance = hints.get("instance")
+        if instance is None:
+            tenant = current_tenant.get()
+            shard = tenant.shard if tenant is not None else DEFAULT_DB_ALIAS
+        elif instance._meta.label_lower == "website.site":
+            shard = instance.shard
+        elif instance._state.db is not None:
+            shard = instance._state.db
+        else:
+            shard = shard_for_site(instance.site_id)
+        return None if shard == DEFAULT_DB_ALIAS else shard
+
+    def db_for_read(self, model, **hints) -> str | None:
+        """
+        Choose the database to read a model from.
+
+        Args:
+            model: Model being read
+            hints: Routing hints
+
+        Returns:
+            Alias of the shard, None to leave the choice to the next router
+        """
+        return self.shard(model, hints)
+
+    def db_for_write(self, model, **hints) -> str | None:
+        """
+        Choose the database to write a model to.
+
+        Args:
+            model: Model being written
+            hints: Routing hints
+
+        Returns:
+            Alias of the shard, None to leave the choice to the next router
+        """
+        return self.shard(model, hints)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints) -> bool | None:
+        """
+        Give every shard the full schema but run data migrations on default only.
+
+        Shards hold every table so foreign keys to global tables can be
+        created, but only the tenant tables hold rows. Data migrations without
+        a model_name hint work on global rows and are skipped on the shards.
+
+        Args:
+            db: Alias of the database
+            app_label: App of the migration
+            model_name: Model being migrated
+            hints: Routing hints
+
+        Returns:
+            False for data migrations on shards, None otherwise
+        """
+        if db != DEFAULT_DB_ALIAS and db in settings.DATABASE_SHARDS:
+            return False if model_name is None else None
+        return None
+
+
+class ReplicaRouter:
+    """
+    Route reads to a replica only while a read-only view is handling a request.
+
+    Everything else, including reads inside a transaction on the primary and
+    reads after the request has written, uses the primary.
+    """
+
+    def db_for_read(self, model, **hints) -> str:
+        """
+        Choose the database to read a model from.
+
+        Args:
+            model: Model being read
+            hints: Routing hints
+
+        Returns:
+            Alias of the database
+        """
+        routing = current_routing.get()
+        if (
+            routing is None
+            or not routing.use_replica
+            or routing.wrote
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return replica_pool.choose() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints) -> str:
+        """
+        Choose the database to write a model to, always the primary.
+
+        Args:
+            model: Model being written
+            hints: Routing hints
+
+        Returns:
+            Alias of the primary
+        """
+        routing = current_routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        """
+        Allow relations between objects read from any of the databases.
+
+        Args:
+            obj1: First object
+            obj2: Second object
+            hints: Routing hints
+
+        Returns:
+            True, the replicas hold the same data as the primary
+        """
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints) -> bool | None:
+        """
+        Keep migrations off the replicas, they receive them from the primary.
+
+        Args:
+            db: Alias of the database
+            app_label: App of the migration
+            model_name: Model being migrated
+            hints: Routing hints
+
+        Returns:
+            False for replicas, None otherwise
+        """
+        return False if db in settings.DATABASE_REPLICAS else None
+
+
+def read_from_replica(view: Callable) -> Callable:
+    """
+    Mark a view as read-only so ReplicaMiddleware sends its reads to a replica.
+
+    Args:
+        view: View to mark
+
+    Returns:
+        The view
+    """
+    view.read_from_replica = True
+    return view
+
+
+def mirror_primary():
+    """
+    Point every replica at the database the primary connection uses.
+
+    For tools that swap the primary for a throwaway test database, so the
+    reads of read-only views follow it.
+    """
+    primary = connections[DEFAULT_DB_ALIAS]
+    for alias in settings.DATABASE_REPLICAS:
+        connections[alias].close()
+        connections[alias].creation.set_as_test_mirror(primary.settings_dict)
@@ -0,0 +1,145 @@
+"""Per-site full text search of FAQ entries."""
+
+import re
+from dataclasses import dataclass
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, router
+
+from website.models import FAQEntry
+
+SEARCH_TERM_RE = re.compile(r"\w+")
+
+
+@dataclass(frozen=True, slots=True)
+class SearchResults:
+    """A page of ranked search results."""
+
+    entries: list[FAQEntry]
+    page: int
+    has_next: bool
+
+
+class SQLiteSearchBackend:
+    """
+    Search the FTS5 table maintained by triggers on website_faqentry.
+
+    Every row carries a site token, s<site_id>, in its own column so that the
+    tenant filter is part of the full text match rather than a scan of every
+    tenant's matches.
+    """
+
+    def ranked_ids(
+        self, cursor, site_id: int, query: str, limit: int, offset: int
+    ) -> list[int]:
+        """
+        Get the ids of the entries matching a query, best match first.
+
+        Args:
+            cursor: Cursor on the database holding the entries
+            site_id: Site to search
+            query: Text entered by the user
+            limit: Maximum number of ids to return
+            offset: Number of ids to skip
+
+        Returns:
+            List of FAQEntry ids
+        """
+        terms = SEARCH_TERM_RE.findall(query)
+        if not terms:
+            return []
+        match = f'site:"s{site_id}" AND ' + " ".join(f'"{term}"' for term in terms)
+        # The site column carries no weight, questions count four times answers
+        cursor.execute(
+            "SELECT rowid FROM website_faqentry_fts "
+            "WHERE website_faqentry_fts MATCH %s "
+            "AND rank MATCH 'bm25(0.0, 4.0, 1.0)' "
+            "ORDER BY rank, rowid LIMIT %s OFFSET %s",
+            [match, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    """Search the generated tsvector column and its GIN index."""
+
+    def ranked_ids(
+        self, cursor, site_id: int, query: str, limit: int, offset: int
+    ) -> list[int]:
+        """
+        Get the ids of the entries matching a query, best match first.
+
+        Args:
+            cursor: Cursor on the database holding the entries
+            site_id: Site to search
+            query: Text entered by the user
+            limit: Maximum number of ids to return
+            offset: Number of ids to skip
+
+        Returns:
+            List of FAQEntry ids
+        """
+        cursor.execute(
+            "SELECT id FROM website_faqentry, "
+            "websearch_to_tsquery('english', %s) AS query(terms) "
+            "WHERE site_id = %s AND search_vector @@ query.terms "
+            "ORDER BY ts_rank(search_vector, query.terms) DESC, id "
+            "LIMIT %s OFFSET %s",
+            [query, site_id, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+SEARCH_BACKENDS = {
+    "sqlite": SQLiteSearchBackend(),
+    "postgresql": PostgresSearchBackend(),
+}
+
+
+def search_faq(
+    site_id: int, query: str, page: int = 1, page_size: int = 20
+) -> SearchResults:
+    """
+    Search the FAQ entries of a site.
+
+    Every match is ranked and results are paginated by offset because they
+    are ordered by rank.
+
+    Args:
+        site_id: Site to search
+        query: Text entered by the user
+        page: Page number, starting at 1
+        page_size: Number of entries per page
+
+    Returns:
+        The requested page of results
+    """
+    page = max(page, 1)
+    offset = (page - 1) * page_size
+
+    # Routed like an entry of the site, so the search runs on the site's shard
+    alias = router.db_for_read(FAQEntry, instance=FAQEntry(site_id=site_id))
+    connection = connections[alias]
+    try:
+        backend = SEARCH_BACKENDS[connection.vendor]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"FAQ search is not supported on {connection.vendor}"
+        ) from None
+
+    with connection.cursor() as cursor:
+        ids = backend.ranked_ids(
+            cursor,
+            site_id=site_id,
+            query=query,
+            limit=page_size + 1,
+            offset=offset,
+        )
+    entries = FAQEntry.objects.using(alias).in_bulk(ids[:page_size])
+    return SearchResults(
+        entries=[
+            entries[entry_id] for entry_id in ids[:page_size] if entry_id in entries
+        ],
+        page=page,
+        has_next=len(ids) > page_size,
+    )
@@ -0,0 +1,88 @@
+"""Conditional file responses handed to the web server when configured."""
+
+import mimetypes
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+def file_etag(path: Path) -> str:
+    """
+    Calculate the ETag of a file from its modification time and size.
+
+    Args:
+        path: File to calculate the ETag for
+
+    Returns:
+        Quoted ETag
+    """
+    stat = path.stat()
+    return quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+
+
+def accel_redirect_url(path: Path) -> str | None:
+    """
+    Find the internal nginx location serving a file.
+
+    Args:
+        path: File to serve
+
+    Returns:
+        Internal URL of the file, None if no location covers it
+    """
+    for root, location in settings.SENDFILE_ACCEL_LOCATIONS.items():
+        try:
+            relative = path.relative_to(root)
+        except ValueError:
+            continue
+        return f"{location}{quote(relative.as_posix())}"
+    return None
+
+
+def send_file(
+    request,
+    path: Path,
+    cache_control: str = "public, no-cache",
+    content_type: str | None = None,
+) -> HttpResponse:
+    """
+    Respond with a file, or with 304 if the client's copy is current.
+
+    The response carries an ETag and Last-Modified for conditional requests.
+    With SENDFILE_BACKEND set the body is left to the web server through
+    X-Sendfile or X-Accel-Redirect instead of being streamed by Django.
+
+    Args:
+        request: HttpRequest object
+        path: File to send, which must exist
+        cache_control: Cache-Control header for the response
+        content_type: Content type, guessed from the filename by default
+
+    Returns:
+        HttpResponse for the file
+    """
+    etag = file_etag(path)
+    last_modified = int(path.stat().st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content_type = content_type or (
+            mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        )
+        accel_url = accel_redirect_url(path)
+        if settings.SENDFILE_BACKEND == "x-sendfile":
+            response = HttpResponse(content_type=content_type)
+            response.headers["X-Sendfile"] = str(path)
+        elif settings.SENDFILE_BACKEND == "x-accel-redirect" and accel_url:
+            response = HttpResponse(content_type=content_type)
+            response.headers["X-Accel-Redirect"] = accel_url
+        else:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(last_modified)
+    response.headers["Cache-Control"] = cache_control
+    return response
@@ -0,0 +1,388 @@
+"""Session engine reading through the cache and skipping unneeded writes."""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import caches
+from django.utils import timezone
+
+KEY_PREFIX = "website.sessions"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class StoredSession:
+    """What the database holds for a session as of the last read or write."""
+
+    digest: str
+    expire_date: datetime
+
+
+class ExpiryBatcher:
+    """
+    Session expiry extensions waiting to be written.
+
+    Extensions are rounded up to `resolution` seconds and grouped by expiry,
+    so a batch is written in a few UPDATEs. A batch is written once max_pending
+    extensions are waiting or, at the end of a request, once the oldest has
+    waited max_delay seconds. The cache entries of the extended sessions are
+    then dropped, so their next read picks up the new expiry.
+    """
+
+    def __init__(
+        self, max_pending: int = 500, max_delay: float = 30.0, resolution: int = 60
+    ):
+        """
+        Initialise ExpiryBatcher.
+
+        Args:
+            max_pending: Extensions to collect before writing them
+            max_delay: Seconds an extension may wait before it is written
+            resolution: Seconds the new expiry dates are rounded up to
+        """
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self.resolution = resolution
+        self._pending: dict[str, datetime] = {}
+        self._oldest = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, session_key: str, expire_date: datetime) -> bool:
+        """
+        Queue an extension.
+
+        Args:
+            session_key: Session to extend
+            expire_date: New expiry of the session
+
+        Returns:
+            True if the batch is due to be written with flush
+        """
+        timestamp = math.ceil(expire_date.timestamp() / self.resolution)
+        rounded = datetime.fromtimestamp(
+            timestamp * self.resolution, tz=expire_date.tzinfo
+        )
+        now = time.monotonic()
+        with self._lock:
+            if not self._pending:
+                self._oldest = now
+            self._pending[session_key] = rounded
+            return self._due(now)
+
+    def _due(self, now: float) -> bool:
+        """
+        Check whether the waiting extensions should be written, under the lock.
+
+        Args:
+            now: Current monotonic time
+
+        Returns:
+            True if the batch is due to be written with flush
+        """
+        return bool(self._pending) and (
+            len(self._pending) >= self.max_pending
+            or now - self._oldest >= self.max_delay
+        )
+
+    def flush_due(self) -> int:
+        """
+        Write the waiting extensions if they are due.
+
+        Returns:
+            Number of sessions extended
+        """
+        with self._lock:
+            due = self._due(time.monotonic())
+        return self.flush() if due else 0
+
+    def flush(self) -> int:
+        """
+        Write the waiting extensions.
+
+        Returns:
+            Number of sessions extended
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        model = SessionStore.get_model_class()
+        by_expiry: dict[datetime, list[str]] = {}
+        for session_key, expire_date in pending.items():
+            by_expiry.setdefault(expire_date, []).append(session_key)
+        for expire_date, session_keys in by_expiry.items():
+            for start in range(0, len(session_keys), self.max_pending):
+                model.objects.filter(
+                    session_key__in=session_keys[start : start + self.max_pending]
+                ).update(expire_date=expire_date)
+        caches[settings.SESSION_CACHE_ALIAS].delete_many(
+            [KEY_PREFIX + session_key for session_key in pending]
+        )
+        return len(pending)
+
+    def pending(self) -> int:
+        """
+        Count the waiting extensions.
+
+        Returns:
+            Number of sessions waiting to be extended
+        """
+        with self._lock:
+            return len(self._pending)
+
+
+class SessionStore(CachedDBStore):
+    """
+    Database backed sessions read through the cache.
+
+    With SESSION_SAVE_EVERY_REQUEST the expiry slides with every request, but
+    the database is only written when the session data changes. Expiry is
+    extended in batches once the stored expiry lags SESSION_REFRESH_SECONDS,
+    or half the session's age if that is shorter, behind. A session that
+    would expire within that time is written at once.
+    """
+
+    cache_key_prefix = KEY_PREFIX
+    extensions = ExpiryBatcher()
+
+    def __init__(self, session_key=None):
+        """
+        Initialise SessionStore.
+
+        Args:
+            session_key: Key from the session cookie, None for a new session
+        """
+        super().__init__(session_key)
+        self._stored: StoredSession | None = None
+
+    def digest(self, data: dict) -> str:
+        """
+        Fingerprint session data.
+
+        Args:
+            data: Session data
+
+        Returns:
+            SHA-256 digest of the serialized data
+        """
+        return hashlib.sha256(self.serializer().dumps(data)).hexdigest()
+
+    def loaded(self, cached: tuple[dict, datetime] | None, session) -> dict:
+        """
+        Remember what the database holds for a session that was read.
+
+        Args:
+            cached: Data and expiry from the cache, None on a cache miss
+            session: Session row read on a cache miss, None if there is none
+
+        Returns:
+            The session data
+        """
+        if cached is not None:
+            data, expire_date = cached
+        elif session is not None:
+            data, expire_date = self.decode(session.session_data), session.expire_date
+        else:
+            self._stored = None
+            return {}
+        self._stored = StoredSession(self.digest(data), expire_date)
+        return data
+
+    def load(self) -> dict:
+        """
+        Read the session from the cache, falling back to the database.
+
+        Returns:
+            The session data
+        """
+        try:
+            cached = self._cache.get(self.cache_key)
+        except Exception:
+            # Some backends raise on invalid cache keys, treat it as a miss
+            cached = None
+        if cached is not None:
+            return self.loaded(cached, None)
+        data = self.loaded(None, self._get_session_from_db())
+        if self._stored is not None:
+            self._cache.set(
+                self.cache_key,
+                (data, self._stored.expire_date),
+                self.get_expiry_age(expiry=self._stored.expire_date),
+            )
+        return data
+
+    async def aload(self) -> dict:
+        """
+        Read the session from the cache, falling back to the database.
+
+        Returns:
+            The session data
+        """
+        try:
+            cached = await self._cache.aget(await self.acache_key())
+        except Exception:
+            cached = None
+        if cached is not None:
+            return self.loaded(cached, None)
+        data = self.loaded(None, await self._aget_session_from_db())
+        if self._stored is not None:
+            await self._cache.aset(
+                await self.acache_key(),
+                (data, self._stored.expire_date),
+                await self.aget_expiry_age(expiry=self._stored.expire_date),
+            )
+        return data
+
+    def write_needed(self, data: dict, expire_date: datetime) -> bool | None:
+        """
+        Decide how to save a session.
+
+        Args:
+            data: Session data
+            expire_date: Expiry the session should have
+
+        Returns:
+            True to write the session, None to queue an expiry extension and
+            False when the stored session is current
+        """
+        stored = self._stored
+        if stored is None or self.digest(data) != stored.digest:
+            return True
+        lag = expire_date - stored.expire_date
+        if lag <= timedelta(0):
+            return False
+        now = timezone.now()
+        refresh = min(
+            timedelta(seconds=settings.SESSION_REFRESH_SECONDS),
+            (expire_date - now) / 2,
+        )
+        if stored.expire_date - now < refresh:
+            return True
+        if lag < refresh:
+            return False
+        return None
+
+    def create_model_instance(self, data: dict):
+        """
+        Build the row for a session and remember it as stored.
+
+        Args:
+            data: Session data
+
+        Returns:
+            Session model instance
+        """
+        session = super().create_model_instance(data)
+        self._stored = StoredSession(self.digest(data), session.expire_date)
+        return session
+
+    async def acreate_model_instance(self, data: dict):
+        """
+        Build the row for a session and remember it as stored.
+
+        Args:
+            data: Session data
+
+        Returns:
+            Session model instance
+        """
+        session = await super().acreate_model_instance(data)
+        self._stored = StoredSession(self.digest(data), session.expire_date)
+        return session
+
+    def save(self, must_create: bool = False):
+        """
+        Save the session if its data changed or its expiry is due a refresh.
+
+        Args:
+            must_create: Whether the save has to create a new session
+        """
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        expire_date = self.get_expiry_date()
+        write = True if must_create else self.write_needed(data, expire_date)
+        if write is None:
+            if self.extensions.add(self.session_key, expire_date):
+                self.extensions.flush()
+        elif write:
+            DBStore.save(self, must_create)
+            try:
+                self._cache.set(
+                    self.cache_key,
+                    (data, self._stored.expire_date),
+                    self.get_expiry_age(),
+                )
+            except Exception:
+                logger.exception("Error saving to cache (%s)", self._cache)
+
+    async def asave(self, must_create: bool = False):
+        """
+        Save the session if its data changed or its expiry is due a refresh.
+
+        Args:
+            must_create: Whether the save has to create a new session
+        """
+        if self.session_key is None:
+            return await self.acreate()
+        data = await self._aget_session(no_load=must_create)
+        expire_date = await self.aget_expiry_date()
+        write = True if must_create else self.write_needed(data, expire_date)
+        if write is None:
+            if self.extensions.add(self.session_key, expire_date):
+                await sync_to_async(self.extensions.flush)()
+        elif write:
+            await DBStore.asave(self, must_create)
+            try:
+                await self._cache.aset(
+                    await self.acache_key(),
+                    (data, self._stored.expire_date),
+                    await self.aget_expiry_age(),
+                )
+            except Exception:
+                logger.exception("Error saving to cache (%s)", self._cache)
+
+    @classmethod
+    def purge_expired(cls, batch_size: int = 1000) -> int:
+        """
+        Delete one batch of expired sessions.
+
+        Keys are selected on the expire_date index and deleted in a short
+        DELETE, so a large backlog never locks the whole table.
+
+        Args:
+            batch_size: Maximum number of sessions to delete
+
+        Returns:
+            Number of sessions deleted
+        """
+        model = cls.get_model_class()
+        expired_keys = list(
+            model.objects.filter(expire_date__lt=timezone.now())
+            .order_by("expire_date")
+            .values_list("session_key", flat=True)[:batch_size]
+        )
+        deleted, _ = model.objects.filter(session_key__in=expired_keys).delete()
+        return deleted
+
+    @classmethod
+    def clear_expired(cls):
+        """Delete every expired session in batches, for clearsessions."""
+        while cls.purge_expired():
+            pass
+
+    @classmethod
+    async def aclear_expired(cls):
+        """Delete every expired session in batches."""
+        await sync_to_async(cls.clear_expired)()
@@ -0,0 +1,262 @@
+"""Moving a tenant's rows between database shards while the site stays up."""
+
+import logging
+import time
+from collections.abc import Iterator
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from website.models import FAQEntry, Site
+
+logger = logging.getLogger(__name__)
+
+# Statements taking a write lock on the entries for the rest of the
+# transaction, reads carry on while a site is cut over. SQLite locks the whole
+# database file.
+LOCK_STATEMENTS = {
+    "sqlite": "UPDATE website_faqentry SET ordering = ordering WHERE 0",
+    "postgresql": "LOCK TABLE website_faqentry IN SHARE MODE",
+}
+COPIED_FIELDS = ("question", "answer", "ordering")
+
+
+class TenantMove:
+    """
+    Move the FAQ entries of a site to another shard.
+
+    Entries are copied in batches, then further passes copy the changes made
+    in the meantime until few remain. The cut-over locks the entries on the
+    source shard against writes, copies the last changes and points the site
+    at the target in one short transaction. Requests still writing to the
+    source after the cut-over are caught by a final pass once the grace
+    period is over. The final pass and the deletion from the source run with
+    the source locked against writes, and are repeated for writes that were
+    waiting on the lock, so no write is deleted without being copied.
+
+    Every shard numbers its own rows, so entries get new ids on the target.
+    """
+
+    def __init__(
+        self,
+        site: Site,
+        target: str,
+        batch_size: int = 500,
+        sleep: float = 0.0,
+        settled: int = 10,
+        max_passes: int = 5,
+    ):
+        """
+        Initialise TenantMove.
+
+        Args:
+            site: Site to move
+            target: Alias of the shard to move the site to
+            batch_size: Rows read, written or deleted per query
+            sleep: Seconds to wait between batches outside the cut-over
+            settled: Changes a pass may still find before cutting over
+            max_passes: Passes to make before cutting over regardless
+        """
+        if target not in settings.DATABASE_SHARDS:
+            raise ValueError(f"Unknown shard {target}")
+        if target == site.shard:
+            raise ValueError(f"{site.subdomain} is already on {target}")
+        vendor = connections[site.shard].vendor
+        if vendor not in LOCK_STATEMENTS:
+            raise ImproperlyConfigured(f"Moving tenants is not supported on {vendor}")
+        self.site = site
+        self.source = site.shard
+        self.target = target
+        self.batch_size = batch_size
+        self.sleep = sleep
+        self.settled = settled
+        self.max_passes = max_passes
+        # Source entry id to the target entry id and the fields last copied
+        self.copied: dict[int, tuple[int, tuple]] = {}
+
+    def run(self, grace: float = 5.0) -> int:
+        """
+        Move the site.
+
+        Args:
+            grace: Seconds to wait after the cut-over for requests that had
+                routed to the source shard before it
+
+        Returns:
+            Number of entries moved
+        """
+        # Left behind by a move that did not finish
+        FAQEntry.objects.using(self.target).filter(site_id=self.site.id).delete()
+
+        changes = self.sync()
+        passes = 1
+        while changes > self.settled and passes < self.max_passes:
+            changes = self.sync()
+            passes += 1
+        logger.info(
+            "Copied %s entries of %s to %s in %s passes",
+            len(self.copied),
+            self.site.subdomain,
+            self.target,
+            passes,
+        )
+
+        self.cut_over()
+        time.sleep(grace)
+        moved = self.finish()
+        for _ in range(self.max_passes):
+            if not self.source_entries().exists():
+                break
+            moved += self.finish()
+        else:
+            logger.warning(
+                "Entries of %s are still being written to %s",
+                self.site.subdomain,
+                self.source,
+            )
+        return moved
+
+    def lock_source(self):
+        """Lock the entries on the source shard against writes, in a transaction."""
+        connection = connections[self.source]
+        with connection.cursor() as cursor:
+            cursor.execute(LOCK_STATEMENTS[connection.vendor])
+
+    def source_entries(self):
+        """
+        Select the site's entries on the source shard.
+
+        Returns:
+            QuerySet of the entries
+        """
+        return FAQEntry.objects.using(self.source).filter(site_id=self.site.id)
+
+    def cut_over(self):
+        """Copy the last changes and point the site at the target shard."""
+        with transaction.atomic(using=self.source):
+            self.lock_source()
+            self.sync(pause=False)
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                self.site.shard = self.target
+                self.site.save(update_fields=["shard"])
+
+    def finish(self) -> int:
+        """
+        Copy the last changes and delete the entries from the source shard.
+
+        Writes are blocked from before the pass until the entries are deleted.
+        The copied entries are forgotten, so a later pass only finds entries
+        written while this one held the lock.
+
+        Returns:
+            Number of entries moved off the source
+        """
+        with transaction.atomic(using=self.source):
+            self.lock_source()
+            self.sync(pause=False)
+            self.delete_source(pause=False)
+        moved = len(self.copied)
+        self.copied = {}
+        return moved
+
+    def source_rows(self, pause: bool = True) -> Iterator[tuple]:
+        """
+        Read the site's entries on the source shard in batches.
+
+        Args:
+            pause: Whether to sleep between batches
+
+        Yields:
+            Tuples of the entry id and its COPIED_FIELDS
+        """
+        last_id = 0
+        while True:
+            batch = list(
+                FAQEntry.objects.using(self.source)
+                .filter(site_id=self.site.id, id__gt=last_id)
+                .order_by("id")
+                .values_list("id", *COPIED_FIELDS)[: self.batch_size]
+            )
+            yield from batch
+            if len(batch) < self.batch_size:
+                return
+            last_id = batch[-1][0]
+            if pause:
+                time.sleep(self.sleep)
+
+    def sync(self, pause: bool = True) -> int:
+        """
+        Copy the changes made on the source since the last pass.
+
+        Args:
+            pause: Whether to sleep between batches
+
+        Returns:
+            Number of entries inserted, updated or deleted on the target
+        """
+        seen = set()
+        new: list[tuple[int, tuple]] = []
+        changes = 0
+        for source_id, *fields in self.source_rows(pause):
+            fields = tuple(fields)
+            seen.add(source_id)
+            copied = self.copied.get(source_id)
+            if copied is None:
+                new.append((source_id, fields))
+                if len(new) == self.batch_size:
+                    changes += self.insert(new)
+                    new = []
+            elif copied[1] != fields:
+                FAQEntry.objects.using(self.target).filter(id=copied[0]).update(
+                    **dict(zip(COPIED_FIELDS, fields, strict=True))
+                )
+                self.copied[source_id] = (copied[0], fields)
+                changes += 1
+        changes += self.insert(new)
+
+        gone = [source_id for source_id in self.copied if source_id not in seen]
+        for start in range(0, len(gone), self.batch_size):
+            target_ids = [
+                self.copied.pop(source_id)[0]
+                for source_id in gone[start : start + self.batch_size]
+            ]
+            FAQEntry.objects.using(self.target).filter(id__in=target_ids).delete()
+        return changes + len(gone)
+
+    def insert(self, rows: list[tuple[int, tuple]]) -> int:
+        """
+        Insert entries on the target shard.
+
+        Args:
+            rows: Source entry ids and their COPIED_FIELDS
+
+        Returns:
+            Number of entries inserted
+        """
+        if not rows:
+            return 0
+        entries = FAQEntry.objects.using(self.target).bulk_create(
+            FAQEntry(
+                site_id=self.site.id, **dict(zip(COPIED_FIELDS, fields, strict=True))
+            )
+            for _, fields in rows
+        )
+        for (source_id, fields), entry in zip(rows, entries, strict=True):
+            self.copied[source_id] = (entry.id, fields)
+        return len(rows)
+
+    def delete_source(self, pause: bool = True):
+        """
+        Delete the moved entries from the source shard in batches.
+
+        Args:
+            pause: Whether to sleep between batches
+        """
+        source_ids = list(self.copied)
+        for start in range(0, len(source_ids), self.batch_size):
+            self.source_entries().filter(
+                id__in=source_ids[start : start + self.batch_size]
+            ).delete()
+            if pause:
+                time.sleep(self.sleep)
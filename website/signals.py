@@ -0,0 +1,228 @@
+"""Signal receivers for the website."""
+
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from website.backends import user_contexts
+from website.jobs import enqueue
+from website.logos import purge_derivatives
+from website.metrics import install_query_recorder
+from website.models import FAQEntry, Site, SiteMembership, Validation
+from website.pagecache import page_cache
+from website.registry import site_registry
+from website.sessions import SessionStore
+
+# Site fields whose stored value the post_save receivers compare against
+TRACKED_SITE_FIELDS = ("logo", "subdomain")
+
+
+@receiver(pre_save, sender=Site)
+def remember_stored_site(sender, instance: Site, raw: bool, update_fields, **kwargs):
+    """
+    Remember the stored values of the tracked fields of a site about to be saved.
+
+    Args:
+        sender: Model class sending the signal
+        instance: Site being saved
+        raw: Whether the site is saved as loaded from a fixture
+        update_fields: Fields being saved, None for every field
+        kwargs: Remaining signal arguments
+    """
+    fields = [
+        field
+        for field in TRACKED_SITE_FIELDS
+        if update_fields is None or field in update_fields
+    ]
+    stored = None
+    if fields and not raw and instance.pk is not None:
+        stored = (
+            Site.objects.using(kwargs["using"])
+            .filter(pk=instance.pk)
+            .values(*fields)
+            .first()
+        )
+    instance._stored_values = stored or {}
+
+
+@receiver(post_save, sender=Site)
+def queue_logo_processing(sender, instance: Site, created: bool, **kwargs):
+    """
+    Queue the logo job of a site whose logo was set or replaced.
+
+    Args:
+        sender: Model class sending the signal
+        instance: Site that was saved
+        created: Whether the site was created
+        kwargs: Remaining signal arguments
+    """
+    stored = instance._stored_values
+    if (
+        created
+        and instance.logo
+        or "logo" in stored
+        and (stored["logo"] or "") != (instance.logo.name or "")
+    ):
+        enqueue("process_logo", {"site_id": instance.id})
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+def invalidate_site(sender, instance: Site, **kwargs):
+    """
+    Drop a changed site from the registry and mark its pages as stale on commit.
+
+    A renamed site is dropped under both its old and its new subdomain.
+
+    Args:
+        sender: Model class sending the signal
+        instance: Site that was saved or deleted
+        kwargs: Remaining signal arguments
+    """
+    subdomains = {instance.subdomain}
+    if kwargs["signal"] is post_save:
+        subdomains.add(instance._stored_values.get("subdomain", instance.subdomain))
+    for subdomain in subdomains:
+        transaction.on_commit(partial(site_registry.invalidate, subdomain))
+        transaction.on_commit(partial(page_cache.bump, subdomain))
+
+
+@receiver(post_save, sender=FAQEntry)
+@receiver(post_delete, sender=FAQEntry)
+def invalidate_site_pages(sender, instance: FAQEntry, **kwargs):
+    """
+    Mark the cached pages of a site as stale once a content change is committed.
+
+    Args:
+        sender: Model class sending the signal
+        instance: FAQEntry that was saved or deleted
+        kwargs: Remaining signal arguments
+    """
+    subdomain = (
+        Site.objects.filter(id=instance.site_id)
+        .values_list("subdomain", flat=True)
+        .first()
+    )
+    # Entries deleted along with their site are covered by invalidate_site
+    if subdomain is not None:
+        transaction.on_commit(
+            partial(page_cache.bump, subdomain), using=instance._state.db
+        )
+
+
+@receiver(pre_delete, sender=Site)
+def delete_sharded_entries(sender, instance: Site, **kwargs):
+    """
+    Delete the entries of a site stored on another shard along with the site.
+
+    The deletion cascade only follows relations within the default database.
+
+    Args:
+        sender: Model class sending the signal
+        instance: Site being deleted
+        kwargs: Remaining signal arguments
+    """
+    if instance.shard != DEFAULT_DB_ALIAS:
+        FAQEntry.objects.using(instance.shard).filter(site_id=instance.id).delete()
+
+
+@receiver(post_delete, sender=Site)
+def purge_logo_derivatives(sender, instance: Site, **kwargs):
+    """
+    Remove a deleted site's logo derivatives unless another site shares them.
+
+    Args:
+        sender: Model class sending the signal
+        instance: Site that was deleted
+        kwargs: Remaining signal arguments
+    """
+    if (
+        instance.logo_hash
+        and not Site.objects.filter(logo_hash=instance.logo_hash).exists()
+    ):
+        transaction.on_commit(partial(purge_derivatives, instance.logo_hash))
+
+
+@receiver(connection_created)
+def record_queries(sender, connection, **kwargs):
+    """
+    Count the queries made on a new database connection in the request metrics.
+
+    Args:
+        sender: Database backend class sending the signal
+        connection: Connection that was opened
+        kwargs: Remaining signal arguments
+    """
+    install_query_recorder(connection)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_context(sender, instance: User, **kwargs):
+    """
+    Make the cached context of a changed user stale on commit.
+
+    Args:
+        sender: Model class sending the signal
+        instance: User that was saved or deleted
+        kwargs: Remaining signal arguments
+    """
+    user_contexts.invalidate_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=Validation)
+@receiver(post_delete, sender=Validation)
+@receiver(post_save, sender=SiteMembership)
+def invalidate_member_context(sender, instance: Validation | SiteMembership, **kwargs):
+    """
+    Make the cached context of a user stale when their validation or roles change.
+
+    Memberships are removed in bulk by the permission helpers, which make the
+    contexts stale themselves. A delete receiver would stop those DELETEs
+    from running as a single query.
+
+    Args:
+        sender: Model class sending the signal
+        instance: Validation or SiteMembership that was saved or deleted
+        kwargs: Remaining signal arguments
+    """
+    user_contexts.invalidate_on_commit(instance.user_id)
+
+
+@receiver(post_save, sender=Site)
+@receiver(pre_delete, sender=Site)
+def invalidate_site_member_contexts(sender, instance: Site, **kwargs):
+    """
+    Make the cached contexts of a site's members stale, their roles name it.
+
+    Args:
+        sender: Model class sending the signal
+        instance: Site that was saved or is about to be deleted
+        kwargs: Remaining signal arguments
+    """
+    update_fields = kwargs.get("update_fields")
+    if kwargs.get("created") or (
+        update_fields is not None and "subdomain" not in update_fields
+    ):
+        return
+    for user_id in SiteMembership.objects.filter(site_id=instance.pk).values_list(
+        "user_id", flat=True
+    ):
+        user_contexts.invalidate_on_commit(user_id)
+
+
+@receiver(request_finished)
+def flush_session_extensions(sender, **kwargs):
+    """
+    Write the batched session expiry extensions once they have waited long enough.
+
+    Args:
+        sender: Handler class sending the signal
+        kwargs: Remaining signal arguments
+    """
+    SessionStore.extensions.flush_due()
@@ -0,0 +1,170 @@
+"""File storages for static assets and uploaded media."""
+
+import gzip
+import hashlib
+import posixpath
+from urllib.parse import quote
+
+import rcssmin
+import rjsmin
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage,
+    staticfiles_storage,
+)
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+
+class ShardedFileSystemStorage(FileSystemStorage):
+    """
+    FileSystemStorage spreading uploads over hashed subdirectories.
+
+    logos/python.png is stored as logos/<aa>/<bb>/python.png where aa and bb
+    come from the hash of the filename, so no directory grows past a few
+    hundred files however many sites upload a logo.
+    """
+
+    shard_depth = 2
+    shard_width = 2
+
+    def generate_filename(self, filename: str) -> str:
+        """
+        Calculate the sharded name to store an upload under.
+
+        Args:
+            filename: Name the upload_to function chose
+
+        Returns:
+            Name including the shard directories
+        """
+        filename = super().generate_filename(filename)
+        dirname, basename = posixpath.split(filename)
+        digest = hashlib.sha256(basename.encode()).hexdigest()
+        shards = [
+            digest[level * self.shard_width : (level + 1) * self.shard_width]
+            for level in range(self.shard_depth)
+        ]
+        return posixpath.join(dirname, *shards, basename)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that minifies and gzips during collectstatic.
+
+    The files in minify_paths are minified before they are hashed, so their
+    hashed names follow the minified content. Every hashed file with a
+    compressible extension gets a gzip sibling named <hashed name>.gz when that
+    is smaller, which static_asset serves to clients accepting gzip.
+    """
+
+    minify_paths = {
+        "css/devfaq.css": rcssmin.cssmin,
+        "js/devfaq.js": rjsmin.jsmin,
+    }
+    compress_extensions = (".css", ".js", ".map", ".svg", ".json", ".txt")
+    compress_min_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        """
+        Minify, hash and compress the collected files.
+
+        Args:
+            paths: Collected paths mapped to their source storage and path
+            dry_run: True if nothing should be written
+            options: Remaining collectstatic options
+
+        Yields:
+            Tuples of original name, hashed name and whether it was processed
+        """
+        if not dry_run:
+            for path, minify in self.minify_paths.items():
+                if path in paths:
+                    self._minify(path, minify)
+                    # Hash the minified copy rather than the source file
+                    paths[path] = (self, path)
+
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(
+            paths, dry_run, **options
+        ):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+
+        if not dry_run:
+            for hashed_name in sorted(hashed_names):
+                if hashed_name.endswith(self.compress_extensions):
+                    self._compress(hashed_name)
+
+    def _replace(self, name: str, content: bytes):
+        """
+        Overwrite a file in the storage.
+
+        Args:
+            name: Name of the file
+            content: New content of the file
+        """
+        self.delete(name)
+        self._save(name, ContentFile(content))
+
+    def _minify(self, name: str, minify):
+        """
+        Minify a collected file in place.
+
+        Args:
+            name: Name of the file
+            minify: Function minifying the text of the file
+        """
+        with self.open(name) as file_h:
+            source = file_h.read().decode()
+        self._replace(name, minify(source).encode())
+
+    def _compress(self, name: str):
+        """
+        Write the gzip sibling of a file if it is worth compressing.
+
+        Args:
+            name: Name of the file
+        """
+        with self.open(name) as file_h:
+            content = file_h.read()
+        if len(content) < self.compress_min_size:
+            return
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) < len(content):
+            self._replace(f"{name}.gz", compressed)
+
+    def is_hashed(self, name: str) -> bool:
+        """
+        Check whether a name is a hashed name written by collectstatic.
+
+        Args:
+            name: Name relative to STATIC_ROOT
+
+        Returns:
+            True if the content of the name can never change
+        """
+        hashed_names = getattr(self, "_hashed_names", None)
+        if hashed_names is None:
+            hashed_names = self._hashed_names = frozenset(self.hashed_files.values())
+        return name in hashed_names
+
+
+def asset_url(path: str) -> str:
+    """
+    Get the URL of a static asset, hashed once collectstatic has run.
+
+    Files missing from the manifest, such as assets added since the last
+    collectstatic, fall back to their unhashed URL.
+
+    Args:
+        path: Path of the asset relative to the static directory
+
+    Returns:
+        URL of the asset
+    """
+    try:
+        return staticfiles_storage.url(path)
+    except ValueError:
+        return f"{settings.STATIC_URL}{quote(path)}"
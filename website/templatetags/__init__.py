@@ -0,0 +1 @@
+"""Template tags for the website."""
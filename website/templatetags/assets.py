@@ -0,0 +1,21 @@
+"""Template tags resolving static assets."""
+
+from django import template
+
+from website.storage import asset_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def asset(path: str) -> str:
+    """
+    Resolve the URL of a static asset, using its hashed name when collected.
+
+    Args:
+        path: Path of the asset relative to the static directory
+
+    Returns:
+        URL of the asset
+    """
+    return asset_url(path)
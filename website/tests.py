@@ -1,9 +1,77 @@
 """Tests for the website."""
 
-from django.test import TestCase
+import gzip
+import tempfile
+from contextlib import ExitStack
+from dataclasses import FrozenInstanceError
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from smtplib import SMTPServerDisconnected
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connections
+from django.http import HttpResponse
+from django.template import TemplateSyntaxError
+from django.template.loader import get_template
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
 
 from devfaq.settings import BASE_DIR
-from website import helpers
+from website import (
+    helpers,
+    jobs,
+    loadtest,
+    logos,
+    metrics,
+    outbox,
+    pagecache,
+    provisioning,
+    responses,
+    routers,
+    search,
+    sessions,
+    uploadhandlers,
+    validators,
+    views,
+)
+from website.backends import get_site_roles, user_contexts
+from website.forms import CreateSite, CustomUserCreationForm
+from website.metrics import request_metrics
+from website.middleware import TenantMiddleware
+from website.models import (
+    FAQEntry,
+    Job,
+    OutboundEmail,
+    Site,
+    SiteMembership,
+    Validation,
+)
+from website.pagecache import page_cache
+from website.registry import (
+    SiteRegistry,
+    SubdomainIndex,
+    site_registry,
+    subdomain_index,
+)
+from website.routers import replica_pool
+from website.sharding import TenantMove
+from website.storage import asset_url
 
 DATABASES = {
     "default": {
@@ -13,6 +81,22 @@ DATABASES = {
 }
 
 
+def make_logo(size: tuple[int, int] = (1000, 1000), colour: str = "red"):
+    """
+    Create an uploaded JPEG logo.
+
+    Args:
+        size: Width and height of the image
+        colour: Colour to fill the image with
+
+    Returns:
+        SimpleUploadedFile holding the image
+    """
+    image = BytesIO()
+    Image.new("RGB", size, colour).save(image, format="JPEG")
+    return SimpleUploadedFile("logo.jpg", image.getvalue(), "image/jpeg")
+
+
 class Request:
     """Mocked version of a request object for testing."""
 
@@ -166,3 +250,1806 @@ class SubdomainTests(TestCase):
                 calculated_host_details.full_url, host_detail["expected_full_url"]
             )
             self.assertEqual(calculated_host_details.port, host_detail["expected_port"])
+
+    def test_host_details_cached(self):
+        """Test repeated hosts reuse the same immutable HostDetails."""
+        self.dummy_request.META["HTTP_HOST"] = "python.dev-faq.com"
+        self.dummy_request.scheme = "https"
+        first = helpers.get_host_details(request=self.dummy_request)
+        second = helpers.get_host_details(request=self.dummy_request)
+        self.assertIs(first, second)
+        with self.assertRaises(FrozenInstanceError):
+            first.subdomain = "php"
+
+    def test_tenant_middleware(self):
+        """Test TenantMiddleware attaches the host details to the request."""
+        self.dummy_request.META["HTTP_HOST"] = "php.dev-faq.com:8080"
+        self.dummy_request.scheme = "http"
+        request = TenantMiddleware(get_response=lambda request: request)(
+            self.dummy_request
+        )
+        self.assertEqual(request.host_details.subdomain, "php")
+        self.assertEqual(request.host_details.full_url, "http://php.dev-faq.com:8080")
+
+
+class SiteRegistryTests(TestCase):
+    """Tests for the process-wide site registry."""
+
+    def setUp(self) -> None:
+        """Initialise test requirements."""
+        cache.clear()
+        self.registry = SiteRegistry(max_size=2)
+        self.site = Site.objects.create(subdomain="python", description="Python")
+
+    def test_hits_and_misses_cached(self):
+        """Test both found and missing subdomains are only queried once."""
+        with self.assertNumQueries(2):
+            self.assertEqual(self.registry.get("python").id, self.site.id)
+            self.assertIsNone(self.registry.get("missing"))
+            self.assertEqual(self.registry.get("python").id, self.site.id)
+            self.assertIsNone(self.registry.get("missing"))
+        self.assertEqual(self.registry.stats()["hits"], 2)
+        self.assertEqual(self.registry.stats()["misses"], 2)
+
+    def test_eviction(self):
+        """Test the least recently used subdomain is evicted."""
+        for subdomain in ("python", "php", "rust"):
+            self.registry.get(subdomain)
+        self.assertEqual(self.registry.stats()["size"], 2)
+        self.assertEqual(self.registry.stats()["evictions"], 1)
+
+    def test_invalidated_across_registries(self):
+        """Test saving a site invalidates other workers through the shared cache."""
+        other_worker = SiteRegistry()
+        self.assertFalse(other_worker.get("python").live)
+        self.assertIsNone(other_worker.get("php"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.live = True
+            self.site.save()
+            Site.objects.create(subdomain="php", description="PHP")
+
+        self.assertTrue(other_worker.get("python").live)
+        self.assertIsNotNone(other_worker.get("php"))
+
+    def test_rename_invalidates_old_subdomain(self):
+        """Test renaming a site drops it under its old subdomain too."""
+        other_worker = SiteRegistry()
+        self.assertEqual(other_worker.get("python").id, self.site.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.site.subdomain = "python3"
+            self.site.save()
+
+        self.assertIsNone(other_worker.get("python"))
+        self.assertEqual(other_worker.get("python3").id, self.site.id)
+
+
+class JobQueueTests(TestCase):
+    """Tests for the background job queue."""
+
+    def setUp(self) -> None:
+        """Initialise test requirements."""
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root.name,
+            LOGO_DERIVATIVE_ROOT=Path(self.media_root.name, "derived"),
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = User.objects.create_user(username="owner", password="secret")
+        Validation.objects.create(user=self.user, is_validated=True)
+        site_registry.clear()
+
+    def test_failed_job_retried_then_failed(self):
+        """Test failing jobs back off and stop after max_attempts."""
+        job = jobs.enqueue("missing_handler", max_attempts=2)
+
+        with self.assertLogs("website.jobs", level="ERROR"):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(jobs.run_pending(), 0)
+
+        Job.objects.filter(id=job.id).update(run_after=timezone.now())
+        with self.assertLogs("website.jobs", level="ERROR"):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn("KeyError", job.last_error)
+
+    def test_visibility_timeout(self):
+        """Test a claimed job is only reclaimed once its lock expires."""
+        job = jobs.enqueue("missing_handler")
+        self.assertEqual(len(jobs.claim_jobs()), 1)
+        self.assertEqual(jobs.claim_jobs(), [])
+
+        Job.objects.filter(id=job.id).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual([claimed.id for claimed in jobs.claim_jobs()], [job.id])
+
+    def test_expired_last_attempt_failed(self):
+        """Test a job whose lock expires on its last attempt is not reclaimed."""
+        job = jobs.enqueue("missing_handler", max_attempts=1)
+        self.assertEqual(len(jobs.claim_jobs()), 1)
+
+        Job.objects.filter(id=job.id).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(jobs.claim_jobs(), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(job.locked_until)
+
+    def test_create_site_queues_logo(self):
+        """Test creating a site defers the logo resize to the job queue."""
+        self.client.force_login(self.user)
+        response = self.client.post(
+            "/create_site",
+            {"subdomain": "python", "description": "Python", "logo": make_logo()},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.json()["result"], "success")
+        site = Site.objects.get(subdomain="python")
+        self.assertFalse(site.logo_processed)
+        self.assertTrue(site.logo_url.endswith("logo_placeholder.svg"))
+
+        self.assertEqual(jobs.run_pending(), 1)
+        site.refresh_from_db()
+        self.assertTrue(site.logo_processed)
+        self.assertEqual(site.logo_hash, logos.hash_file(Path(site.logo.path)))
+        header = logos.derivative_path(site.logo_hash, logos.LOGO_VARIANTS["header"])
+        self.assertIn(header.name, site.logo_url)
+        with Image.open(header) as resized:
+            self.assertEqual(resized.size, (400, 400))
+
+    def test_logo_variants(self):
+        """Test variants are rendered on demand and served as immutable files."""
+        site = Site.objects.create(
+            subdomain="python", description="Python", logo=make_logo()
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.process_logo({"site_id": site.id})
+        site.refresh_from_db()
+        thumbnail = logos.LOGO_VARIANTS["thumbnail"]
+        self.assertFalse(logos.derivative_path(site.logo_hash, thumbnail).exists())
+
+        response = self.client.get("/logo/python/thumbnail")
+        self.assertRedirects(
+            response,
+            f"/logos/{site.logo_hash}/{thumbnail.filename}",
+            fetch_redirect_response=False,
+        )
+        response = self.client.get(response["Location"])
+        self.assertEqual(
+            response["Cache-Control"], "public, max-age=31536000, immutable"
+        )
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (64, 64))
+
+    def test_reupload_purges_variants(self):
+        """Test a new logo is processed and the derivatives of the old one removed."""
+        site = Site.objects.create(
+            subdomain="python", description="Python", logo=make_logo()
+        )
+        self.assertEqual(jobs.run_pending(), 1)
+        site.refresh_from_db()
+        old_directory = logos.derivative_directory(site.logo_hash)
+        self.assertTrue(old_directory.exists())
+
+        site.description = "Python answers"
+        site.save()
+        self.assertEqual(jobs.run_pending(), 0)
+
+        site.logo = make_logo(colour="blue")
+        site.save()
+        self.assertEqual(jobs.run_pending(), 1)
+        site.refresh_from_db()
+        self.assertFalse(old_directory.exists())
+        self.assertTrue(logos.derivative_directory(site.logo_hash).exists())
+
+
+class UploadLimitTests(TestCase):
+    """Tests for streaming upload limits and image header checks."""
+
+    def setUp(self) -> None:
+        """Initialise test requirements."""
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.user = User.objects.create_user(username="owner", password="secret")
+        Validation.objects.create(user=self.user, is_validated=True)
+        cache.clear()
+        site_registry.clear()
+
+    def test_oversized_upload_aborted(self):
+        """Test an upload over the limit is stopped and reported on the field."""
+        self.client.force_login(self.user)
+        logo = SimpleUploadedFile(
+            "logo.png", b"\0" * (validators.MAX_UPLOAD_SIZE + 1), "image/png"
+        )
+        response = self.client.post(
+            "/create_site",
+            {"subdomain": "python", "description": "Python", "logo": logo},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(
+            response.json()["errors"]["logo"], [validators.UPLOAD_SIZE_ERROR]
+        )
+        self.assertFalse(Site.objects.exists())
+
+    def test_upload_at_the_limit_accepted(self):
+        """Test a file just under the limit is not rejected for the form fields."""
+        self.client.force_login(self.user)
+        logo = make_logo(size=(10, 10))
+        data = logo.read()
+        logo = SimpleUploadedFile(
+            "logo.jpg",
+            data + b"\0" * (validators.MAX_UPLOAD_SIZE - len(data)),
+            "image/jpeg",
+        )
+        response = self.client.post(
+            "/create_site",
+            {"subdomain": "python", "description": "Python " * 200, "logo": logo},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.json()["result"], "success")
+        self.assertTrue(Site.objects.filter(subdomain="python").exists())
+
+    def test_oversized_upload_drained(self):
+        """Test the body is drained rather than the connection reset."""
+        request = RequestFactory().post("/create_site")
+        handler = uploadhandlers.SizeLimitUploadHandler(request)
+        handler.new_file("logo", "logo.png", "image/png", None)
+        with self.assertRaises(StopUpload) as raised:
+            handler.receive_data_chunk(b"\0" * (validators.MAX_UPLOAD_SIZE + 1), 0)
+        self.assertFalse(raised.exception.connection_reset)
+        self.assertEqual(request.upload_errors, {"logo": validators.UPLOAD_SIZE_ERROR})
+
+    def test_image_header_validated(self):
+        """Test images over the pixel limit are rejected from their header."""
+        form = CreateSite(
+            {"subdomain": "python", "description": "Python"},
+            {"logo": make_logo(size=(validators.IMAGE_MAX_DIMENSION + 1, 10))},
+            user=self.user,
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn("logo", form.errors)
+
+        form = CreateSite(
+            {"subdomain": "python", "description": "Python"},
+            {"logo": make_logo(size=(100, 100))},
+            user=self.user,
+        )
+        self.assertTrue(form.is_valid())
+
+
+class FailingEmailBackend(locmem.EmailBackend):
+    """Email backend that refuses every message."""
+
+    def send_messages(self, messages):
+        """Fail to send the messages."""
+        raise ConnectionRefusedError("Mail server unavailable")
+
+
+class DisconnectingEmailBackend(locmem.EmailBackend):
+    """Email backend whose first connection drops on the first message."""
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialise DisconnectingEmailBackend.
+
+        Args:
+            args: Positional arguments
+            kwargs: Keyword arguments
+        """
+        super().__init__(*args, **kwargs)
+        self.opened = 0
+        self.connected = False
+
+    def open(self):
+        """Open a connection."""
+        self.opened += 1
+        self.connected = True
+
+    def close(self):
+        """Close the connection."""
+        self.connected = False
+
+    def send_messages(self, messages):
+        """Send the messages unless the connection is closed or drops."""
+        if not self.connected:
+            raise SMTPServerDisconnected("please run connect() first")
+        if self.opened == 1:
+            self.connected = False
+            raise SMTPServerDisconnected("Connection unexpectedly closed")
+        return super().send_messages(messages)
+
+
+class OutboxTests(TestCase):
+    """Tests for the email outbox."""
+
+    def test_register_queues_email(self):
+        """Test registering queues the validation email instead of sending it."""
+        response = self.client.post(
+            "/register",
+            {
+                "username": "new-user",
+                "email": "new-user@dev-faq.com",
+                "password1": "a-Long-password-123",
+                "password2": "a-Long-password-123",
+            },
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(response.json()["result"], "success")
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.recipient, "new-user@dev-faq.com")
+        self.assertIn("/validate?token=", email.message)
+
+    def test_deliver_batch_over_one_connection(self):
+        """Test a batch of emails is sent over a single connection."""
+        for number in range(3):
+            helpers.send_site_email(
+                "no-reply@dev-faq.com", f"user{number}@dev-faq.com", "Hi", "Hello"
+            )
+        with mock.patch(
+            "website.outbox.get_connection", wraps=outbox.get_connection
+        ) as get_connection:
+            self.assertEqual(outbox.deliver_outbox(), 3)
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(
+            OutboundEmail.objects.exclude(status=OutboundEmail.DONE).exists()
+        )
+
+    @override_settings(EMAIL_BACKEND="website.tests.FailingEmailBackend")
+    def test_failed_email_dead_lettered(self):
+        """Test failing emails back off then stay failed after max_attempts."""
+        helpers.send_site_email("no-reply@dev-faq.com", "user@dev-faq.com", "Hi", "")
+        OutboundEmail.objects.update(max_attempts=2)
+
+        with self.assertLogs("website.outbox", level="ERROR"):
+            self.assertEqual(outbox.deliver_outbox(), 0)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.status, OutboundEmail.PENDING)
+        self.assertGreater(email.run_after, timezone.now())
+
+        OutboundEmail.objects.update(run_after=timezone.now())
+        with self.assertLogs("website.outbox", level="ERROR"):
+            outbox.deliver_outbox()
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.FAILED)
+        self.assertIn("Mail server unavailable", email.last_error)
+
+    @override_settings(EMAIL_BACKEND="website.tests.DisconnectingEmailBackend")
+    def test_reconnect_after_smtp_error(self):
+        """Test the connection is reopened for the rest of the batch."""
+        for number in range(3):
+            helpers.send_site_email(
+                "no-reply@dev-faq.com", f"user{number}@dev-faq.com", "Hi", "Hello"
+            )
+        with self.assertLogs("website.outbox", level="ERROR"):
+            self.assertEqual(outbox.deliver_outbox(), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        failed = OutboundEmail.objects.get(status=OutboundEmail.PENDING)
+        self.assertIn("Connection unexpectedly closed", failed.last_error)
+
+
+class PermissionTests(TestCase):
+    """Tests for site memberships and the batched permission helpers."""
+
+    def setUp(self) -> None:
+        """Initialise test requirements."""
+        self.users = [
+            User.objects.create_user(username=f"user{number}") for number in range(5)
+        ]
+        self.subdomains = [f"site{number}" for number in range(4)]
+        Site.objects.bulk_create(
+            Site(subdomain=subdomain, description=subdomain)
+            for subdomain in self.subdomains
+        )
+
+    def test_add_and_remove_constant_queries(self):
+        """Test adding and removing roles cost a constant number of queries."""
+        with self.assertNumQueries(2):
+            helpers.users_add_permissions(
+                self.users, self.subdomains, ["owner", "contributor"]
+            )
+        with self.assertNumQueries(2):
+            helpers.users_add_permissions(self.users, self.subdomains, ["owner"])
+        self.assertEqual(SiteMembership.objects.count(), 40)
+
+        with self.assertNumQueries(1):
+            helpers.users_remove_permissions(
+                self.users, self.subdomains[:2], ["owner", "contributor"]
+            )
+        self.assertEqual(SiteMembership.objects.count(), 20)
+
+    def test_backend_memoizes_site_roles(self):
+        """Test site roles are answered with one query per site and request."""
+        user = self.users[0]
+        helpers.user_add_permissions(user, "site0", ["contributor"])
+        with self.assertNumQueries(1):
+            self.assertTrue(user.has_perm("website.site0_contributor"))
+            self.assertFalse(user.has_perm("website.site0_owner"))
+            self.assertFalse(user.has_perm("website.site0_owner"))
+
+        helpers.user_add_permissions(user, "site0", ["owner"])
+        self.assertTrue(user.has_perm("website.site0_owner"))
+        helpers.user_remove_permissions(user, "site0", ["owner"])
+        self.assertFalse(user.has_perm("website.site0_owner"))
+
+
+class UserControlPanelTests(TestCase):
+    """Tests for the keyset paginated site listing in the control panel."""
+
+    def setUp(self) -> None:
+        """Initialise test requirements."""
+        cache.clear()
+        self.user = User.objects.create_user(username="owner")
+        other_user = User.objects.create_user(username="other")
+        Site.objects.bulk_create(
+            Site(subdomain=f"site{number}", description="", created_by=self.user)
+            for number in range(30)
+        )
+        Site.objects.create(subdomain="other", description="", created_by=other_user)
+        helpers.users_add_permissions(
+            [self.user], [f"site{number}" for number in range(30)], ["owner"]
+        )
+        helpers.user_add_permissions(other_user, "other", ["owner"])
+        self.client.force_login(self.user)
+
+    def test_pages(self):
+        """Test only the user's sites are listed, one page at a time."""
+        response = self.client.get("/user_cp")
+        sites = response.context["SITES"]
+        self.assertEqual(len(sites), 25)
+        self.assertEqual(response.context["NEXT_AFTER"], sites[-1].id)
+        self.assertContains(response, f"/user_cp/sites?after={sites[-1].id}")
+        self.assertTrue(
+            {"description", "logo", "logo_hash", "logo_processed"}
+            <= sites[0].get_deferred_fields()
+        )
+
+        # The page of sites, the session and the user come from the cache
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                "/user_cp/sites", {"after": response.context["NEXT_AFTER"]}
+            )
+        self.assertEqual(
+            [site.subdomain for site in response.context["SITES"]],
+            [f"site{number}" for number in range(25, 30)],
+        )
+        self.assertIsNone(response.context["NEXT_AFTER"])
+        self.assertNotContains(response, "other")
+
+
+class SubdomainAvailabilityTests(TestCase):
+    """Tests for the in-memory subdomain index and availability endpoint."""
+
+    def setUp(self) -> None:
+        """Initialise test requirements."""
+        cache.clear()
+        site_registry.clear()
+        Site.objects.create(subdomain="python", description="")
+        Site.objects.create(subdomain="python-faq", description="")
+        subdomain_index.reload()
+
+    def test_availability_without_queries(self):
+        """Test the endpoint answers from the index with no database queries."""
+        with self.assertNumQueries(0):
+            response = self.client.get("/subdomain_available", {"subdomain": "rust"})
+        self.assertContains(response, "rust is available")
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/subdomain_available", {"subdomain": "Python"})
+        self.assertContains(response, "The subdomain already exists")
+        self.assertContains(response, "Try python-dev, my-python, python-2")
+
+        response = self.client.get("/subdomain_available", {"subdomain": "-bad"})
+        self.assertContains(response, "The requested subdomain is invalid")
+        response = self.client.get("/subdomain_available", {"subdomain": "a" * 21})
+        self.assertContains(response, "at most 20 characters")
+
+    def test_lower_case_policy(self):
+        """Test subdomains are stored in lower case and upper case is rejected."""
+        form = CreateSite(data={"subdomain": "Rust", "description": "Rust"})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["subdomain"], "rust")
+        form = CreateSite(data={"subdomain": "PYTHON", "description": "Python"})
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors["subdomain"], ["The subdomain already exists"])
+
+        with self.assertRaises(ValidationError):
+            Site(subdomain="Rust", description="Rust").full_clean()
+        self.assertEqual(
+            helpers.HostParser(["dev-faq.com"]).parse("https", "Python.DEV-FAQ.com"),
+            helpers.HostDetails(
+                scheme="https",
+                subdomain="python",
+                hostname="dev-faq.com",
+                port=443,
+                full_url="https://python.dev-faq.com",
+            ),
+        )
+
+    def test_index_follows_changes(self):
+        """Test changes are applied incrementally rather than reloading."""
+        with self.captureOnCommitCallbacks(execute=True):
+            Site.objects.create(subdomain="rust", description="")
+            Site.objects.filter(subdomain="python").delete()
+
+        index = SubdomainIndex(site_registry)
+        index.reload()
+        with self.captureOnCommitCallbacks(execute=True):
+            Site.objects.create(subdomain="php", description="")
+
+        with self.assertNumQueries(1):
+            self.assertTrue(index.is_taken("php"))
+        with self.assertNumQueries(0):
+            self.assertTrue(index.is_taken("rust"))
+            self.assertFalse(index.is_taken("python"))
+
+
+class ValidationTokenTests(TestCase):
+    """Tests for email validation tokens."""
+
+    def setUp(self):
+        """Create a user awaiting validation."""
+        cache.clear()
+        self.user = User.objects.create_user("test-user", "test-user@dev-faq.com")
+        self.token = Validation.create_for_user(self.user)
+
+    def test_token_stored_as_digest(self):
+        """Test only the digest of the emailed token is stored."""
+        validation = Validation.objects.get(user=self.user)
+        self.assertNotEqual(validation.token_digest, self.token)
+        self.assertEqual(validation.token_digest, Validation.hash_token(self.token))
+
+    def test_validate_once(self):
+        """Test a token validates the user with a lookup and an update, once."""
+        with self.assertNumQueries(2):
+            response = self.client.get("/validate", {"token": self.token})
+        self.assertRedirects(response, "/user_cp", fetch_redirect_response=False)
+        validation = Validation.objects.get(user=self.user)
+        self.assertTrue(validation.is_validated)
+        self.assertIsNone(validation.token_digest)
+
+        response = self.client.get("/validate", {"token": self.token})
+        self.assertContains(response, "Invalid or expired token")
+        response = self.client.get("/validate")
+        self.assertContains(response, "No token")
+
+    def test_expired_token(self):
+        """Test expired tokens are rejected and purged."""
+        Validation.objects.filter(user=self.user).update(
+            token_created=timezone.now() - Validation.TOKEN_MAX_AGE - timedelta(1)
+        )
+        fresh_user = User.objects.create_user("fresh-user", "fresh@dev-faq.com")
+        Validation.create_for_user(fresh_user)
+
+        response = self.client.get("/validate", {"token": self.token})
+        self.assertContains(response, "Invalid or expired token")
+        self.assertFalse(Validation.objects.get(user=self.user).is_validated)
+
+        call_command("purge_validations", batch_size=1, stdout=StringIO())
+        self.assertIsNone(Validation.objects.get(user=self.user).token_digest)
+        self.assertIsNotNone(Validation.objects.get(user=fresh_user).token_digest)
+
+    def test_resend(self):
+        """Test users whose token expired get a new one, at most every interval."""
+        Validation.objects.filter(user=self.user).update(
+            token_created=timezone.now() - Validation.TOKEN_MAX_AGE - timedelta(1)
+        )
+        call_command("purge_validations", stdout=StringIO())
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get("/user_cp"), "Resend validation email")
+
+        response = self.client.post(
+            "/user_cp/resend_validation", headers={"HX-Request": "true"}
+        )
+        self.assertContains(response, "A new validation link has been sent")
+        self.assertNotContains(response, "<html>")
+        email = OutboundEmail.objects.get(recipient="test-user@dev-faq.com")
+        token = email.message.split("/validate?token=")[1].split()[0]
+
+        response = self.client.post("/user_cp/resend_validation")
+        self.assertRedirects(response, "/user_cp", fetch_redirect_response=False)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+        self.assertEqual(self.client.get("/user_cp/resend_validation").status_code, 405)
+
+        self.assertFalse(Validation.validate_token(self.token))
+        self.assertTrue(Validation.validate_token(token))
+        self.assertIsNone(Validation.reissue_token(self.user))
+
+    def test_resend_without_validation(self):
+        """Test users created outside registration are given a validation."""
+        admin = User.objects.create_superuser("admin", "admin@dev-faq.com")
+        token = Validation.reissue_token(admin)
+        self.assertTrue(Validation.validate_token(token))
+
+
+class RegistrationFormTests(TestCase):
+    """Tests for the registration form."""
+
+    def setUp(self):
+        """Create an existing user."""
+        User.objects.create_user("Existing-User", "Existing@dev-faq.com")
+
+    def registration_form(self, username: str, email: str) -> CustomUserCreationForm:
+        """
+        Build a bound registration form.
+
+        Args:
+            username: Username to register
+            email: Email to register
+
+        Returns:
+            Bound form
+        """
+        return CustomUserCreationForm(
+            {
+                "username": username,
+                "email": email,
+                "password1": "a-Long-password-123",
+                "password2": "a-Long-password-123",
+            }
+        )
+
+    def test_uniqueness_checked_in_one_query(self):
+        """Test username and email are checked together, ignoring case."""
+        form = self.registration_form("existing-user", "existing@DEV-FAQ.com")
+        with self.assertNumQueries(1):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors,
+            {
+                "username": ["Please choose a different username"],
+                "email": ["Email is already in use"],
+            },
+        )
+
+        form = self.registration_form("new-user", "EXISTING@dev-faq.com")
+        self.assertFalse(form.is_valid())
+        self.assertEqual(list(form.errors), ["email"])
+
+        with self.assertNumQueries(1):
+            self.assertTrue(
+                self.registration_form("new-user", "new@dev-faq.com").is_valid()
+            )
+
+
+class FAQSearchTests(TestCase):
+    """Tests for the per-site FAQ search."""
+
+    def setUp(self):
+        """Create two sites with overlapping entries."""
+        cache.clear()
+        site_registry.clear()
+        self.python = Site.objects.create(subdomain="python", description="")
+        self.rust = Site.objects.create(subdomain="rust", description="")
+        self.in_answer = FAQEntry.objects.create(
+            site=self.python,
+            question="How do I wrap a function?",
+            answer="Write a decorator that returns the wrapper.",
+        )
+        self.in_question = FAQEntry.objects.create(
+            site=self.python,
+            question="What is a decorator?",
+            answer="A callable that takes a function and returns a function.",
+        )
+        FAQEntry.objects.create(
+            site=self.rust,
+            question="Does Rust have a decorator?",
+            answer="Attribute macros are the closest equivalent.",
+        )
+
+    def test_ranked_and_scoped_to_site(self):
+        """Test only the site's entries are returned, question matches first."""
+        results = search.search_faq(self.python.id, "decorators")
+        self.assertEqual(results.entries, [self.in_question, self.in_answer])
+        self.assertFalse(results.has_next)
+
+        results = search.search_faq(self.python.id, "decorator", page_size=1)
+        self.assertEqual(results.entries, [self.in_question])
+        self.assertTrue(results.has_next)
+        results = search.search_faq(self.python.id, "decorator", page=2, page_size=1)
+        self.assertEqual(results.entries, [self.in_answer])
+        self.assertFalse(results.has_next)
+
+        self.assertEqual(search.search_faq(self.python.id, '"*').entries, [])
+
+    def test_every_match_ranked(self):
+        """Test old matches are ranked and reachable behind many newer ones."""
+        FAQEntry.objects.bulk_create(
+            FAQEntry(
+                site=self.python,
+                question=f"Question {number}",
+                answer="Use a decorator.",
+            )
+            for number in range(1200)
+        )
+        results = search.search_faq(self.python.id, "decorator", page_size=1)
+        self.assertEqual(results.entries, [self.in_question])
+
+        results = search.search_faq(self.python.id, "decorator", page=61)
+        self.assertEqual(len(results.entries), 2)
+        self.assertIn(self.in_answer, results.entries)
+        self.assertFalse(results.has_next)
+
+    def test_index_follows_changes(self):
+        """Test updated and deleted entries are reindexed."""
+        self.in_question.question = "What is a generator?"
+        self.in_question.save()
+        self.assertEqual(
+            search.search_faq(self.python.id, "generator").entries,
+            [self.in_question],
+        )
+        self.assertEqual(
+            search.search_faq(self.python.id, "decorator").entries, [self.in_answer]
+        )
+
+        self.in_answer.delete()
+        self.assertEqual(search.search_faq(self.python.id, "decorator").entries, [])
+
+    def test_search_view(self):
+        """Test the view searches the site the subdomain belongs to."""
+        with mock.patch.object(helpers, "ALLOWED_HOSTS", [".dev-faq.com"]):
+            with override_settings(ALLOWED_HOSTS=[".dev-faq.com"]):
+                response = self.client.get(
+                    "/search", {"q": "decorator"}, HTTP_HOST="rust.dev-faq.com"
+                )
+                self.assertContains(response, "Does Rust have a decorator?")
+                self.assertNotContains(response, "What is a decorator?")
+
+                response = self.client.get(
+                    "/search", {"q": "decorator"}, HTTP_HOST="php.dev-faq.com"
+                )
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ALLOWED_HOSTS=[".dev-faq.com"])
+class PageCacheTests(TestCase):
+    """Tests for the per-tenant page cache."""
+
+    def setUp(self):
+        """Create two sites and serve them from the dev-faq.com hosts."""
+        cache.clear()
+        site_registry.clear()
+        patcher = mock.patch.object(helpers, "ALLOWED_HOSTS", [".dev-faq.com"])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.python = Site.objects.create(subdomain="python", description="")
+        self.rust = Site.objects.create(subdomain="rust", description="")
+
+    def get(self, subdomain: str, path: str = "/", **extra):
+        """
+        Request a page from a site.
+
+        Args:
+            subdomain: Subdomain of the site
+            path: Path of the page
+            extra: Further arguments for the test client
+
+        Returns:
+            The response
+        """
+        return self.client.get(path, HTTP_HOST=f"{subdomain}.dev-faq.com", **extra)
+
+    def test_pages_cached_per_tenant(self):
+        """Test a site's changes only make that site's pages stale."""
+        self.assertEqual(self.get("python")["X-Page-Cache"], "miss")
+        self.assertEqual(self.get("rust")["X-Page-Cache"], "miss")
+        response = self.get("python")
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        self.assertContains(response, "Subdomain used was python")
+        self.assertEqual(
+            self.get("python", HTTP_ACCEPT="application/json")["X-Page-Cache"],
+            "miss",
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python.description = "Python questions"
+            self.python.save()
+        self.assertEqual(self.get("python")["X-Page-Cache"], "miss")
+        self.assertEqual(self.get("rust")["X-Page-Cache"], "hit")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FAQEntry.objects.create(site=self.rust, question="Q", answer="A")
+        self.assertEqual(self.get("rust")["X-Page-Cache"], "miss")
+        self.assertEqual(self.get("python")["X-Page-Cache"], "hit")
+
+    def test_stale_served_while_rendering(self):
+        """Test only the worker holding the lock renders a stale page."""
+        self.get("python")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python.save()
+
+        key = page_cache.page_key("python", "/", "text/html", htmx=False)
+        self.assertTrue(page_cache.acquire(key))
+        self.assertEqual(self.get("python")["X-Page-Cache"], "stale")
+        page_cache.release(key)
+        self.assertEqual(self.get("python")["X-Page-Cache"], "miss")
+        self.assertEqual(self.get("python")["X-Page-Cache"], "hit")
+
+    def test_cold_miss_waits_for_render(self):
+        """Test a page nobody has stored is only rendered by the lock holder."""
+        key = page_cache.page_key("python", "/", "text/html", htmx=False)
+        self.assertTrue(page_cache.acquire(key))
+
+        def render_elsewhere(seconds):
+            page_cache.set(key, 0, HttpResponse("Rendered elsewhere"))
+
+        with mock.patch.object(pagecache.time, "sleep", side_effect=render_elsewhere):
+            response = self.get("python")
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        self.assertContains(response, "Rendered elsewhere")
+
+        cache.delete(key)
+        with mock.patch.object(
+            pagecache.time, "sleep", side_effect=lambda seconds: page_cache.release(key)
+        ):
+            self.assertEqual(self.get("python")["X-Page-Cache"], "miss")
+        self.assertEqual(self.get("python")["X-Page-Cache"], "hit")
+
+    def test_sessions_and_uncached_views_bypass(self):
+        """Test visitors with a session and unmarked views are never cached."""
+        self.get("python")
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = "session"
+        self.assertNotIn("X-Page-Cache", self.get("python"))
+        del self.client.cookies[settings.SESSION_COOKIE_NAME]
+
+        response = self.get("python", "/subdomain_available", data={"subdomain": "a"})
+        self.assertNotIn("X-Page-Cache", response)
+
+
+class StaticAssetTests(TestCase):
+    """Tests for the hashed and precompressed static assets."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Collect the static files into a temporary STATIC_ROOT."""
+        super().setUpClass()
+        static_root = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(STATIC_ROOT=static_root))
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+    def test_hashed_minified_and_compressed(self):
+        """Test hashed assets are minified, gzipped and cached forever."""
+        url = asset_url("js/devfaq.js")
+        self.assertRegex(url, r"^/static/js/devfaq\.[0-9a-f]{12}\.js$")
+        self.assertContains(self.client.get("/user_cp", follow=True), url)
+
+        response = self.client.get(url)
+        content = b"".join(response.streaming_content)
+        self.assertNotIn(b"\n    ", content)
+        self.assertEqual(
+            response["Cache-Control"], "public, max-age=31536000, immutable"
+        )
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertNotIn("Content-Encoding", response)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="br, gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Content-Type"], "text/javascript")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), content)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertNotIn("Content-Encoding", response)
+
+    def test_unhashed_assets_revalidated(self):
+        """Test unhashed names are revalidated and paths are confined."""
+        response = self.client.get("/static/js/devfaq.js")
+        self.assertEqual(response["Cache-Control"], "public, no-cache")
+        response = self.client.get(
+            "/static/js/devfaq.js", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+        self.assertEqual(self.client.get("/static/../manage.py").status_code, 404)
+        self.assertEqual(self.client.get("/static/js/missing.js").status_code, 404)
+
+
+class MediaStorageTests(TestCase):
+    """Tests for the sharded media storage and logo serving."""
+
+    def setUp(self):
+        """Store a logo in a temporary MEDIA_ROOT."""
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root.name,
+            SENDFILE_ACCEL_LOCATIONS={media_root.name: "/internal/media/"},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.name = default_storage.save(
+            default_storage.generate_filename("logos/python.png"),
+            make_logo(size=(10, 10)),
+        )
+
+    def test_sharded_names(self):
+        """Test uploads are spread over hashed subdirectories."""
+        self.assertRegex(self.name, r"^logos/[0-9a-f]{2}/[0-9a-f]{2}/python\.png$")
+        self.assertEqual(
+            default_storage.generate_filename("logos/python.png"), self.name
+        )
+        self.assertNotEqual(
+            default_storage.generate_filename("logos/rust.png"), self.name
+        )
+
+    def test_conditional_requests(self):
+        """Test logos carry validators and answer revalidation with 304."""
+        url = default_storage.url(self.name)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response["Cache-Control"], "public, no-cache")
+
+        for header, value in (
+            ("HTTP_IF_NONE_MATCH", response["ETag"]),
+            ("HTTP_IF_MODIFIED_SINCE", response["Last-Modified"]),
+        ):
+            not_modified = self.client.get(url, **{header: value})
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified["ETag"], response["ETag"])
+
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, 200
+        )
+        self.assertEqual(self.client.get("/media/logos/../../x").status_code, 404)
+
+    def test_sendfile_backends(self):
+        """Test the file body can be handed to the web server."""
+        url = default_storage.url(self.name)
+        with override_settings(SENDFILE_BACKEND="x-accel-redirect"):
+            response = self.client.get(url)
+        self.assertEqual(response["X-Accel-Redirect"], f"/internal/media/{self.name}")
+        self.assertEqual(response.content, b"")
+
+        with override_settings(SENDFILE_BACKEND="x-sendfile"):
+            response = self.client.get(url)
+        self.assertEqual(response["X-Sendfile"], default_storage.path(self.name))
+
+
+class AsyncViewTests(TestCase):
+    """Tests for the async views and middleware."""
+
+    def setUp(self):
+        """Create a site and start from an empty page cache."""
+        cache.clear()
+        site_registry.clear()
+        self.site = Site.objects.create(subdomain="python", description="")
+
+    def test_views_async(self):
+        """Test the views served without thread hops under ASGI are coroutines."""
+        for view in (
+            views.create_site,
+            views.email_validation,
+            views.index,
+            views.register,
+        ):
+            with self.subTest(view=view.__name__):
+                self.assertTrue(iscoroutinefunction(view))
+
+    async def test_middleware_async_mode(self):
+        """Test the middleware runs natively when the chain is async."""
+
+        async def get_response(request):
+            return request
+
+        middleware = TenantMiddleware(get_response=get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = Request()
+        request.META["HTTP_HOST"] = "python.dev-faq.com"
+        request.scheme = "https"
+        with mock.patch.object(helpers, "ALLOWED_HOSTS", [".dev-faq.com"]):
+            request = await middleware(request)
+        self.assertEqual(request.site.id, self.site.id)
+
+        response = await self.async_client.get("/")
+        self.assertEqual(response["X-Page-Cache"], "miss")
+        response = await self.async_client.get("/")
+        self.assertEqual(response["X-Page-Cache"], "hit")
+
+    async def test_register_and_validate(self):
+        """Test registering logs the user in and the emailed token validates."""
+        response = await self.async_client.post(
+            "/register",
+            {
+                "username": "new-user",
+                "email": "new-user@dev-faq.com",
+                "password1": "a-Long-password-123",
+                "password2": "a-Long-password-123",
+            },
+            headers={"accept": "application/json"},
+        )
+        self.assertEqual(response.json()["result"], "success")
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        user = await User.objects.aget(username="new-user")
+        self.assertTrue(user.check_password("a-Long-password-123"))
+        email = await OutboundEmail.objects.aget()
+        token = email.message.split("/validate?token=")[1].split()[0]
+
+        response = await self.async_client.get("/validate", {"token": token})
+        self.assertRedirects(response, "/user_cp", fetch_redirect_response=False)
+        validation = await Validation.objects.aget(user=user)
+        self.assertTrue(validation.is_validated)
+
+    async def test_create_site(self):
+        """Test only validated users create sites and become their owner."""
+        user = await User.objects.acreate_user("test-user", "test-user@dev-faq.com")
+        await Validation.acreate_for_user(user)
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get("/create_site")
+        self.assertRedirects(response, "/user_cp", fetch_redirect_response=False)
+
+        await Validation.objects.filter(user=user).aupdate(is_validated=True)
+        # Updates send no signals, and the test transaction never commits
+        user_contexts.invalidate(user.id)
+        response = await self.async_client.post(
+            "/create_site",
+            {"subdomain": "rust", "description": "Rust"},
+            headers={"accept": "application/json"},
+        )
+        self.assertEqual(response.json()["result"], "success")
+        site = await Site.objects.aget(subdomain="rust")
+        self.assertEqual(site.created_by_id, user.id)
+        self.assertTrue(
+            await SiteMembership.objects.filter(
+                site=site, user=user, role="owner"
+            ).aexists()
+        )
+        self.assertTrue(
+            await Job.objects.filter(
+                name="process_logo", payload={"site_id": site.id}
+            ).aexists()
+        )
+
+
+class MetricsTests(TestCase):
+    """Tests for the request metrics."""
+
+    def setUp(self):
+        """Start from empty histograms."""
+        request_metrics.clear()
+        self.addCleanup(request_metrics.clear)
+
+    def test_histogram_exposition(self):
+        """Test buckets are cumulative and label values escaped."""
+        histogram = metrics.Histogram("test_seconds", "Test.", ("view",), (0.1, 1))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value, ('say "hi"',))
+        self.assertEqual(
+            histogram.expose(),
+            [
+                "# HELP test_seconds Test.",
+                "# TYPE test_seconds histogram",
+                'test_seconds_bucket{view="say \\"hi\\"",le="0.1"} 2',
+                'test_seconds_bucket{view="say \\"hi\\"",le="1"} 3',
+                'test_seconds_bucket{view="say \\"hi\\"",le="+Inf"} 4',
+                'test_seconds_sum{view="say \\"hi\\""} 2.65',
+                'test_seconds_count{view="say \\"hi\\""} 4',
+            ],
+        )
+        self.assertEqual(
+            metrics.RequestMetrics(tenant_labels=True).labels("index", "python"),
+            ("index", "python"),
+        )
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_requests_recorded_per_view(self):
+        """Test queries, templates and sizes are attributed to the URL name."""
+        response = self.client.get("/validate", {"token": "not-a-token"})
+        self.assertContains(response, "Invalid or expired token")
+        self.client.get("/no-such-page")
+
+        exposition = self.client.get(
+            "/metrics", headers={"authorization": "Bearer secret"}
+        )
+        self.assertEqual(
+            exposition["Content-Type"], "text/plain; version=0.0.4; charset=utf-8"
+        )
+        lines = exposition.content.decode().splitlines()
+        self.assertIn(
+            'devfaq_request_db_queries_bucket{view="email_validation",le="0"} 0', lines
+        )
+        self.assertIn(
+            'devfaq_request_db_queries_bucket{view="email_validation",le="1"} 1', lines
+        )
+        self.assertIn(
+            'devfaq_request_duration_seconds_count{view="unresolved"} 1', lines
+        )
+        self.assertIn(
+            f'devfaq_response_size_bytes_sum{{view="email_validation"}} '
+            f"{len(response.content)}",
+            lines,
+        )
+        stats = request_metrics.template_seconds._series[("email_validation",)]
+        self.assertEqual(stats[2], 1)
+        self.assertGreater(stats[1], 0)
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_token_required(self):
+        """Test the endpoint only answers scrapers sending the token."""
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get(
+            "/metrics", headers={"authorization": "Bearer secret"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_unconfigured(self):
+        """Test the endpoint is hidden without a token unless DEBUG is on."""
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+@override_settings(ALLOWED_HOSTS=[".dev-faq.com"])
+class LoadTestTests(TestCase):
+    """Tests for the load test data and driver."""
+
+    def setUp(self):
+        """Generate a small dataset with its uploads in a temporary MEDIA_ROOT."""
+        cache.clear()
+        site_registry.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch.object(helpers, "ALLOWED_HOSTS", [".dev-faq.com"])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dataset = loadtest.generate(users=4, sites=3)
+
+    def test_every_route_driven(self):
+        """Test the planned mix is served without errors and queries counted."""
+        self.assertEqual(Site.objects.exclude(logo="").count(), 3)
+        self.assertEqual(Validation.objects.filter(is_validated=True).count(), 4)
+
+        driver = loadtest.Driver(host="dev-faq.com", dataset=self.dataset)
+        results, seconds = driver.run(
+            loadtest.plan(self.dataset, requests=60), concurrency=1
+        )
+        summary = loadtest.summarise_results(results, seconds)
+        self.assertEqual(set(summary["routes"]), set(loadtest.ROUTE_WEIGHTS))
+        self.assertEqual(summary["total"]["requests"], 60)
+        self.assertEqual(summary["total"]["errors"], 0)
+        # The page of sites, plus loading each user's context once
+        self.assertLess(summary["routes"]["/user_cp"]["queries_per_request"], 2)
+        # A lookup of the token, plus an update when it is valid
+        self.assertLessEqual(summary["routes"]["/validate"]["queries_per_request"], 2)
+        self.assertGreater(summary["total"]["requests_per_second"], 0)
+
+    def test_regressions(self):
+        """Test figures worse than the baseline by more than the tolerance fail."""
+        row = {
+            "requests": 10,
+            "errors": 0,
+            "p50_ms": 1.0,
+            "p95_ms": 10.0,
+            "p99_ms": 20.0,
+            "queries_per_request": 2.0,
+        }
+        baseline = {
+            "routes": {"/": row},
+            "total": {**row, "requests_per_second": 100.0},
+        }
+        current = {
+            "routes": {"/": {**row, "p95_ms": 11.0, "queries_per_request": 3.0}},
+            "total": {**row, "p50_ms": 1.5, "requests_per_second": 70.0},
+        }
+        self.assertEqual(
+            loadtest.regressions(baseline, current, tolerance=0.2),
+            [
+                "/ queries_per_request: 2.0 -> 3.0",
+                "total p50_ms: 1.0 -> 1.5",
+                "total requests_per_second: 100.0 -> 70.0",
+            ],
+        )
+        self.assertEqual(loadtest.regressions(baseline, baseline, tolerance=0.2), [])
+
+
+class ReplicaRouterTests(TransactionTestCase):
+    """Tests for routing read-only views to the SQLite stand-in replicas."""
+
+    databases = {"default", "replica_0", "replica_1"}
+
+    def setUp(self):
+        """Create a logged in user with every replica in the rotation."""
+        cache.clear()
+        replica_pool.reset()
+        self.addCleanup(replica_pool.reset)
+        self.user = User.objects.create_user("test-user", "test-user@dev-faq.com")
+        self.client.force_login(self.user)
+
+    def get_by_database(self, path: str) -> dict[str, int]:
+        """
+        Request a page and count the queries made on each database.
+
+        Args:
+            path: Path of the page
+
+        Returns:
+            Number of queries per database alias
+        """
+        with ExitStack() as stack:
+            captured = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in self.databases
+            }
+            response = self.client.get(path)
+        self.assertLess(response.status_code, 400)
+        return {alias: len(queries) for alias, queries in captured.items()}
+
+    def test_read_only_views_use_replicas(self):
+        """Test reads rotate over the replicas and other views use the primary."""
+        first = self.get_by_database("/user_cp")
+        second = self.get_by_database("/user_cp")
+        self.assertEqual(first["default"] + second["default"], 0)
+        self.assertGreater(first["replica_0"] + second["replica_0"], 0)
+        self.assertGreater(first["replica_1"] + second["replica_1"], 0)
+
+        queries = self.get_by_database("/create_site")
+        self.assertEqual(queries["replica_0"] + queries["replica_1"], 0)
+
+    def test_writers_pinned_to_primary(self):
+        """Test a request that wrote keeps the visitor on the primary."""
+        response = self.client.post(
+            "/register",
+            {
+                "username": "new-user",
+                "email": "new-user@dev-faq.com",
+                "password1": "a-Long-password-123",
+                "password2": "a-Long-password-123",
+            },
+            HTTP_ACCEPT="application/json",
+        )
+        cookie = response.cookies[routers.PRIMARY_COOKIE]
+        self.assertEqual(cookie["max-age"], settings.REPLICA_STICKY_SECONDS)
+        self.assertTrue(cookie["httponly"])
+
+        queries = self.get_by_database("/user_cp")
+        self.assertGreater(queries["default"], 0)
+        self.assertEqual(queries["replica_0"] + queries["replica_1"], 0)
+
+    def test_unhealthy_replicas_left_out(self):
+        """Test failing or lagging replicas leave the rotation until retried."""
+
+        def lag(alias: str) -> float:
+            if alias == "replica_0":
+                raise OperationalError("replica down")
+            return 0.0
+
+        with (
+            mock.patch.object(replica_pool, "lag", side_effect=lag),
+            self.assertLogs("website.routers", "WARNING") as logs,
+        ):
+            self.assertEqual({replica_pool.choose() for _ in range(4)}, {"replica_1"})
+        self.assertEqual(len(logs.records), 1)
+
+        replica_pool.reset()
+        with (
+            mock.patch.object(replica_pool, "lag", return_value=60.0),
+            self.assertLogs("website.routers", "WARNING"),
+        ):
+            self.assertIsNone(replica_pool.choose())
+            queries = self.get_by_database("/user_cp")
+        self.assertGreater(queries["default"], 0)
+        self.assertEqual(queries["replica_0"] + queries["replica_1"], 0)
+
+
+@override_settings(ALLOWED_HOSTS=[".dev-faq.com"])
+class ShardRouterTests(TransactionTestCase):
+    """Tests for tenant shards and moving tenants between them."""
+
+    databases = {"default", "shard_1", "replica_0", "replica_1"}
+
+    def setUp(self):
+        """Create a site on the default database and one on the SQLite shard."""
+        cache.clear()
+        site_registry.clear()
+        patcher = mock.patch.object(helpers, "ALLOWED_HOSTS", [".dev-faq.com"])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.python = Site.objects.create(subdomain="python", description="")
+        self.rust = Site.objects.create(
+            subdomain="rust", description="", shard="shard_1"
+        )
+        for number in range(3):
+            self.python.faq_entries.create(
+                question=f"What is decorator {number}?", answer="A wrapper."
+            )
+
+    def entries(self, alias: str, site: Site) -> list[tuple]:
+        """
+        Get the questions and answers of a site's entries on a database.
+
+        Args:
+            alias: Alias of the database
+            site: Site the entries belong to
+
+        Returns:
+            Sorted question and answer pairs
+        """
+        return sorted(
+            FAQEntry.objects.using(alias)
+            .filter(site_id=site.id)
+            .values_list("question", "answer")
+        )
+
+    def test_tenant_rows_on_shard(self):
+        """Test entries follow their site's shard and global rows stay on default."""
+        self.rust.faq_entries.create(question="Is Rust a decorator?", answer="No.")
+        FAQEntry.objects.create(site=self.rust, question="Borrowing?", answer="Yes.")
+        self.assertEqual(len(self.entries("shard_1", self.rust)), 2)
+        self.assertEqual(self.entries("default", self.rust), [])
+        self.assertEqual(len(self.entries("default", self.python)), 3)
+        self.assertFalse(Site.objects.using("shard_1").exists())
+
+        response = self.client.get(
+            "/search", {"q": "decorator"}, HTTP_HOST="rust.dev-faq.com"
+        )
+        self.assertContains(response, "Is Rust a decorator?")
+        self.assertEqual(len(search.search_faq(self.rust.id, "borrowing").entries), 1)
+
+        self.rust.delete()
+        self.assertFalse(FAQEntry.objects.using("shard_1").exists())
+
+    def test_move_tenant(self):
+        """Test a site's entries are moved and its pages read from the new shard."""
+        before = self.entries("default", self.python)
+        self.client.get("/search", {"q": "wrapper"}, HTTP_HOST="python.dev-faq.com")
+
+        out = StringIO()
+        call_command(
+            "move_tenant", "python", "shard_1", batch_size=2, grace=0, stdout=out
+        )
+        self.assertIn(
+            "Moved 3 entry(s) of python from default to shard_1", out.getvalue()
+        )
+        self.python.refresh_from_db()
+        self.assertEqual(self.python.shard, "shard_1")
+        self.assertEqual(self.entries("shard_1", self.python), before)
+        self.assertEqual(self.entries("default", self.python), [])
+
+        response = self.client.get(
+            "/search", {"q": "wrapper"}, HTTP_HOST="python.dev-faq.com"
+        )
+        self.assertContains(response, "What is decorator 2?")
+
+        with self.assertRaisesMessage(CommandError, "already on shard_1"):
+            call_command("move_tenant", "python", "shard_1", stdout=out)
+        with self.assertRaisesMessage(CommandError, "Unknown shard"):
+            call_command("move_tenant", "python", "shard_9", stdout=out)
+
+    def test_passes_copy_changes(self):
+        """Test each pass copies the inserts, updates and deletes since the last."""
+        move = TenantMove(self.python, "shard_1", batch_size=2)
+        self.assertEqual(move.sync(), 3)
+        self.assertEqual(move.sync(), 0)
+
+        first, second, _ = self.python.faq_entries.order_by("id")
+        first.answer = "A callable wrapper."
+        first.save()
+        second.delete()
+        self.python.faq_entries.create(question="What is a closure?", answer="A.")
+        self.assertEqual(move.sync(), 3)
+        self.assertEqual(
+            self.entries("shard_1", self.python), self.entries("default", self.python)
+        )
+
+    def test_writes_after_cut_over_moved(self):
+        """Test writes in the grace window and after the final pass are moved."""
+
+        def write(question: str):
+            FAQEntry.objects.using("default").create(
+                site_id=self.python.id, question=question, answer="Late."
+            )
+
+        finish = TenantMove.finish
+        passes = []
+
+        def straggling_finish(move):
+            moved = finish(move)
+            passes.append(moved)
+            # A write that was waiting on the lock the final pass held
+            if len(passes) == 1:
+                write("Written after the final pass?")
+            return moved
+
+        move = TenantMove(self.python, "shard_1", batch_size=2)
+        with (
+            mock.patch(
+                "website.sharding.time.sleep",
+                side_effect=lambda seconds: seconds == 5 and write("Late?"),
+            ),
+            mock.patch.object(TenantMove, "finish", straggling_finish),
+        ):
+            self.assertEqual(move.run(grace=5), 5)
+        self.assertEqual(passes, [4, 1])
+        self.assertEqual(self.entries("default", self.python), [])
+        questions = [question for question, _ in self.entries("shard_1", self.python)]
+        self.assertIn("Late?", questions)
+        self.assertIn("Written after the final pass?", questions)
+
+
+class SessionTests(TestCase):
+    """Tests for the cached session engine."""
+
+    def setUp(self):
+        """Log a user in with an empty extension batch."""
+        cache.clear()
+        patcher = mock.patch.object(
+            sessions.SessionStore, "extensions", sessions.ExpiryBatcher()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user("test-user", "test-user@dev-faq.com")
+        self.client.force_login(self.user)
+        self.session_key = self.client.session.session_key
+
+    def session_queries(self, path: str) -> list[str]:
+        """
+        Request a page and collect the queries made on the session table.
+
+        Args:
+            path: Path of the page
+
+        Returns:
+            SQL of the session queries
+        """
+        with CaptureQueriesContext(connections["default"]) as captured:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return [query["sql"] for query in captured if "django_session" in query["sql"]]
+
+    def test_unchanged_sessions_not_written(self):
+        """Test requests read the session from the cache and skip the write."""
+        self.assertEqual(self.session_queries("/user_cp"), [])
+        cache.clear()
+        queries = self.session_queries("/user_cp")
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0].startswith("SELECT"))
+
+        store = sessions.SessionStore(self.session_key)
+        store["theme"] = "dark"
+        with CaptureQueriesContext(connections["default"]) as captured:
+            store.save()
+        self.assertEqual(
+            [
+                query["sql"].split()[0]
+                for query in captured
+                if "django_session" in query["sql"]
+            ],
+            ["UPDATE"],
+        )
+        self.assertEqual(
+            sessions.SessionStore(self.session_key).load()["theme"], "dark"
+        )
+
+    def test_expiry_extended_in_batches(self):
+        """Test lagging expiry dates are queued and written together."""
+        age = timedelta(seconds=settings.SESSION_COOKIE_AGE)
+        Session.objects.update(expire_date=timezone.now() + age / 2)
+        cache.clear()
+
+        store = sessions.SessionStore(self.session_key)
+        with self.assertNumQueries(1):
+            store.load()
+            store.save()
+        self.assertEqual(store.extensions.pending(), 1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(store.extensions.flush(), 1)
+        expire_date = Session.objects.get().expire_date
+        self.assertGreater(expire_date, timezone.now() + age - timedelta(minutes=1))
+        self.assertIsNone(cache.get(sessions.KEY_PREFIX + self.session_key))
+
+    def test_extensions_flushed_after_max_delay(self):
+        """Test a waiting extension is written at the end of a later request."""
+        age = timedelta(seconds=settings.SESSION_COOKIE_AGE)
+        Session.objects.update(expire_date=timezone.now() + age / 2)
+        cache.clear()
+        store = sessions.SessionStore(self.session_key)
+        store.load()
+        store.save()
+
+        self.client.get("/")
+        self.assertEqual(store.extensions.pending(), 1)
+        store.extensions._oldest -= store.extensions.max_delay
+        self.client.get("/")
+        self.assertEqual(store.extensions.pending(), 0)
+        expire_date = Session.objects.get().expire_date
+        self.assertGreater(expire_date, timezone.now() + age - timedelta(minutes=1))
+
+    def test_short_sessions_extended(self):
+        """Test sessions shorter than the refresh interval are still extended."""
+        store = sessions.SessionStore(self.session_key)
+        store.set_expiry(3600)
+        store.save()
+
+        Session.objects.update(expire_date=timezone.now() + timedelta(minutes=40))
+        cache.clear()
+        store = sessions.SessionStore(self.session_key)
+        with self.assertNumQueries(1):
+            store.load()
+            store.save()
+        self.assertEqual(store.extensions.pending(), 0)
+
+        Session.objects.update(expire_date=timezone.now() + timedelta(minutes=20))
+        cache.clear()
+        store = sessions.SessionStore(self.session_key)
+        store.load()
+        store.save()
+        self.assertEqual(store.extensions.pending(), 0)
+        expire_date = Session.objects.get().expire_date
+        self.assertGreater(expire_date, timezone.now() + timedelta(minutes=59))
+
+    def test_purge_sessions(self):
+        """Test expired sessions are deleted in batches and live ones kept."""
+        past = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create(
+            Session(
+                session_key=f"expired-session-{number:03}",
+                session_data="",
+                expire_date=past,
+            )
+            for number in range(5)
+        )
+        out = StringIO()
+        call_command("purge_sessions", batch_size=2, stdout=out)
+        self.assertIn("Deleted 5 expired session(s)", out.getvalue())
+        self.assertEqual(
+            list(Session.objects.values_list("session_key", flat=True)),
+            [self.session_key],
+        )
+
+
+class UserContextTests(TestCase):
+    """Tests for the cached user, validation and site roles."""
+
+    def setUp(self):
+        """Create a member of two sites awaiting validation."""
+        cache.clear()
+        self.user = User.objects.create_user("member", "member@dev-faq.com")
+        self.token = Validation.create_for_user(self.user)
+        Site.objects.bulk_create(
+            Site(subdomain=subdomain, description="")
+            for subdomain in ("python", "rust")
+        )
+        helpers.user_add_permissions(self.user, "python", ["owner", "contributor"])
+        helpers.user_add_permissions(self.user, "rust", ["contributor"])
+
+    def test_loaded_in_one_query(self):
+        """Test a miss loads everything in one query and a hit makes none."""
+        with self.assertNumQueries(1):
+            user = user_contexts.get(self.user.id)
+        with self.assertNumQueries(0):
+            user = user_contexts.get(self.user.id)
+            self.assertEqual(user.username, "member")
+            self.assertFalse(user.validation.is_validated)
+            self.assertEqual(
+                get_site_roles(user, "python"), frozenset({"owner", "contributor"})
+            )
+            self.assertTrue(user.has_perm("website.rust_contributor"))
+            self.assertFalse(user.has_perm("website.rust_owner"))
+            self.assertEqual(get_site_roles(user, "php"), frozenset())
+        self.assertIsNone(user_contexts.get(0))
+
+    def test_changes_invalidate(self):
+        """Test validating, changing roles and deleting sites reload the context."""
+        user_contexts.get(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(Validation.validate_token(self.token))
+        self.assertTrue(user_contexts.get(self.user.id).validation.is_validated)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            helpers.user_remove_permissions(self.user, "python", ["owner"])
+        user = user_contexts.get(self.user.id)
+        self.assertEqual(get_site_roles(user, "python"), frozenset({"contributor"}))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Site.objects.filter(subdomain="rust").delete()
+        user = user_contexts.get(self.user.id)
+        self.assertEqual(get_site_roles(user, "rust"), frozenset())
+
+    def test_inactive_users_logged_out(self):
+        """Test sessions of deactivated users stop authenticating."""
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/user_cp").status_code, 200)
+        self.user.refresh_from_db()
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        response = self.client.get("/user_cp")
+        self.assertRedirects(response, "/accounts/login", fetch_redirect_response=False)
+
+    def test_password_not_cached(self):
+        """Test the password hash stays out of the cache and changes log out."""
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/user_cp").status_code, 200)
+        _, entry_key = user_contexts.keys(self.user.id)
+        _, context = cache.get(entry_key)
+        self.assertNotIn(self.user.password, context["user"])
+        self.assertEqual(
+            context["session_auth_hash"], self.user.get_session_auth_hash()
+        )
+        with self.assertNumQueries(0):
+            user = user_contexts.get(self.user.id)
+            self.assertEqual(
+                user.get_session_auth_hash(), self.user.get_session_auth_hash()
+            )
+        user.set_password("a-New-password-123")
+        self.assertNotEqual(
+            user.get_session_auth_hash(), self.user.get_session_auth_hash()
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        response = self.client.get("/user_cp")
+        self.assertRedirects(response, "/accounts/login", fetch_redirect_response=False)
+
+
+class ResponseTests(TestCase):
+    """Tests for the negotiated and htmx partial responses."""
+
+    def setUp(self):
+        """Start from an empty cache."""
+        cache.clear()
+        self.user_fields = {
+            "username": "new-user",
+            "email": "new-user@dev-faq.com",
+            "password1": "a-Long-password-123",
+            "password2": "a-Long-password-123",
+        }
+
+    def test_negotiated_once(self):
+        """Test the negotiation is parsed once and memoized on the request."""
+        request = RequestFactory().get(
+            "/", headers={"accept": "application/json", "HX-Request": "true"}
+        )
+        negotiation = responses.negotiate(request)
+        self.assertTrue(negotiation.json)
+        self.assertTrue(negotiation.partial)
+        self.assertIs(responses.negotiate(request), negotiation)
+
+        request = RequestFactory().get(
+            "/", headers={"accept": "*/*", "HX-Request": "true", "HX-Boosted": "true"}
+        )
+        self.assertFalse(responses.negotiate(request).json)
+        self.assertFalse(responses.negotiate(request).partial)
+
+    def test_htmx_gets_the_form_block(self):
+        """Test htmx requests get the form alone and plain requests the page."""
+        response = self.client.get("/register")
+        self.assertContains(response, "<html>")
+        self.assertIn("HX-Request", response["Vary"])
+
+        response = self.client.get("/register", headers={"HX-Request": "true"})
+        self.assertNotContains(response, "<html>")
+        self.assertContains(response, 'hx-post="/register"')
+        self.assertTrue(response.content.decode().strip().startswith("<form"))
+
+        response = self.client.post(
+            "/register",
+            {**self.user_fields, "email": "not-an-email"},
+            headers={"HX-Request": "true"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "<html>")
+        self.assertContains(response, "Enter a valid email address")
+
+        template = get_template("registration/register.html")
+        with self.assertRaises(TemplateSyntaxError):
+            responses.render_block(template, "missing")
+        stats = metrics.RequestStats()
+        token = metrics.current_stats.set(stats)
+        self.addCleanup(metrics.current_stats.reset, token)
+        self.assertIn("<form", responses.render_block(template, "form"))
+        self.assertGreater(stats.template_seconds, 0)
+
+    def test_valid_forms_redirect(self):
+        """Test valid forms redirect plain requests and tell htmx to redirect."""
+        response = self.client.post("/register", self.user_fields)
+        self.assertRedirects(response, "/user_cp", fetch_redirect_response=False)
+
+        self.client.logout()
+        response = self.client.post(
+            "/register",
+            {**self.user_fields, "username": "htmx", "email": "htmx@dev-faq.com"},
+            headers={"HX-Request": "true"},
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["HX-Redirect"], "/user_cp")
+        self.assertEqual(response.content, b"")
+
+
+class ProvisioningTests(TestCase):
+    """Tests for provisioning sites."""
+
+    def setUp(self):
+        """Create two owners and start from empty caches in a temporary MEDIA_ROOT."""
+        cache.clear()
+        site_registry.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = Path(media_root.name)
+        self.owners = [
+            User.objects.create_user(username=f"owner{number}") for number in range(2)
+        ]
+
+    def test_bulk_provisioning(self):
+        """Test many sites are written with three INSERTs and primed on commit."""
+        specs = [
+            provisioning.SiteSpec(
+                subdomain=f"site{number}",
+                description=f"Site {number}",
+                owner=self.owners[number % 2],
+                roles=("owner", "contributor"),
+            )
+            for number in range(5)
+        ]
+        with (
+            self.captureOnCommitCallbacks(execute=True),
+            CaptureQueriesContext(connections["default"]) as queries,
+        ):
+            provisioned = provisioning.provision_sites(specs)
+        statements = [
+            query["sql"].split()[0]
+            for query in queries.captured_queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertEqual(statements, ["INSERT", "INSERT", "INSERT"])
+
+        self.assertEqual(
+            [result.site.subdomain for result in provisioned],
+            [f"site{number}" for number in range(5)],
+        )
+        self.assertEqual(SiteMembership.objects.count(), 10)
+        self.assertEqual(
+            sorted(Job.objects.values_list("payload__site_id", flat=True)),
+            [result.site.id for result in provisioned],
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(site_registry.get("site3").description, "Site 3")
+        user = user_contexts.get(self.owners[1].id)
+        self.assertEqual(get_site_roles(user, "site3"), {"owner", "contributor"})
+
+    def test_failure_leaves_nothing(self):
+        """Test a taken subdomain rolls back every row and deletes the logos."""
+        Site.objects.create(subdomain="taken", description="")
+        specs = [
+            provisioning.SiteSpec(
+                subdomain="python",
+                description="Python",
+                owner=self.owners[0],
+                logo=make_logo(size=(10, 10)),
+            ),
+            provisioning.SiteSpec(
+                subdomain="taken", description="Taken", owner=self.owners[0]
+            ),
+        ]
+        with self.assertRaises(IntegrityError):
+            provisioning.provision_sites(specs)
+        self.assertEqual(Site.objects.count(), 1)
+        self.assertFalse(SiteMembership.objects.exists())
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(
+            [path for path in self.media_root.rglob("*") if path.is_file()], []
+        )
+
+        with self.assertRaises(ValidationError):
+            provisioning.provision_site("-bad", "Bad", self.owners[0])
@@ -0,0 +1,89 @@
+"""Upload handlers for the website."""
+
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from website.validators import MAX_UPLOAD_SIZE, UPLOAD_SIZE_ERROR
+
+# Room in a request for the form fields and multipart headers sent with a file
+REQUEST_OVERHEAD = 64 * 1024
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """
+    Abort an upload as soon as a file passes MAX_UPLOAD_SIZE.
+
+    It must be the first handler so that no later handler buffers or spools the
+    oversized file. The rest of the request body is drained without being
+    stored, so the connection stays open for the response. Fields sent before
+    the file are kept and the error is recorded on request.upload_errors so the
+    form can report it.
+    """
+
+    def __init__(self, request=None):
+        """
+        Initialise SizeLimitUploadHandler.
+
+        Args:
+            request: HttpRequest being uploaded
+        """
+        super().__init__(request)
+        self.received = 0
+
+    def new_file(self, field_name, *args, **kwargs):
+        """
+        Start counting a new file.
+
+        Requests too long to hold a file within the limit even after their
+        other fields are rejected at once, otherwise the file's own bytes are
+        counted against the limit.
+
+        Args:
+            field_name: Name of the file field
+            args: Positional arguments
+            kwargs: Keyword arguments
+        """
+        super().new_file(field_name, *args, **kwargs)
+        self.received = 0
+        if (
+            self.content_length
+            and self.content_length > MAX_UPLOAD_SIZE + REQUEST_OVERHEAD
+        ):
+            self.abort()
+
+    def receive_data_chunk(self, raw_data: bytes, start: int) -> bytes:
+        """
+        Count the bytes of the file, aborting once the limit is passed.
+
+        Args:
+            raw_data: Chunk of file data
+            start: Position of the chunk in the file
+
+        Returns:
+            The chunk for the next handler
+        """
+        self.received += len(raw_data)
+        if self.received > MAX_UPLOAD_SIZE:
+            self.abort()
+        return raw_data
+
+    def file_complete(self, file_size: int):
+        """
+        Leave building the file to the next handler.
+
+        Args:
+            file_size: Size of the completed file
+        """
+        return None
+
+    def abort(self):
+        """
+        Record the error for the current field and stop the upload.
+
+        Raises:
+            StopUpload: Always
+        """
+        if self.request is not None:
+            if not hasattr(self.request, "upload_errors"):
+                self.request.upload_errors = {}
+            self.request.upload_errors[self.field_name] = UPLOAD_SIZE_ERROR
+        raise StopUpload()
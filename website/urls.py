@@ -1,6 +1,7 @@
 """URL configuration for the network application."""
 
-from django.urls import include, path
+from django.conf import settings
+from django.urls import include, path, re_path
 
 from website import views
 
@@ -9,7 +10,36 @@ urlpatterns = [
     path("", views.index, name="index"),
     path("accounts/", include("django.contrib.auth.urls")),
     path("create_site", views.create_site, name="create_site"),
+    path("logo/<slug:subdomain>/<slug:variant>", views.logo_variant, name="logo"),
+    re_path(
+        r"^logos/(?P<logo_hash>[0-9a-f]{64})/(?P<filename>[a-z0-9-]+\.[a-z]+)$",
+        views.logo_derivative,
+        name="logo_derivative",
+    ),
+    re_path(
+        rf"^{settings.MEDIA_URL.strip('/')}/(?P<name>logos/.+)$",
+        views.logo_file,
+        name="logo_file",
+    ),
+    path("metrics", views.metrics, name="metrics"),
     path("register", views.register, name="register"),
+    path("search", views.faq_search, name="faq_search"),
+    re_path(
+        rf"^{settings.STATIC_URL.strip('/')}/(?P<path>.+)$",
+        views.static_asset,
+        name="static_asset",
+    ),
+    path(
+        "subdomain_available",
+        views.subdomain_availability,
+        name="subdomain_availability",
+    ),
     path("user_cp", views.user_cp, name="user_control_panel"),
+    path(
+        "user_cp/resend_validation",
+        views.resend_validation,
+        name="resend_validation",
+    ),
+    path("user_cp/sites", views.user_cp_sites, name="user_control_panel_sites"),
     path("validate", views.email_validation, name="email_validation"),
 ]
@@ -3,6 +3,15 @@
 from re import match
 
 from django.core.exceptions import ValidationError
+from PIL import Image, UnidentifiedImageError
+
+MAX_UPLOAD_SIZE_MB = 5
+MAX_UPLOAD_SIZE = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+UPLOAD_SIZE_ERROR = f"Upload exceeds the maximum file size of {MAX_UPLOAD_SIZE_MB}MB"
+
+IMAGE_FORMATS = ("GIF", "JPEG", "PNG", "WEBP")
+IMAGE_MAX_DIMENSION = 4096
+IMAGE_MAX_PIXELS = 4096 * 4096
 
 
 def file_size_validator(file_field):
@@ -16,9 +25,44 @@ def file_size_validator(file_field):
         ValidationError: On validation issue
     """
     file_size = file_field.file.size
-    limit_mb = 5
-    if file_size > limit_mb * 1024 * 1024:
-        raise ValidationError(f"Upload exceeds the maximum file size of {limit_mb}MB")
+    if file_size > MAX_UPLOAD_SIZE:
+        raise ValidationError(UPLOAD_SIZE_ERROR)
+
+
+def image_header_validator(file_field):
+    """
+    Validate the format and dimensions of an image from its header.
+
+    Only the header is read, so decompression bombs are rejected before any
+    pixel data is decoded.
+
+    Args:
+        file_field: File field to validate
+
+    Raises:
+        ValidationError: On validation issue
+    """
+    image_file = file_field.file
+    image_file.seek(0)
+    try:
+        with Image.open(image_file, formats=IMAGE_FORMATS) as img_h:
+            width, height = img_h.size
+    except (Image.DecompressionBombError, UnidentifiedImageError, OSError) as error:
+        raise ValidationError(
+            f"Images must be one of {', '.join(IMAGE_FORMATS)} "
+            f"and no larger than {IMAGE_MAX_DIMENSION}x{IMAGE_MAX_DIMENSION}"
+        ) from error
+    finally:
+        image_file.seek(0)
+
+    if (
+        width > IMAGE_MAX_DIMENSION
+        or height > IMAGE_MAX_DIMENSION
+        or width * height > IMAGE_MAX_PIXELS
+    ):
+        raise ValidationError(
+            f"Images must be no larger than {IMAGE_MAX_DIMENSION}x{IMAGE_MAX_DIMENSION}"
+        )
 
 
 def subdomain_validator(subdomain: str):
@@ -31,9 +75,10 @@ def subdomain_validator(subdomain: str):
     Raises:
         ValidationError: On validation issue
     """
-    regex = r"^[a-zA-Z][a-zA-Z0-9-]+[a-zA-Z0-9]$"
+    regex = r"^[a-z][a-z0-9-]+[a-z0-9]$"
     if not match(regex, subdomain):
         raise ValidationError(
-            "The requested subdomain is invalid, "
-            "it must start and end with a letter and only contain letters numbers and hyphens"
+            "The requested subdomain is invalid, it must start with a letter, end "
+            "with a letter or number and only contain lower case letters, numbers "
+            "and hyphens"
         )
@@ -1,29 +1,48 @@
 """Views for the website."""
 
-import random
-import string
+import mimetypes
 from pathlib import Path
-from typing import TypedDict
 
-from django.contrib.auth import login
-from django.contrib.auth.models import User
-from django.core.exceptions import ValidationError
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import alogin
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.storage import default_storage
+from django.db import IntegrityError
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotModified,
+    HttpResponseRedirect,
+)
 from django.shortcuts import redirect, render
 from django.template.loader import render_to_string
-
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
+from django.views.decorators.http import require_POST
+from django.views.static import was_modified_since
+
+from website.backends import auser_is_validated, user_is_validated
 from website.forms import CreateSite, CustomUserCreationForm
-from website.helpers import (
-    create_permissions,
-    get_host_details,
-    resize_image,
-    send_site_email,
-    user_add_permissions,
-)
+from website.helpers import asend_site_email, get_user_sites_page, send_site_email
+from website.logos import LOGO_VARIANTS, derivative_path, ensure_derivative
+from website.metrics import request_metrics
 from website.models import Site, Validation
+from website.pagecache import cache_tenant_page
+from website.provisioning import aprovision_site
+from website.registry import site_registry, subdomain_index
+from website.responses import form_response, negotiate, render_page
+from website.routers import read_from_replica
+from website.search import search_faq
+from website.sendfile import send_file
 
 
-def create_site(request) -> HttpResponse | JsonResponse:
+async def create_site(request) -> HttpResponse:
     """
     Handle the creation site functionality.
 
@@ -33,45 +52,49 @@ def create_site(request) -> HttpResponse | JsonResponse:
     Return:
         HttpResponse for creating a site
     """
-    if not request.user.is_authenticated:
+    user = await request.auser()
+    if not user.is_authenticated:
         return redirect("/accounts/login")
-    elif not request.user.validation.is_validated:
+    elif not await auser_is_validated(user):
         return redirect("/user_cp")
 
     if request.method == "POST":
-        create_site_form = CreateSite(request.POST, request.FILES, user=request.user)
-        valid, response = process_form(
-            form=create_site_form, request=request, redirect_url="/user_cp"
+        create_site_form = CreateSite(
+            request.POST,
+            request.FILES,
+            user=user,
+            upload_errors=getattr(request, "upload_errors", {}),
         )
+        # Cleaning checks the subdomain against the database and reads the logo
+        valid = await sync_to_async(create_site_form.is_valid)()
         if valid:
-            create_permissions(create_site_form.cleaned_data["subdomain"])
-            user_add_permissions(
-                user=request.user,
-                subdomain=create_site_form.cleaned_data["subdomain"],
-                permissions=["owner"],
-            )
-            site = Site.objects.get(
-                subdomain=create_site_form.cleaned_data["subdomain"]
-            )
-            resized_logo = resize_image(
-                image=Path(site.logo.name),
-                new_name=f"{create_site_form.cleaned_data['subdomain']}.png",
-                max_width=500,
-                max_height=400,
-            )
-            site.logo.name = str(resized_logo)
-            site.save()
-        if response:
-            return response
-    else:
-        create_site_form = CreateSite()
-    context = {"FORM": create_site_form}
-    return render(
-        request=request, template_name="website/create_site.html", context=context
-    )
+            try:
+                await aprovision_site(
+                    subdomain=create_site_form.cleaned_data["subdomain"],
+                    description=create_site_form.cleaned_data["description"],
+                    owner=user,
+                    logo=create_site_form.cleaned_data.get("logo"),
+                )
+            except IntegrityError:
+                # Taken by another request since the form checked the registry
+                create_site_form.add_error(
+                    "subdomain", ValidationError("The subdomain already exists")
+                )
+                valid = False
+        return form_response(
+            form=create_site_form,
+            request=request,
+            redirect_url="/user_cp",
+            valid=valid,
+            template_name="website/create_site.html",
+            context={"FORM": create_site_form, "user": user},
+        )
+
+    context = {"FORM": CreateSite(), "user": user}
+    return render_page(request, "website/create_site.html", context)
 
 
-def email_validation(request) -> HttpResponse:
+async def email_validation(request) -> HttpResponse:
     """
     Handle the email validation process.
 
@@ -81,7 +104,7 @@ def email_validation(request) -> HttpResponse:
     Return:
         HttpResponse for the registration page
     """
-    token = request.GET["token"]
+    token = request.GET.get("token")
     if not token:
         context = {
             "ERROR": "The URL is invalid. No token.",
@@ -90,24 +113,51 @@ def email_validation(request) -> HttpResponse:
             request=request, template_name="registration/error.html", context=context
         )
 
-    try:
-        user: User = User.objects.get(validation__random_validation_string=token)
-    except User.DoesNotExist:
+    if not await Validation.avalidate_token(token):
         context = {
-            "ERROR": "Invalid token",
+            "ERROR": "Invalid or expired token",
         }
         return render(
             request=request, template_name="registration/error.html", context=context
         )
 
-    user.validation.random_validation_string = None
-    user.validation.is_validated = True
-    user.validation.save()
-
     return redirect("/user_cp")
 
 
-def index(request) -> HttpResponse:
+@cache_tenant_page
+@read_from_replica
+def faq_search(request) -> HttpResponse:
+    """
+    Handle searching the FAQ of the site the subdomain belongs to.
+
+    Args:
+        request: HttpRequest object
+
+    Return:
+        HttpResponse with a page of ranked results
+    """
+    if request.site is None:
+        raise Http404("Unknown site")
+
+    query = request.GET.get("q", "").strip()
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        page = 1
+    context = {
+        "QUERY": query,
+        "RESULTS": (
+            search_faq(site_id=request.site.id, query=query, page=page)
+            if query
+            else None
+        ),
+    }
+    return render(request=request, template_name="website/search.html", context=context)
+
+
+@cache_tenant_page
+@read_from_replica
+async def index(request) -> HttpResponse:
     """
     Handle the Index page.
 
@@ -117,95 +167,121 @@ def index(request) -> HttpResponse:
     Return:
         HttpResponse for the index page
     """
-    context = {"SUBDOMAIN": get_host_details(request=request).subdomain}
+    context = {
+        "SUBDOMAIN": request.host_details.subdomain,
+        "user": await request.auser(),
+    }
     return render(request, "website/index.html", context=context)
 
 
-def process_form(
-    form, request, redirect_url: str
-) -> tuple[bool, HttpResponse | JsonResponse | HttpResponseRedirect]:
+def logo_variant(request, subdomain: str, variant: str) -> HttpResponseRedirect:
     """
-    Process a form to identify errors and identify output required.
+    Redirect to a logo variant, rendering it the first time it is requested.
 
     Args:
-        form: Form to be processed
-        request: Request that has the form data
-        redirect_url: URL to redirect too on success
+        request: HttpRequest object
+        subdomain: Subdomain of the site the logo belongs to
+        variant: Name of the variant in LOGO_VARIANTS
 
-    Returns:
-        Response to be provided to the user based on the result of validation
+    Return:
+        Redirect to the content addressed derivative or the placeholder
     """
-    response: HttpResponse | JsonResponse | HttpResponseRedirect = HttpResponse(
-        "Invalid request"
+    site = site_registry.get(subdomain)
+    if site is None or variant not in LOGO_VARIANTS:
+        raise Http404("Unknown logo")
+    if not site.logo or not site.logo_processed or not site.logo_hash:
+        return redirect(site.logo_url)
+
+    logo_variant = LOGO_VARIANTS[variant]
+    ensure_derivative(
+        Path(default_storage.path(site.logo)), site.logo_hash, logo_variant
+    )
+    return redirect(
+        "network:logo_derivative",
+        logo_hash=site.logo_hash,
+        filename=logo_variant.filename,
     )
-    if form.is_valid():
-        form.save()
-        for accepted_type in request.accepted_types:
-            if "application/json" == str(accepted_type):
-                response = process_json_success(redirect_url=redirect_url)
-                break
-        if not response:
-            response = redirect(redirect_url)
-    else:
-        for accepted_type in request.accepted_types:
-            if "application/json" == str(accepted_type):
-                response = process_json_failure(form.errors.as_data())
-                break
 
-    return bool(form.is_valid()), response
 
+def logo_derivative(request, logo_hash: str, filename: str) -> HttpResponse:
+    """
+    Serve a content addressed logo derivative.
 
-class JSONFailureResponse(TypedDict):
-    """Typed dict to hold JSON failures."""
+    The URL changes whenever the original logo or the variant changes, so the
+    response can be cached forever.
 
-    result: str
-    errors: dict[str, list[str]]
+    Args:
+        request: HttpRequest object
+        logo_hash: SHA-256 digest of the original logo
+        filename: Filename of the variant
+
+    Return:
+        HttpResponse for the derivative
+    """
+    variant = next(
+        (variant for variant in LOGO_VARIANTS.values() if variant.filename == filename),
+        None,
+    )
+    if variant is None:
+        raise Http404("Unknown logo")
+    path = derivative_path(logo_hash, variant)
+    if not path.is_file():
+        raise Http404("Unknown logo")
+    return send_file(
+        request,
+        path,
+        cache_control="public, max-age=31536000, immutable",
+        content_type=f"image/{variant.extension}",
+    )
 
 
-def process_json_failure(form_errors: dict[str, list[ValidationError]]) -> JsonResponse:
+def logo_file(request, name: str) -> HttpResponse:
     """
-    Process errors in a form.
+    Serve an uploaded logo from the media storage.
 
     Args:
-        form_errors: List of dictionary
+        request: HttpRequest object
+        name: Stored name of the logo
 
-    Returns:
-        JsonResponse: Json response containing the result.
+    Return:
+        HttpResponse for the logo, or 304 if the client's copy is current
     """
-    json_response: JSONFailureResponse = {
-        "result": "failed",
-        "errors": {},
-    }
-
-    for field, errors in form_errors.items():
-        if field == "__all__":
-            field = "non_field"
-        error_list: list[str] = []
-        for error in errors:
-            error_list.append(str(error.message))
-        json_response["errors"][field] = error_list
-    return JsonResponse(json_response)
+    try:
+        path = Path(safe_join(settings.MEDIA_ROOT, name))
+    except SuspiciousFileOperation:
+        raise Http404("Unknown logo")
+    if not path.is_file():
+        raise Http404("Unknown logo")
+    return send_file(request, path)
 
 
-def process_json_success(redirect_url: str) -> JsonResponse:
+def metrics(request) -> HttpResponse:
     """
-    Process successful form.
+    Expose the request metrics of this worker in the Prometheus text format.
+
+    Without METRICS_TOKEN the endpoint is only served while DEBUG is on.
 
     Args:
-        redirect_url: URL the user should be redirected too
+        request: HttpRequest object
 
-    Returns:
-        JsonResponse: Json response containing the result.
+    Return:
+        HttpResponse with the exposition
     """
-    json_response = {
-        "result": "success",
-        "redirect": True,
-        "redirect_url": redirect_url,
-    }
-    return JsonResponse(json_response)
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            raise Http404()
+    elif not constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        request_metrics.expose(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
 
 
-def register(request) -> HttpResponse:
+async def register(request) -> HttpResponse:
     """
     Handle the registration process.
 
@@ -215,52 +291,226 @@ def register(request) -> HttpResponse:
     Return:
         HttpResponse for the registration page
     """
-    context: dict[str, CustomUserCreationForm | str] = {}
     if request.method == "POST":
         form = CustomUserCreationForm(request.POST)
-        valid, response = process_form(
-            form=form, request=request, redirect_url="/user_cp"
-        )
+        valid = await sync_to_async(form.is_valid)()
         if valid:
-            user = form.save()
-            login(request, user)
-            validation_string = "".join(
-                random.SystemRandom().choice(string.ascii_uppercase + string.digits)
-                for _ in range(64)
-            )
-            user_validation = Validation(
-                user=user, random_validation_string=validation_string
-            )
-            user_validation.save()
-
-            host_details = get_host_details(request=request)
-
-            subject: str = "Thank you for registering with devfaq"
-            validate_url = f"{host_details.full_url}/validate?token={validation_string}"
-            context = {
-                "SITE_NAME": host_details.hostname,
-                "VALIDATE_URL": validate_url,
-            }
-            message: str = render_to_string(
-                template_name="email/registration.txt",
-                context=context,
-            )
-            send_site_email(
-                sender="no-reply@devfaq.com",
-                recipient=user.email,
-                subject=subject,
-                message=message,
+            # Hashing the password is CPU bound, keep it off the event loop
+            user = await sync_to_async(form.save, thread_sensitive=False)(commit=False)
+            await user.asave()
+            await alogin(request, user)
+            await asend_validation_email(
+                request=request,
+                user=user,
+                token=await Validation.acreate_for_user(user),
+                subject="Thank you for registering with devfaq",
             )
-        return response
+        return form_response(
+            form=form,
+            request=request,
+            redirect_url="/user_cp",
+            valid=valid,
+            template_name="registration/register.html",
+            context={"FORM": form, "user": await request.auser()},
+        )
+
+    context = {"FORM": CustomUserCreationForm(), "user": await request.auser()}
+    return render_page(request, "registration/register.html", context)
+
+
+@require_POST
+def resend_validation(request) -> HttpResponse:
+    """
+    Handle requests to email a new validation link to the user.
+
+    Args:
+        request: HttpRequest object
+
+    Return:
+        HttpResponse with the validation status for htmx, otherwise a redirect
+        to the user control panel
+    """
+    if not request.user.is_authenticated:
+        return redirect("/accounts/login")
+    if user_is_validated(request.user):
+        return redirect("/user_cp")
+
+    token = Validation.reissue_token(request.user)
+    if token is None:
+        message = "A validation link was sent recently, please check your email"
     else:
-        form = CustomUserCreationForm()
+        send_validation_email(
+            request=request,
+            user=request.user,
+            token=token,
+            subject="Validate your devfaq account",
+        )
+        message = "A new validation link has been sent to your email address"
+    if not negotiate(request).htmx:
+        return redirect("/user_cp")
+    return render(
+        request=request,
+        template_name="website/partials/validation_status.html",
+        context={"MESSAGE": message},
+    )
+
+
+def validation_message(request, token: str) -> str:
+    """
+    Render the email holding a user's validation link.
+
+    Args:
+        request: HttpRequest object
+        token: Validation token to send
+
+    Returns:
+        Body of the email
+    """
+    host_details = request.host_details
+    context = {
+        "SITE_NAME": host_details.hostname,
+        "VALIDATE_URL": f"{host_details.full_url}/validate?token={token}",
+    }
+    return render_to_string(template_name="email/registration.txt", context=context)
+
+
+def send_validation_email(request, user, token: str, subject: str):
+    """
+    Queue the email holding a user's validation link.
+
+    Args:
+        request: HttpRequest object
+        user: User to validate
+        token: Validation token to send
+        subject: Subject for the email
+    """
+    send_site_email(
+        sender="no-reply@devfaq.com",
+        recipient=user.email,
+        subject=subject,
+        message=validation_message(request, token),
+    )
+
+
+async def asend_validation_email(request, user, token: str, subject: str):
+    """
+    Queue the email holding a user's validation link from an async view.
+
+    Args:
+        request: HttpRequest object
+        user: User to validate
+        token: Validation token to send
+        subject: Subject for the email
+    """
+    await asend_site_email(
+        sender="no-reply@devfaq.com",
+        recipient=user.email,
+        subject=subject,
+        message=validation_message(request, token),
+    )
+
+
+def static_asset(request, path: str) -> HttpResponse:
+    """
+    Serve a collected static asset.
+
+    Hashed names are cached forever, other names are revalidated against their
+    modification time. The gzip sibling written by collectstatic is sent to
+    clients that accept gzip.
+
+    Args:
+        request: HttpRequest object
+        path: Path of the asset relative to STATIC_ROOT
+
+    Return:
+        FileResponse for the asset, or 304 if the client's copy is current
+    """
+    try:
+        asset_path = Path(safe_join(settings.STATIC_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404("Unknown asset")
+    if path.endswith(".gz") or not asset_path.is_file():
+        raise Http404("Unknown asset")
+
+    immutable = staticfiles_storage.is_hashed(path)
+    modified = asset_path.stat().st_mtime
+    if not immutable and not was_modified_since(
+        request.META.get("HTTP_IF_MODIFIED_SINCE"), modified
+    ):
+        return HttpResponseNotModified()
+
+    content_type = mimetypes.guess_type(asset_path.name)[0]
+    compressed_path = asset_path.with_name(f"{asset_path.name}.gz")
+    send_compressed = compressed_path.is_file() and accepts_gzip(request)
+    response = FileResponse(
+        open(compressed_path if send_compressed else asset_path, "rb"),
+        content_type=content_type or "application/octet-stream",
+    )
+    if send_compressed:
+        response.headers["Content-Encoding"] = "gzip"
+    if compressed_path.is_file():
+        patch_vary_headers(response, ["Accept-Encoding"])
+    if immutable:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        response.headers["Cache-Control"] = "public, no-cache"
+        response.headers["Last-Modified"] = http_date(modified)
+    return response
+
+
+def accepts_gzip(request) -> bool:
+    """
+    Check whether the client accepts gzip encoded responses.
 
-    context["FORM"] = form
+    Args:
+        request: HttpRequest object
+
+    Returns:
+        True if gzip, or any encoding, is accepted with a non zero quality
+    """
+    for coding in request.headers.get("Accept-Encoding", "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() not in ("gzip", "*"):
+            continue
+        quality = params.strip().removeprefix("q=")
+        try:
+            return not params or float(quality) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def subdomain_availability(request) -> HttpResponse:
+    """
+    Handle the htmx requests checking a subdomain while it is typed.
+
+    Args:
+        request: HttpRequest object
+
+    Return:
+        HttpResponse with the availability of the subdomain
+    """
+    subdomain = request.GET.get("subdomain", "")
+    context: dict[str, str | list[str]] = {"SUBDOMAIN": subdomain}
+    try:
+        # Cleaned like the form does, by its field and then the model's
+        subdomain = CreateSite.base_fields["subdomain"].clean(subdomain)
+        Site._meta.get_field("subdomain").run_validators(subdomain)
+    except ValidationError as error:
+        context["ERROR"] = error.messages[0]
+    else:
+        context["SUBDOMAIN"] = subdomain
+        if subdomain_index.is_taken(subdomain):
+            context["ERROR"] = "The subdomain already exists"
+            context["SUGGESTIONS"] = subdomain_index.suggest(subdomain)
     return render(
-        request=request, template_name="registration/register.html", context=context
+        request=request,
+        template_name="website/partials/subdomain_availability.html",
+        context=context,
     )
 
 
+@read_from_replica
 def user_cp(request) -> HttpResponse:
     """
     Handle the user control panel.
@@ -274,7 +524,39 @@ def user_cp(request) -> HttpResponse:
     if not request.user.is_authenticated:
         return redirect("/accounts/login")
 
-    sites = Site.objects.all()
-    for site in sites:
-        print(site.logo)
-    return render(request=request, template_name="website/user_cp.html")
+    sites, next_after = get_user_sites_page(user=request.user)
+    context = {
+        "SITES": sites,
+        "NEXT_AFTER": next_after,
+        "VALIDATED": user_is_validated(request.user),
+    }
+    return render(
+        request=request, template_name="website/user_cp.html", context=context
+    )
+
+
+@read_from_replica
+def user_cp_sites(request) -> HttpResponse:
+    """
+    Handle the htmx requests for further pages of the user's sites.
+
+    Args:
+        request: HttpRequest object
+
+    Return:
+        HttpResponse with the rows for the next page
+    """
+    if not request.user.is_authenticated:
+        return HttpResponse(status=403)
+
+    try:
+        after = int(request.GET.get("after", 0))
+    except ValueError:
+        after = 0
+    sites, next_after = get_user_sites_page(user=request.user, after=after)
+    context = {"SITES": sites, "NEXT_AFTER": next_after}
+    return render(
+        request=request,
+        template_name="website/partials/site_rows.html",
+        context=context,
+    )